@@ -0,0 +1,99 @@
+"""dictionary-encode metric series, integer keys for points and events
+
+Revision ID: 3f1a9c0d7b2e
+Revises: 5ce7cfbc322e
+Create Date: 2026-10-17 18:41:09.552316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1a9c0d7b2e'
+down_revision: Union[str, Sequence[str], None] = '5ce7cfbc322e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('metric_series',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('incident_id', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['incident_id'], ['incidents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('incident_id', 'name', name='uq_metric_series')
+    )
+    op.execute(
+        "INSERT INTO metric_series (incident_id, name) "
+        "SELECT DISTINCT incident_id, metric_name FROM metric_points ORDER BY 1, 2"
+    )
+
+    # rebuild metric_points rather than altering it in place: every row changes
+    op.drop_index('ix_metric_incident_ingest_version', table_name='metric_points')
+    op.drop_index('ix_metric_incident_name_ts', table_name='metric_points')
+    op.drop_index('ix_metric_incident_ts', table_name='metric_points')
+    op.rename_table('metric_points', 'metric_points_old')
+    op.execute("ALTER TABLE metric_points_old RENAME CONSTRAINT metric_points_pkey TO metric_points_old_pkey")
+    op.create_table('metric_points',
+    sa.Column('series_id', sa.BigInteger(), nullable=False),
+    sa.Column('ingest_version', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    )
+    # nothing enforced uniqueness on the old table, so keep one row per
+    # (series, ts): the first ingested
+    op.execute(
+        "INSERT INTO metric_points (series_id, ingest_version, ts, value) "
+        "SELECT DISTINCT ON (s.id, p.ts) s.id, p.ingest_version, p.ts, p.value "
+        "FROM metric_points_old p "
+        "JOIN metric_series s ON s.incident_id = p.incident_id AND s.name = p.metric_name "
+        "ORDER BY s.id, p.ts, p.ingest_version"
+    )
+    op.drop_table('metric_points_old')
+    # keys and indexes after the bulk load, built once instead of row by row
+    op.create_primary_key('metric_points_pkey', 'metric_points', ['series_id', 'ts'])
+    op.create_foreign_key(None, 'metric_points', 'metric_series', ['series_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_metric_series_ingest_version', 'metric_points', ['series_id', 'ingest_version'], unique=False)
+
+    # events: bigint identity instead of a uuid string
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.drop_column('events', 'id')
+    op.execute("ALTER TABLE events ADD COLUMN id BIGSERIAL PRIMARY KEY")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.drop_column('events', 'id')
+    op.add_column('events', sa.Column('id', sa.String(), server_default=sa.text('gen_random_uuid()::text'), nullable=False))
+    op.alter_column('events', 'id', server_default=None)
+    op.create_primary_key('events_pkey', 'events', ['id'])
+
+    op.drop_index('ix_metric_series_ingest_version', table_name='metric_points')
+    op.rename_table('metric_points', 'metric_points_new')
+    op.execute("ALTER TABLE metric_points_new RENAME CONSTRAINT metric_points_pkey TO metric_points_new_pkey")
+    op.create_table('metric_points',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('incident_id', sa.String(), nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('metric_name', sa.String(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.Column('ingest_version', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['incident_id'], ['incidents.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        "INSERT INTO metric_points (id, incident_id, ts, metric_name, value, ingest_version) "
+        "SELECT gen_random_uuid()::text, s.incident_id, p.ts, s.name, p.value, p.ingest_version "
+        "FROM metric_points_new p JOIN metric_series s ON s.id = p.series_id"
+    )
+    op.drop_table('metric_points_new')
+    op.drop_table('metric_series')
+    op.create_index('ix_metric_incident_ts', 'metric_points', ['incident_id', 'ts'], unique=False)
+    op.create_index('ix_metric_incident_name_ts', 'metric_points', ['incident_id', 'metric_name', 'ts'], unique=False)
+    op.create_index('ix_metric_incident_ingest_version', 'metric_points', ['incident_id', 'ingest_version'], unique=False)
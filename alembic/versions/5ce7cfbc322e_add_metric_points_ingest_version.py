@@ -0,0 +1,30 @@
+"""add metric_points ingest_version
+
+Revision ID: 5ce7cfbc322e
+Revises: eb6c236bfaae
+Create Date: 2026-10-17 16:02:47.118940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5ce7cfbc322e'
+down_revision: Union[str, Sequence[str], None] = 'eb6c236bfaae'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('metric_points', sa.Column('ingest_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_metric_incident_ingest_version', 'metric_points', ['incident_id', 'ingest_version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_metric_incident_ingest_version', table_name='metric_points')
+    op.drop_column('metric_points', 'ingest_version')
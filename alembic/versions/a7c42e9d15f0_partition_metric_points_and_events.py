@@ -0,0 +1,150 @@
+"""partition metric_points and events by month on ts
+
+Revision ID: a7c42e9d15f0
+Revises: 3f1a9c0d7b2e
+Create Date: 2026-10-17 20:12:36.804127
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c42e9d15f0'
+down_revision: Union[str, Sequence[str], None] = '3f1a9c0d7b2e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _months(bind, table: str) -> list[datetime]:
+    # every month holding rows of `table`, plus this month and the next
+    # (same naming/bounds as app/partitions.py, which takes over from here)
+    lo, hi = bind.execute(sa.text(f"SELECT min(ts), max(ts) FROM {table}")).one()
+    now = datetime.utcnow()
+    lo = min(lo or now, now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    hi = max(hi or now, now + timedelta(days=32))
+    out = []
+    while lo <= hi:
+        out.append(lo)
+        lo = (lo + timedelta(days=32)).replace(day=1)
+    return out
+
+
+def _create_partitions(table: str, months: list[datetime]) -> None:
+    for start in months:
+        end = (start + timedelta(days=32)).replace(day=1)
+        op.execute(
+            f"CREATE TABLE {table}_{start:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    op.add_column('incidents', sa.Column('first_ts', sa.DateTime(), nullable=True))
+    op.add_column('incidents', sa.Column('last_ts', sa.DateTime(), nullable=True))
+    op.execute(
+        "UPDATE incidents i SET first_ts = r.lo, last_ts = r.hi FROM ("
+        "  SELECT incident_id, min(ts) AS lo, max(ts) AS hi FROM ("
+        "    SELECT s.incident_id, p.ts FROM metric_points p JOIN metric_series s ON s.id = p.series_id"
+        "    UNION ALL SELECT incident_id, ts FROM events"
+        "  ) t GROUP BY incident_id"
+        ") r WHERE r.incident_id = i.id"
+    )
+
+    # metric_points: same columns, rebuilt as a partitioned table
+    months = _months(bind, 'metric_points')
+    op.drop_index('ix_metric_series_ingest_version', table_name='metric_points')
+    op.rename_table('metric_points', 'metric_points_old')
+    op.execute("ALTER TABLE metric_points_old RENAME CONSTRAINT metric_points_pkey TO metric_points_old_pkey")
+    op.create_table('metric_points',
+    sa.Column('series_id', sa.BigInteger(), nullable=False),
+    sa.Column('ingest_version', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    postgresql_partition_by='RANGE (ts)'
+    )
+    _create_partitions('metric_points', months)
+    op.execute(
+        "INSERT INTO metric_points (series_id, ingest_version, ts, value) "
+        "SELECT series_id, ingest_version, ts, value FROM metric_points_old"
+    )
+    op.drop_table('metric_points_old')
+    op.create_primary_key('metric_points_pkey', 'metric_points', ['series_id', 'ts'])
+    op.create_foreign_key(None, 'metric_points', 'metric_series', ['series_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_metric_series_ingest_version', 'metric_points', ['series_id', 'ingest_version'], unique=False)
+
+    # events: the primary key has to include ts, the partition key
+    months = _months(bind, 'events')
+    op.drop_index('ix_event_incident_ts', table_name='events')
+    op.rename_table('events', 'events_old')
+    op.execute("ALTER TABLE events_old RENAME CONSTRAINT events_pkey TO events_old_pkey")
+    op.execute("ALTER SEQUENCE events_id_seq RENAME TO events_old_id_seq")
+    op.execute(
+        "CREATE TABLE events ("
+        "  id BIGSERIAL NOT NULL,"
+        "  incident_id VARCHAR NOT NULL REFERENCES incidents (id),"
+        "  ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,"
+        "  event_type VARCHAR NOT NULL,"
+        "  metadata JSON"
+        ") PARTITION BY RANGE (ts)"
+    )
+    _create_partitions('events', months)
+    op.execute(
+        "INSERT INTO events (id, incident_id, ts, event_type, metadata) "
+        "SELECT id, incident_id, ts, event_type, metadata FROM events_old"
+    )
+    op.execute("SELECT setval('events_id_seq', max(id)) FROM events HAVING max(id) IS NOT NULL")
+    op.drop_table('events_old')
+    op.create_primary_key('events_pkey', 'events', ['id', 'ts'])
+    op.create_index('ix_event_incident_ts', 'events', ['incident_id', 'ts'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_event_incident_ts', table_name='events')
+    op.rename_table('events', 'events_part')
+    op.execute("ALTER TABLE events_part RENAME CONSTRAINT events_pkey TO events_part_pkey")
+    op.execute("ALTER SEQUENCE events_id_seq RENAME TO events_part_id_seq")
+    op.execute(
+        "CREATE TABLE events ("
+        "  id BIGSERIAL PRIMARY KEY,"
+        "  incident_id VARCHAR NOT NULL REFERENCES incidents (id),"
+        "  ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,"
+        "  event_type VARCHAR NOT NULL,"
+        "  metadata JSON"
+        ")"
+    )
+    op.execute(
+        "INSERT INTO events (id, incident_id, ts, event_type, metadata) "
+        "SELECT id, incident_id, ts, event_type, metadata FROM events_part"
+    )
+    op.execute("SELECT setval('events_id_seq', max(id)) FROM events HAVING max(id) IS NOT NULL")
+    op.drop_table('events_part')  # and its partitions
+    op.create_index('ix_event_incident_ts', 'events', ['incident_id', 'ts'], unique=False)
+
+    op.drop_index('ix_metric_series_ingest_version', table_name='metric_points')
+    op.rename_table('metric_points', 'metric_points_part')
+    op.execute("ALTER TABLE metric_points_part RENAME CONSTRAINT metric_points_pkey TO metric_points_part_pkey")
+    op.create_table('metric_points',
+    sa.Column('series_id', sa.BigInteger(), nullable=False),
+    sa.Column('ingest_version', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    )
+    op.execute(
+        "INSERT INTO metric_points (series_id, ingest_version, ts, value) "
+        "SELECT series_id, ingest_version, ts, value FROM metric_points_part"
+    )
+    op.drop_table('metric_points_part')
+    op.create_primary_key('metric_points_pkey', 'metric_points', ['series_id', 'ts'])
+    op.create_foreign_key(None, 'metric_points', 'metric_series', ['series_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_metric_series_ingest_version', 'metric_points', ['series_id', 'ingest_version'], unique=False)
+
+    op.drop_column('incidents', 'last_ts')
+    op.drop_column('incidents', 'first_ts')
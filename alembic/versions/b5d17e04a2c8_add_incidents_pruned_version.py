@@ -0,0 +1,28 @@
+"""add incidents.pruned_version
+
+Revision ID: b5d17e04a2c8
+Revises: f3a8d2c61b94
+Create Date: 2026-10-18 10:12:37.204915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d17e04a2c8'
+down_revision: Union[str, Sequence[str], None] = 'f3a8d2c61b94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('incidents', sa.Column('pruned_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('incidents', 'pruned_version')
@@ -0,0 +1,62 @@
+"""covering keys for the analysis reads, drop redundant indexes
+
+Revision ID: c81d3b6f20a4
+Revises: a7c42e9d15f0
+Create Date: 2026-10-17 21:05:52.370418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81d3b6f20a4'
+down_revision: Union[str, Sequence[str], None] = 'a7c42e9d15f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # points: the key carries value, so the analysis read is index-only
+    op.drop_constraint('metric_points_pkey', 'metric_points', type_='primary')
+    op.execute(
+        "ALTER TABLE metric_points ADD CONSTRAINT metric_points_pkey "
+        "PRIMARY KEY (series_id, ts) INCLUDE (value)"
+    )
+
+    # series: name -> id without a heap fetch
+    op.drop_constraint('uq_metric_series', 'metric_series', type_='unique')
+    op.execute(
+        "ALTER TABLE metric_series ADD CONSTRAINT uq_metric_series "
+        "UNIQUE (incident_id, name) INCLUDE (id)"
+    )
+
+    # events: the dedupe key ON CONFLICT (incident_id, ts, event_type) relies
+    # on was declared by the models but never created here; it becomes the
+    # primary key, which also covers ix_event_incident_ts, and nothing looks
+    # events up by id. Duplicates that got in without it are dropped first
+    # (keeping the oldest).
+    op.execute(
+        "DELETE FROM events a USING events b "
+        "WHERE a.incident_id = b.incident_id AND a.ts = b.ts "
+        "AND a.event_type = b.event_type AND a.id > b.id"
+    )
+    op.drop_index('ix_event_incident_ts', table_name='events')
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.create_primary_key('events_pkey', 'events', ['incident_id', 'ts', 'event_type'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('events_pkey', 'events', type_='primary')
+    op.create_primary_key('events_pkey', 'events', ['id', 'ts'])
+    op.create_index('ix_event_incident_ts', 'events', ['incident_id', 'ts'], unique=False)
+
+    op.drop_constraint('uq_metric_series', 'metric_series', type_='unique')
+    op.create_unique_constraint('uq_metric_series', 'metric_series', ['incident_id', 'name'])
+
+    op.drop_constraint('metric_points_pkey', 'metric_points', type_='primary')
+    op.create_primary_key('metric_points_pkey', 'metric_points', ['series_id', 'ts'])
@@ -0,0 +1,37 @@
+"""add incident data_version and analysis_results
+
+Revision ID: eb6c236bfaae
+Revises: 9d5e6ee4c19b
+Create Date: 2026-10-17 15:20:11.402317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'eb6c236bfaae'
+down_revision: Union[str, Sequence[str], None] = '9d5e6ee4c19b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('incidents', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('analysis_results',
+    sa.Column('incident_id', sa.String(), nullable=False),
+    sa.Column('data_version', sa.Integer(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['incident_id'], ['incidents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('incident_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('analysis_results')
+    op.drop_column('incidents', 'data_version')
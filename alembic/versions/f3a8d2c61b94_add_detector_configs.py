@@ -0,0 +1,43 @@
+"""add detector_configs, scoring_config and analysis_results.config_version
+
+Revision ID: f3a8d2c61b94
+Revises: e52b07a9c3d1
+Create Date: 2026-10-17 23:41:12.508317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a8d2c61b94'
+down_revision: Union[str, Sequence[str], None] = 'e52b07a9c3d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('detector_configs',
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('pattern', sa.String(), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('position')
+    )
+    op.create_table('scoring_config',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.add_column('analysis_results', sa.Column('config_version', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('analysis_results', 'config_version')
+    op.drop_table('scoring_config')
+    op.drop_table('detector_configs')
@@ -0,0 +1,1131 @@
+import fnmatch
+import functools
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, NamedTuple
+
+import numpy as np
+from pydantic import TypeAdapter
+
+from app import changepoint
+from app.profiling import Profile
+from app.schemas import AnalysisResponse, AnomalyOut, CauseOut, EpisodeOut
+
+
+# Defaults of the per-metric detection parameters (MetricConfig); rules in
+# the detector_configs table override them per metric name pattern
+# (app/analysis_config.py).
+
+# points need at least this many samples before we try to score them
+MIN_POINTS = 12
+Z_THRESHOLD = 3.0
+# baseline window bounds (points)
+BASELINE_MIN_POINTS = 10
+BASELINE_MAX_POINTS = 30
+# how points are scored, one of DETECTORS: "baseline" / "robust" compare
+# them to the series' first points (mean/std, or median/MAD), the moving ones
+# to a baseline that follows the series (an exponentially weighted
+# mean/variance spanning about BASELINE_MAX_POINTS points, or the window of
+# BASELINE_MAX_POINTS preceding points)
+DEFAULT_DETECTOR = "baseline"
+# robust z-scores: MAD (and, if that is 0, mean absolute deviation around
+# the median) scaled to the std of a normal distribution
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+# how episodes are formed: "gap" chains anomalies (EPISODE_GAP), "cusum" /
+# "binseg" take the segments where the series' level shifts (changepoint.py)
+EPISODE_METHODS = ("gap", "cusum", "binseg")
+DEFAULT_EPISODE_METHOD = "gap"
+# anomalies closer than this belong to the same episode
+EPISODE_GAP = np.timedelta64(timedelta(minutes=2))
+
+# Defaults of the cause scoring parameters (ScoringConfig), overridden by
+# the scoring_config table.
+
+# events this close to an episode's start are candidate causes
+CAUSE_WINDOW = timedelta(minutes=10)
+# agreement boost per overlapping episode of another metric, and its cap
+AGREEMENT_BONUS = 0.35
+AGREEMENT_CAP = 0.6
+# event priors (feel free to tweak later)
+EVENT_PRIORS = {
+    "deploy": 1.00,
+    "config_change": 0.85,
+    "feature_flag": 0.75,
+    "db_migration": 0.80,
+    "incident_note": 0.50,
+}
+DEFAULT_EVENT_PRIOR = 0.6  # default mid
+
+# per-metric detection fans out over this many processes (1 = in-process only).
+# Every uvicorn worker has a pool of its own, so the default splits the CPUs
+# between WEB_CONCURRENCY workers (uvicorn's --workers default), at most 4 each
+ANALYSIS_PROCESSES_MAX = 4
+ANALYSIS_PROCESSES = int(os.getenv("ANALYSIS_PROCESSES", "0")) or max(
+    1, min(ANALYSIS_PROCESSES_MAX, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1"))))
+)
+# ...but only for incidents at least this big
+ANALYSIS_PARALLEL_MIN_POINTS = int(os.getenv("ANALYSIS_PARALLEL_MIN_POINTS", "200000"))
+
+_pools = {}  # processes -> ProcessPoolExecutor, created on first use
+_pools_lock = threading.Lock()  # first uses race in the request threadpool
+
+
+class MetricConfig(NamedTuple):
+    """How one metric is analyzed. Hashable: metrics are batched by it."""
+
+    detector: str = DEFAULT_DETECTOR
+    episode_method: str = DEFAULT_EPISODE_METHOD
+    z_threshold: float = Z_THRESHOLD
+    min_points: int = MIN_POINTS
+    baseline_min_points: int = BASELINE_MIN_POINTS
+    baseline_max_points: int = BASELINE_MAX_POINTS
+    episode_gap_seconds: float = EPISODE_GAP.item().total_seconds()
+
+    @property
+    def episode_gap(self) -> np.timedelta64:
+        return np.timedelta64(round(self.episode_gap_seconds * 1e6), "us")
+
+
+class ScoringConfig(NamedTuple):
+    """How episodes are linked to events and causes scored (see _likely_causes)."""
+
+    cause_window_seconds: float = CAUSE_WINDOW.total_seconds()
+    agreement_bonus: float = AGREEMENT_BONUS
+    agreement_cap: float = AGREEMENT_CAP
+    event_priors: dict = EVENT_PRIORS
+    default_event_prior: float = DEFAULT_EVENT_PRIOR
+
+
+DEFAULT_METRIC_CONFIG = MetricConfig()
+
+# metric names per AnalysisConfig whose matching rule is remembered
+METRIC_CONFIG_CACHE_SIZE = int(os.getenv("METRIC_CONFIG_CACHE_SIZE", "10000"))
+
+
+class AnalysisConfig:
+    """
+    Everything an analysis is parameterized by: a MetricConfig per metric and
+    the ScoringConfig.
+
+    `rules` are (pattern, MetricConfig) pairs; a metric gets the config of the
+    first rule whose fnmatch-style pattern matches its name ("*error_rate*",
+    "p9?_latency_ms"), else `default`. Each config remembers the config of
+    the METRIC_CONFIG_CACHE_SIZE metric names it resolved last, so patterns
+    aren't matched again on every analysis. `version` fingerprints the
+    contents; results are cached under it, so a config change never serves
+    results computed under the previous one.
+    """
+
+    def __init__(self, rules=(), scoring: ScoringConfig = ScoringConfig(), default: MetricConfig = DEFAULT_METRIC_CONFIG):
+        self.rules = tuple(rules)
+        self.scoring = scoring
+        self.default = default
+        # set on configs derived with override()
+        self.overridden = False
+        self.version = hashlib.sha1(
+            json.dumps(
+                [[[p, c._asdict()] for p, c in self.rules], scoring._asdict(), default._asdict()],
+                sort_keys=True,
+            ).encode()
+        ).hexdigest()[:12]
+        # metric name -> MetricConfig, for recently seen names only: names
+        # pile up across incidents for as long as the config is current
+        self._resolved = functools.lru_cache(maxsize=METRIC_CONFIG_CACHE_SIZE)(self._match)
+        # (detector, episode_method) -> AnalysisConfig; both are validated
+        # against DETECTORS / EPISODE_METHODS first, so this stays small
+        self._overrides = {}
+
+    def for_metric(self, name: str) -> MetricConfig:
+        return self._resolved(name)
+
+    def _match(self, name: str) -> MetricConfig:
+        return next((c for p, c in self.rules if fnmatch.fnmatchcase(name, p)), self.default)
+
+    def override(self, detector: str | None = None, episode_method: str | None = None) -> "AnalysisConfig":
+        """This config with `detector` / `episode_method` (those given) for every metric."""
+        key = (detector, episode_method)
+        if key == (None, None):
+            return self
+        derived = self._overrides.get(key)
+        if derived is None:
+            changes = {k: v for k, v in zip(("detector", "episode_method"), key) if v is not None}
+            derived = AnalysisConfig(
+                [(p, c._replace(**changes)) for p, c in self.rules], self.scoring, self.default._replace(**changes)
+            )
+            if derived.version == self.version:
+                derived = self
+            else:
+                derived.overridden = True
+            self._overrides[key] = derived
+        return derived
+
+
+DEFAULT_ANALYSIS_CONFIG = AnalysisConfig()
+
+
+def baseline_size(n: int, config: MetricConfig = DEFAULT_METRIC_CONFIG) -> int:
+    # first 30 points, or 25% of the series, but never fewer than 10
+    return min(config.baseline_max_points, max(config.baseline_min_points, n // 4))
+
+
+class SeriesBuilder:
+    """
+    Accumulate (metric_name, ts, value) rows into per-metric arrays.
+
+    Rows are expected ordered by (metric_name, ts), which is what the analysis
+    query returns, and can be fed in any number of chunks via extend(); each
+    metric is converted to arrays as soon as the next one starts, so only one
+    metric's rows are held as Python objects at a time.
+    """
+
+    def __init__(self):
+        self.series = {}
+        self._current = None
+        self._ts_buf = []
+        self._value_buf = []
+
+    def _flush(self):
+        ts = np.array(self._ts_buf, dtype="datetime64[us]")
+        values = np.array(self._value_buf, dtype=np.float64)
+        if self._current in self.series:
+            # out-of-order input: stitch back together
+            prev_ts, prev_values = self.series[self._current]
+            ts = np.concatenate([prev_ts, ts])
+            values = np.concatenate([prev_values, values])
+        self.series[self._current] = (ts, values)
+
+    def extend(self, rows):
+        for metric_name, ts, value in rows:
+            if metric_name != self._current:
+                if self._current is not None:
+                    self._flush()
+                self._current = metric_name
+                self._ts_buf, self._value_buf = [], []
+            self._ts_buf.append(ts)
+            self._value_buf.append(value)
+
+    def build(self) -> dict:
+        """Returns {metric_name: (ts datetime64[us], values float64)}."""
+        if self._current is not None:
+            self._flush()
+            self._current = None
+            self._ts_buf, self._value_buf = [], []
+        return self.series
+
+
+def group_series(rows) -> dict:
+    builder = SeriesBuilder()
+    builder.extend(rows)
+    return builder.build()
+
+
+class Detector(NamedTuple):
+    """
+    A registered way of scoring points (see register_detector).
+
+    A fixed detector's `fn(rows)` returns a location and scale (mean/std-like)
+    per row of a 2-D array; it gets the baseline windows of a whole batch of
+    metrics in one call. A moving detector's `fn(values, carry, config)`
+    returns the expected value and spread of every point given the points
+    before it, plus the state (`carry`) to score later points from.
+    """
+
+    name: str
+    fn: Callable
+    moving: bool
+
+
+# name -> Detector, in registration order
+DETECTORS: dict[str, Detector] = {}
+
+
+def register_detector(name: str, moving: bool = False):
+    """
+    Decorator registering a module-level function as detector `name`,
+    selectable with ?detector= and per metric in detector_configs. Batches
+    run in pool processes are shipped the function itself (pickled by
+    reference), so it can live in any importable module.
+    """
+    def register(fn):
+        DETECTORS[name] = Detector(name, fn, moving)
+        return fn
+    return register
+
+
+@register_detector("baseline")
+def _exact_mean_std(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # baseline windows are at most a few dozen points; plain left-to-right
+    # sums keep mean/std bit-identical to the original per-point
+    # implementation (np.mean/np.var use pairwise summation and can differ in
+    # the last ulp)
+    means, stds = np.empty(len(rows)), np.empty(len(rows))
+    for i, row in enumerate(rows.tolist()):
+        mean = sum(row) / len(row)
+        means[i] = mean
+        stds[i] = math.sqrt(sum((v - mean) ** 2 for v in row) / len(row))
+    return means, stds
+
+
+def _median_rows(a: np.ndarray) -> np.ndarray:
+    # selection (np.partition), not a sort: linear in the row length
+    k = a.shape[1]
+    half = k // 2
+    if k % 2:
+        return np.partition(a, half, axis=1)[:, half]
+    middle = np.partition(a, (half - 1, half), axis=1)
+    return (middle[:, half - 1] + middle[:, half]) / 2
+
+
+@register_detector("robust")
+def robust_stats(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Median and robust std of each row of a 2-D array: MAD_SCALE x the median
+    absolute deviation, or MEAN_AD_SCALE x the mean absolute deviation for
+    rows where more than half the values are equal (MAD = 0).
+    """
+    median = _median_rows(rows)
+    deviation = np.abs(rows - median[:, None])
+    scale = MAD_SCALE * _median_rows(deviation)
+    flat = scale < 1e-9
+    if flat.any():
+        scale[flat] = MEAN_AD_SCALE * deviation[flat].mean(axis=1)
+    return median, scale
+
+
+def _detect_fixed(series_values: list, stats, config: MetricConfig) -> list:
+    """
+    detect_point_anomalies() for metrics sharing `config`: the baseline
+    windows of all metrics with the same baseline size go to `stats` as one
+    2-D array, then each metric is z-scored in one pass.
+    """
+    out = [None] * len(series_values)
+    by_size = {}
+    for i, values in enumerate(series_values):
+        if len(values) >= config.min_points:
+            by_size.setdefault(baseline_size(len(values), config), []).append(i)
+
+    for baseline_n, members in by_size.items():
+        loc, scale = stats(np.stack([series_values[i][:baseline_n] for i in members]))
+        for i, mean, std in zip(members, loc.tolist(), scale.tolist()):
+            if std < 1e-9:
+                continue
+            z = (series_values[i][baseline_n:] - mean) / std
+            hits = np.flatnonzero(np.abs(z) >= config.z_threshold)
+            out[i] = hits + baseline_n, mean, std, z[hits]
+    return out
+
+
+def detect_point_anomalies(values: np.ndarray, config: MetricConfig = DEFAULT_METRIC_CONFIG):
+    """
+    Z-score every point after the baseline window against the baseline, with
+    a fixed detector ("baseline", "robust").
+
+    Returns (idx, mean, std, z) where idx are positions into `values` with
+    |z| >= z_threshold and z their scores, or None if the metric is too short
+    or flat to score. With "robust", mean/std are the baseline's median and
+    robust std (see robust_stats), so a spike inside the baseline window
+    doesn't mask what comes after it.
+    """
+    return _detect_fixed([values], DETECTORS[config.detector].fn, config)[0]
+
+
+# blocks of _linear_scan are sized so decay ** -block stays below this
+_SCAN_MAX_GROWTH = 1e3
+
+
+def _scan_block(decay: float) -> int:
+    return max(1, int(math.log(_SCAN_MAX_GROWTH) / -math.log(decay)))
+
+
+def _linear_scan(u: np.ndarray, decay: float, y0: float) -> tuple[np.ndarray, float]:
+    """
+    y[i] = decay * y[i-1] + u[i] with y[-1] = y0, for 0 < decay < 1.
+
+    Within a block the recurrence is a cumulative sum of u scaled by powers of
+    decay, all blocks at once; only the value carried from one block into the
+    next is a Python-level loop (one step per block, not per point). Blocks
+    are short enough that the scaling can't cost more than ~3 digits.
+
+    Blocks start every _scan_block(decay) points from u[0]; also returns the
+    value carried into the block after the last complete one (y0 if there is
+    none). Resuming from there with the rest of u repeats the very same
+    arithmetic, so a series scanned in pieces gets bit-identical results.
+    """
+    n = len(u)
+    if n == 0:
+        return u.astype(np.float64), y0
+    size = _scan_block(decay)
+    n_blocks = -(-n // size)
+    blocks = np.zeros(n_blocks * size)
+    blocks[:n] = u
+    blocks = blocks.reshape(n_blocks, size)
+
+    j = np.arange(size)
+    # each block's recurrence started from 0
+    local = np.cumsum(blocks * decay ** -j, axis=1) * decay ** j
+    carried = np.empty(n_blocks + 1)
+    y, step = y0, decay ** size
+    for b, end in enumerate(local[:, -1].tolist()):
+        carried[b] = y
+        y = step * y + end
+    carried[n_blocks] = y
+    out = (local + carried[:n_blocks, None] * decay ** (j + 1)).ravel()[:n]
+    return out, float(carried[n // size])
+
+
+@register_detector("ewma", moving=True)
+def _ewma_scan(values: np.ndarray, carry, config: MetricConfig):
+    """
+    Exponentially weighted mean/variance of the points before each point.
+
+    The first baseline_min_points points seed them (plain mean/variance);
+    from there every point moves them by alpha = 2 / (baseline_max_points + 1).
+    `carry` is the state left by the previous scan of the series: (seed
+    points, mean, var, pending), mean/var as of the last _linear_scan block
+    boundary and pending the points after it, which are scanned again along
+    with the new ones.
+    """
+    n = len(values)
+    expected, spread = np.full(n, np.nan), np.full(n, np.nan)
+    seed, mean, var, pending = carry or (values[:0], None, None, values[:0])
+    start = 0
+    if mean is None:
+        start = min(n, config.baseline_min_points - len(seed))
+        seed = np.concatenate([seed, values[:start]])
+        if len(seed) < config.baseline_min_points:
+            return expected, spread, (seed, None, None, pending)
+        mean, var, seed = float(seed.mean()), float(seed.var()), None
+
+    rest = values[start:]
+    if len(rest):
+        alpha = 2.0 / (config.baseline_max_points + 1)
+        keep = 1.0 - alpha
+        scan, k = np.concatenate([pending, rest]), len(pending)
+        # mean/var *after* each point; each point is scored against the ones before it
+        means, next_mean = _linear_scan(alpha * scan, keep, mean)
+        prev_means = np.concatenate(([mean], means[:-1]))
+        d = scan - prev_means
+        variances, next_var = _linear_scan(keep * alpha * d * d, keep, var)
+        expected[start:] = prev_means[k:]
+        spread[start:] = np.sqrt(np.concatenate(([var], variances[:-1])))[k:]
+        block = _scan_block(keep)
+        mean, var, pending = next_mean, next_var, scan[len(scan) // block * block:]
+    return expected, spread, (None, mean, var, pending)
+
+
+# windows scored per vectorized step; bounds the (windows x window size)
+# temporaries the statistics allocate
+_WINDOW_CHUNK = 1 << 15
+
+
+def _mean_std(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return rows.mean(axis=1), rows.std(axis=1)
+
+
+def _window_scan(values: np.ndarray, carry, stats, config: MetricConfig):
+    """
+    `stats` (mean/std-like, per row) of the baseline_max_points points before
+    each point (fewer at the start of the series, but at least
+    baseline_min_points). `carry` is the window left by the previous scan of
+    the series.
+    """
+    tail = values[:0] if carry is None else carry
+    k, w = len(tail), config.baseline_max_points
+    full = np.concatenate([tail, values])
+    expected, spread = np.full(len(full), np.nan), np.full(len(full), np.nan)
+
+    # the window is still filling up: at most w - baseline_min_points points
+    for i in range(max(k, config.baseline_min_points), min(w, len(full))):
+        loc, scale = stats(full[None, :i])
+        expected[i], spread[i] = loc[0], scale[0]
+
+    first = max(k, w)
+    if first < len(full):
+        windows = np.lib.stride_tricks.sliding_window_view(full[:-1], w)[first - w:]
+        for lo in range(0, len(windows), _WINDOW_CHUNK):
+            loc, scale = stats(windows[lo:lo + _WINDOW_CHUNK])
+            expected[first + lo:first + lo + len(loc)] = loc
+            spread[first + lo:first + lo + len(loc)] = scale
+    return expected[k:], spread[k:], full[-w:].copy()
+
+
+@register_detector("rolling", moving=True)
+def _rolling_scan(values: np.ndarray, carry, config: MetricConfig):
+    """Mean/std of the window of points before each point (see _window_scan)."""
+    return _window_scan(values, carry, _mean_std, config)
+
+
+@register_detector("rolling_median", moving=True)
+def _rolling_median_scan(values: np.ndarray, carry, config: MetricConfig):
+    """
+    Median/robust std of the window of points before each point.
+
+    Each window's order statistics come from selection over all windows of a
+    chunk at once; for a 30-point window that beats keeping a sorted window
+    up to date point by point (see bench/detectors.py).
+    """
+    return _window_scan(values, carry, robust_stats, config)
+
+
+def detect_moving_anomalies(
+    values: np.ndarray,
+    config: MetricConfig,
+    carry=None,
+    detector: Detector | None = None,
+):
+    """
+    Z-score every point against a baseline built from the points before it,
+    with a moving detector (config.detector, or `detector`).
+
+    They keep O(1) state per metric, so a series can be scored in pieces:
+    pass the `carry` returned for one piece along with the next one. Returns
+    (idx, mean, std, z, carry): positions with |z| >= z_threshold and the
+    baseline mean/std and z of each. Points whose baseline is flat aren't
+    scored.
+    """
+    detector = detector or DETECTORS[config.detector]
+    expected, spread, carry = detector.fn(values, carry, config)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (values - expected) / spread
+        hits = np.flatnonzero((spread >= 1e-9) & (np.abs(z) >= config.z_threshold))
+    return hits, expected[hits], spread[hits], z[hits], carry
+
+
+def collapse_episodes(metric_name: str, ts: np.ndarray, values: np.ndarray, z: np.ndarray,
+                      mean, std, gap: np.timedelta64 = EPISODE_GAP) -> list[dict]:
+    """
+    Chain one metric's anomalies (ts-ordered arrays) into episodes: an anomaly
+    within `gap` of the previous one extends the current episode.
+
+    `mean`/`std` are the baseline, or one per anomaly for moving detectors
+    (an episode then reports the baseline its first anomaly was scored against).
+    """
+    if len(ts) == 0:
+        return []
+
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ts) > gap) + 1))
+    ends = np.append(starts[1:], len(ts)) - 1
+    max_abs_z = np.maximum.reduceat(np.abs(z), starts)
+    max_value = np.maximum.reduceat(values, starts)
+    if np.ndim(mean):
+        means, stds = mean[starts].tolist(), std[starts].tolist()
+    else:
+        means, stds = [mean] * len(starts), [std] * len(starts)
+
+    return [
+        {
+            "metric": metric_name,
+            "start": ts[s].item(),
+            "end": ts[e].item(),
+            "max_abs_z": peak_z,
+            "baseline_mean": m,
+            "baseline_std": sd,
+            "max_value": peak_value,
+        }
+        for s, e, peak_z, peak_value, m, sd in zip(
+            starts.tolist(), ends.tolist(), max_abs_z.tolist(), max_value.tolist(), means, stds
+        )
+    ]
+
+
+def changepoint_episodes(
+    metric_name: str,
+    ts: np.ndarray,
+    values: np.ndarray,
+    config: MetricConfig,
+) -> list[dict]:
+    """
+    Episodes of one metric from change-point segmentation
+    (config.episode_method "cusum" or "binseg"), in collapse_episodes()'
+    format plus each segment's `level_shift`: its mean minus the baseline
+    level.
+    """
+    sigma = changepoint.noise_std(values)
+    if sigma < 1e-9:
+        return []
+    if config.episode_method == "cusum":
+        baseline_n = baseline_size(len(values), config)
+        reference = float(np.median(values[:baseline_n]))
+        segments = changepoint.cusum(values, reference, sigma, baseline_n)
+    else:
+        reference, segments = changepoint.binseg_shifts(values, sigma, config.z_threshold)
+
+    episodes = []
+    for first, last in segments:
+        deviation = values[first:last + 1] - reference
+        peak = int(np.argmax(np.abs(deviation)))
+        episodes.append(
+            {
+                "metric": metric_name,
+                "start": ts[first].item(),
+                "end": ts[last].item(),
+                "max_abs_z": abs(float(deviation[peak])) / sigma,
+                "baseline_mean": reference,
+                "baseline_std": sigma,
+                "max_value": float(values[first + peak]),
+                "level_shift": float(deviation.mean()),
+            }
+        )
+    return episodes
+
+
+def analyze_batch(config: MetricConfig, batch: list, detector: Detector | None = None) -> list:
+    """
+    Detection + episode collapse for metrics sharing `config`:
+    [(metric_name, ts, values), ...] -> [result or None, ...].
+
+    A result is None if the metric can't be scored, else a dict with the
+    anomaly arrays (ts/values/z), the baseline mean/std and the metric's
+    episodes. Fixed detectors get the baselines of the whole batch in one
+    call; moving ones report mean/std per anomaly, plus the `carry` to score
+    later points with. Change-point episodes don't depend on the anomalies,
+    so with those a metric the detector can't score (flat baseline) still
+    gets its episodes. `detector` is DETECTORS[config.detector], resolved by
+    the caller when the batch runs in a pool process.
+    """
+    detector = detector or DETECTORS[config.detector]
+    if detector.moving:
+        detected = [
+            detect_moving_anomalies(values, config, detector=detector) if len(values) >= config.min_points else None
+            for _, _, values in batch
+        ]
+    else:
+        detected = _detect_fixed([values for _, _, values in batch], detector.fn, config)
+
+    results = []
+    for (metric_name, ts, values), found in zip(batch, detected):
+        if len(values) < config.min_points:
+            results.append(None)
+            continue
+
+        extra = {}
+        if found is None:
+            if config.episode_method == DEFAULT_EPISODE_METHOD:
+                results.append(None)
+                continue
+            found = np.empty(0, dtype=np.intp), 0.0, 0.0, np.empty(0)
+        elif detector.moving:
+            *found, extra["carry"] = found
+        idx, mean, std, z = found
+
+        a_ts, a_values = ts[idx], values[idx]
+        if config.episode_method == DEFAULT_EPISODE_METHOD:
+            episodes = collapse_episodes(metric_name, a_ts, a_values, z, mean, std, config.episode_gap)
+        else:
+            episodes = changepoint_episodes(metric_name, ts, values, config)
+        results.append(
+            {
+                "ts": a_ts,
+                "values": a_values,
+                "z": z,
+                "mean": mean,
+                "std": std,
+                "episodes": episodes,
+                **extra,
+            }
+        )
+    return results
+
+
+def analyze_metric(metric_name: str, ts: np.ndarray, values: np.ndarray, config: MetricConfig = DEFAULT_METRIC_CONFIG):
+    """analyze_batch() for a single metric."""
+    return analyze_batch(config, [(metric_name, ts, values)])[0]
+
+
+def count_overlaps(starts: np.ndarray, ends: np.ndarray) -> list[int]:
+    """
+    For each closed interval [starts[i], ends[i]], how many *other* intervals
+    overlap it. Sorted sweep instead of comparing every pair: O(n log n).
+    """
+    if len(starts) == 0:
+        return []
+    sorted_starts = np.sort(starts)
+    sorted_ends = np.sort(ends)
+    # intervals starting at or before our end, minus those that ended before
+    # our start (a subset of the former), minus ourselves
+    started = np.searchsorted(sorted_starts, ends, side="right")
+    finished = np.searchsorted(sorted_ends, starts, side="left")
+    return (started - finished - 1).tolist()
+
+
+def events_within(event_ts: np.ndarray, ts, window: timedelta) -> tuple[int, int]:
+    """[lo, hi) slice of the ts-sorted `event_ts` within `window` of `ts` (inclusive)."""
+    center = np.datetime64(ts, "us")
+    delta = np.timedelta64(window)
+    lo = np.searchsorted(event_ts, center - delta, side="left")
+    hi = np.searchsorted(event_ts, center + delta, side="right")
+    return int(lo), int(hi)
+
+
+# response sections a request can pick with ?fields=
+SECTIONS = ("anomalies", "episodes", "likely_causes")
+
+
+def parse_cursor(cursor: str) -> tuple[datetime, int | None]:
+    """
+    "<ts>" means everything after ts; "<ts>@<n>" (what next_*_cursor returns)
+    means after the first n items at ts, for pages that end inside a run of
+    items with the same ts. Raises ValueError on anything else.
+    """
+    ts, sep, skip = cursor.partition("@")
+    at = datetime.fromisoformat(ts)
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)  # stored as naive UTC
+    if not sep:
+        return at, None
+    if not skip.isdigit():
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return at, int(skip)
+
+
+class Page:
+    """A limit and/or cursor over a ts-ordered section (anomalies by ts, episodes by start)."""
+
+    def __init__(self, limit: int | None = None, cursor: str | None = None):
+        self.limit = limit
+        self.after = parse_cursor(cursor) if cursor else None
+
+    def bounds(self, sorted_ts: np.ndarray) -> tuple[int, int]:
+        """[lo, hi) of the page within the section's ts-sorted timestamps."""
+        lo = 0
+        if self.after is not None:
+            ts, skip = self.after
+            at = np.datetime64(ts, "us")
+            lo = int(np.searchsorted(sorted_ts, at, side="right"))
+            if skip is not None:
+                lo = min(lo, int(np.searchsorted(sorted_ts, at, side="left")) + skip)
+        hi = len(sorted_ts) if self.limit is None else min(len(sorted_ts), lo + self.limit)
+        return lo, hi
+
+    def next_cursor(self, sorted_ts: np.ndarray, hi: int) -> str | None:
+        """Cursor for the page after one ending at `hi`, None if it was the last."""
+        if hi >= len(sorted_ts) or hi == 0:
+            return None
+        last = sorted_ts[hi - 1]
+        at = hi - int(np.searchsorted(sorted_ts, last, side="left"))
+        return f"{last.item().isoformat()}@{at}"
+
+
+class View:
+    """Which sections (and pages of them) a response should contain."""
+
+    def __init__(self, sections=SECTIONS, anomalies: Page | None = None, episodes: Page | None = None):
+        self.sections = frozenset(sections)
+        self.anomalies = anomalies
+        self.episodes = episodes
+
+    @property
+    def full(self) -> bool:
+        return self.sections == FULL_VIEW.sections and self.anomalies is None and self.episodes is None
+
+
+FULL_VIEW = View()
+
+
+def _analyze_batch_args(args):
+    return analyze_batch(*args)
+
+
+def _process_pool(processes: int) -> ProcessPoolExecutor:
+    pool = _pools.get(processes)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(processes)
+            if pool is None:
+                # spawn, not fork: the API process is multi-threaded (event
+                # loop + threadpool) and forking that is unsafe
+                pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+                _pools[processes] = pool
+    return pool
+
+
+def analyze_metrics(
+    series: dict,
+    processes: int | None = None,
+    config: AnalysisConfig | None = None,
+) -> dict:
+    """
+    Per-metric results (see analyze_batch) for every metric in `series`;
+    {metric_name: result or None} in the same (metric_name) order.
+
+    Metrics are grouped by their MetricConfig (`config.for_metric`) and each
+    group is dispatched as one batch. Incidents with at least
+    ANALYSIS_PARALLEL_MIN_POINTS points (and more than one metric) are fanned
+    out across a process pool in batches of about a quarter of a process'
+    share of the metrics, shipping only the ts/value arrays; smaller ones stay
+    in-process where pickling would cost more than it saves. Results are
+    merged back in input order, so output is identical either way.
+    """
+    config = config or DEFAULT_ANALYSIS_CONFIG
+    groups = {}  # MetricConfig -> metric names, in input order
+    for name in series:
+        groups.setdefault(config.for_metric(name), []).append(name)
+
+    processes = processes or ANALYSIS_PROCESSES
+    n_points = sum(len(values) for _, values in series.values())
+    results = {}
+    if processes <= 1 or len(series) < 2 or n_points < ANALYSIS_PARALLEL_MIN_POINTS:
+        for metric_config, names in groups.items():
+            results.update(zip(names, analyze_batch(metric_config, [(name, *series[name]) for name in names])))
+    else:
+        size = max(1, len(series) // (processes * 4))
+        batches = [
+            (metric_config, names[lo:lo + size])
+            for metric_config, names in groups.items()
+            for lo in range(0, len(names), size)
+        ]
+        outputs = _process_pool(processes).map(
+            _analyze_batch_args,
+            (
+                (metric_config, [(name, *series[name]) for name in names], DETECTORS[metric_config.detector])
+                for metric_config, names in batches
+            ),
+        )
+        for (_, names), output in zip(batches, outputs):
+            results.update(zip(names, output))
+    return {name: results[name] for name in series}
+
+
+def count_anomalies(results: dict) -> int:
+    return sum(len(r["ts"]) for r in results.values())
+
+
+def analyze_series(
+    incident_id: str,
+    series: dict,
+    events,
+    profile: Profile | None = None,
+    config: AnalysisConfig | None = None,
+) -> "IncidentAnalysis":
+    """
+    Detect anomalies and episodes in an incident's per-metric arrays (see
+    SeriesBuilder); responses are built from the result. `events` are
+    ordered by ts. Pure CPU work: callers on the event loop should run this
+    in a worker thread.
+    """
+    profile = profile or Profile()
+    config = config or DEFAULT_ANALYSIS_CONFIG
+
+    # ---- 2) + 3) detect point anomalies, collapse into episodes per metric ----
+    with profile.stage("detect") as st:
+        results = {
+            name: result
+            for name, result in analyze_metrics(series, config=config).items()
+            if result is not None
+        }
+        st.rows = sum(len(values) for _, values in series.values())
+        st.objects = count_anomalies(results)
+
+    return IncidentAnalysis(incident_id, results, events, config.scoring)
+
+
+def run_analysis(
+    incident_id: str,
+    series: dict,
+    events,
+    profile: Profile | None = None,
+    config: AnalysisConfig | None = None,
+) -> AnalysisResponse:
+    """The full response for an incident's per-metric arrays; see analyze_series()."""
+    return analyze_series(incident_id, series, events, profile, config).response(profile=profile)
+
+
+def score_incident(
+    incident_id: str,
+    results: dict,
+    events,
+    profile: Profile | None = None,
+    scoring: ScoringConfig | None = None,
+) -> AnalysisResponse:
+    """
+    The full response for per-metric results (analyze_batch output, in
+    metric_name order) and the incident's events, ordered by ts.
+    """
+    return IncidentAnalysis(incident_id, results, events, scoring).response(profile=profile)
+
+
+# validators for a whole section's rows at once: one pass in pydantic-core
+# instead of a Python-level __init__ per anomaly
+_SECTION_ROWS = {
+    "anomalies": TypeAdapter(List[AnomalyOut]),
+    "episodes": TypeAdapter(List[EpisodeOut]),
+    "likely_causes": TypeAdapter(List[CauseOut]),
+}
+
+
+class IncidentAnalysis:
+    """
+    An analyzed incident that responses are built from: whole, some of its
+    sections (?fields=) or pages of them (View).
+
+    Only what a response needs is built. A section asked for in full is
+    built once and kept; a page of one that hasn't been is cut from the
+    ts-sorted anomaly columns / episode list, building just its rows. Those,
+    and the episode order likely_causes also needs, are built once as well.
+    Safe to share between threads (it's what the analysis cache holds).
+    """
+
+    def __init__(self, incident_id: str, results: dict | None, events, scoring: ScoringConfig | None = None):
+        self.incident_id = incident_id
+        self._results = results
+        self._events = events
+        self._scoring = scoring or ScoringConfig()
+        self._sections = {}    # name -> validated rows, once built in full
+        self._sorted_ts = {}   # "anomalies" / "episodes" -> datetime64 array, for paging
+        self._anomalies = None  # ts-sorted anomaly columns (_anomaly_columns)
+        self._episodes = None   # ts-sorted episode dicts (_episode_order)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_response(cls, response: AnalysisResponse) -> "IncidentAnalysis":
+        """A full response (e.g. read back from analysis_results); views are cut from its sections."""
+        analysis = cls(response.incident_id, None, None)
+        analysis._sections = {name: getattr(response, name) for name in SECTIONS}
+        return analysis
+
+    def response(self, view: View = FULL_VIEW, profile: Profile | None = None) -> AnalysisResponse:
+        profile = profile or Profile()
+        out = {"incident_id": self.incident_id}
+        with self._lock:
+            for name, page in (("anomalies", view.anomalies), ("episodes", view.episodes)):
+                if name not in view.sections:
+                    continue
+                if page is None:
+                    out[name] = self._section(name, profile)
+                    continue
+                ts = self._ts(name, profile)
+                lo, hi = page.bounds(ts)
+                out[name] = self._rows(name, lo, hi, profile)
+                out[f"next_{name}_cursor"] = page.next_cursor(ts, hi)
+            if "likely_causes" in view.sections:
+                out["likely_causes"] = self._section("likely_causes", profile)
+        # already-validated parts; fields_set = exactly the keys given
+        return AnalysisResponse.model_construct(**out)
+
+    def _section(self, name: str, profile: Profile) -> list:
+        rows = self._sections.get(name)
+        if rows is None:
+            if name == "likely_causes":
+                episodes = self._episode_order(profile)
+                causes = _likely_causes(
+                    episodes, self._sorted_ts["episodes"], self._events, profile, self._scoring
+                )
+                rows = self._validate(name, causes, profile)
+            else:
+                rows = self._rows(name, 0, None, profile)
+            self._sections[name] = rows
+        return rows
+
+    def _rows(self, name: str, lo: int, hi: int | None, profile: Profile) -> list:
+        """Validated rows [lo:hi] of the anomalies or episodes section."""
+        built = self._sections.get(name)
+        if built is not None:
+            return built[lo:hi]
+        if name == "anomalies":
+            names, *columns = self._anomaly_columns(profile)
+            metric, ts, values, means, stds, z = (c[lo:hi] for c in columns)
+            with profile.stage("response") as st:
+                rows = [
+                    {
+                        "metric_name": names[m],
+                        "ts": t,
+                        "value": value,
+                        "baseline_mean": mean,
+                        "baseline_std": std,
+                        "z_score": z_score,
+                    }
+                    for m, t, value, mean, std, z_score in zip(
+                        metric.tolist(), ts.tolist(), values.tolist(), means.tolist(), stds.tolist(), z.tolist()
+                    )
+                ]
+                st.rows = len(rows)
+        else:
+            episodes = self._episode_order(profile)[lo:hi]
+            with profile.stage("response"):
+                rows = [_episode_row(ep) for ep in episodes]
+        return self._validate(name, rows, profile)
+
+    @staticmethod
+    def _validate(name: str, rows: list[dict], profile: Profile) -> list:
+        with profile.stage("response") as st:
+            out = _SECTION_ROWS[name].validate_python(rows)
+            st.objects = (st.objects or 0) + len(out)
+        return out
+
+    def _ts(self, name: str, profile: Profile) -> np.ndarray:
+        """ts (anomalies) or start_ts (episodes) of the whole section, sorted, for paging."""
+        ts = self._sorted_ts.get(name)
+        if ts is None:
+            if self._results is None:
+                attr = "ts" if name == "anomalies" else "start_ts"
+                ts = np.array([getattr(r, attr) for r in self._sections[name]], dtype="datetime64[us]")
+                self._sorted_ts[name] = ts
+            elif name == "anomalies":
+                self._anomaly_columns(profile)
+            else:
+                self._episode_order(profile)
+        return self._sorted_ts[name]
+
+    def _anomaly_columns(self, profile: Profile) -> tuple:
+        """
+        (metric names, then metric index, ts, value, baseline mean, baseline
+        std and z per anomaly): every metric's anomalies, ordered by ts (ties
+        in metric_name order).
+        """
+        if self._anomalies is None:
+            with profile.stage("response"):
+                scored = [(name, r) for name, r in self._results.items() if len(r["ts"])]
+                if not scored:
+                    empty = np.array([], dtype=float)
+                    ts = np.array([], dtype="datetime64[us]")
+                    self._anomalies = ([], np.array([], dtype=int), ts, empty, empty, empty, empty)
+                else:
+                    ts = np.concatenate([r["ts"] for _, r in scored])
+                    order = np.argsort(ts, kind="stable")  # same order as a stable sort by ts
+                    sizes = [len(r["ts"]) for _, r in scored]
+                    self._anomalies = (
+                        [name for name, _ in scored],
+                        np.repeat(np.arange(len(scored)), sizes)[order],
+                        ts[order],
+                        np.concatenate([r["values"] for _, r in scored])[order],
+                        # one baseline per metric, or per anomaly for moving detectors
+                        np.concatenate([np.broadcast_to(r["mean"], len(r["ts"])) for _, r in scored])[order],
+                        np.concatenate([np.broadcast_to(r["std"], len(r["ts"])) for _, r in scored])[order],
+                        np.concatenate([r["z"] for _, r in scored])[order],
+                    )
+                self._sorted_ts["anomalies"] = self._anomalies[2].astype("datetime64[us]", copy=False)
+        return self._anomalies
+
+    def _episode_order(self, profile: Profile) -> list[dict]:
+        """Every metric's episodes, ordered by start."""
+        if self._episodes is None:
+            with profile.stage("episodes") as st:
+                results = self._results
+                # episodes of metrics whose first episode starts first win
+                # start-time ties (stable sorts, ties broken by metric_name order)
+                first_episode = sorted(
+                    (name for name, r in results.items() if r["episodes"]),
+                    key=lambda name: results[name]["episodes"][0]["start"],
+                )
+                episodes = [ep for name in first_episode for ep in results[name]["episodes"]]
+                episodes.sort(key=lambda e: e["start"])
+                self._sorted_ts["episodes"] = np.array([ep["start"] for ep in episodes], dtype="datetime64[us]")
+                self._episodes = episodes
+                st.rows = count_anomalies(results)
+                st.objects = len(episodes)
+        return self._episodes
+
+
+def _episode_row(ep: dict) -> dict:
+    """EpisodeOut fields of an episode."""
+    pct = 0.0
+    if ep["baseline_mean"] and abs(ep["baseline_mean"]) > 1e-9:
+        pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
+
+    row = {
+        "metric_name": ep["metric"],
+        "start_ts": ep["start"],
+        "end_ts": ep["end"],
+        "baseline_mean": ep["baseline_mean"],
+        "baseline_std": ep["baseline_std"],
+        "peak_value": ep["max_value"],
+        "peak_z_score": ep["max_abs_z"],
+        "percent_change": round(pct, 2),
+    }
+    if "level_shift" in ep:
+        row["level_shift"] = ep["level_shift"]
+    return row
+
+
+def _likely_causes(
+    episodes: list[dict], episode_starts: np.ndarray, events, profile: Profile, scoring: ScoringConfig
+) -> list[dict]:
+    # ---- 4) compute multi-metric agreement (episode overlap) ----
+    # if latency + error_rate overlap in time, boost: +0.35 per other episode
+    # overlapping this one (closed intervals), capped at 0.6 below (defaults)
+    with profile.stage("agreement") as st:
+        agreement_counts = count_overlaps(
+            episode_starts,
+            np.array([ep["end"] for ep in episodes], dtype="datetime64[us]"),
+        )
+        st.rows = len(episodes)
+        st.objects = sum(agreement_counts) // 2  # overlapping pairs
+
+    # ---- 5) link episodes to events & score causes ----
+    event_prior = scoring.event_priors
+
+    with profile.stage("causes") as st:
+        window = timedelta(seconds=scoring.cause_window_seconds)
+        event_ts = np.array([ev.ts for ev in events], dtype="datetime64[us]")
+
+        # score per event id
+        cause = {}  # ev.id -> dict(score, evidence, event)
+        max_possible = 0.0
+
+        for idx, ep in enumerate(episodes):
+            # severity: cap z so it doesn't explode
+            severity = min(10.0, ep["max_abs_z"]) / 10.0  # 0..1
+            sev_weight = 0.55 + 0.45 * severity  # 0.55..1.0
+
+            agree = min(scoring.agreement_cap, scoring.agreement_bonus * agreement_counts[idx])  # 0..0.6
+            agree_weight = 1.0 + agree  # 1.0..1.6
+
+            # best matching event(s) in window: events are ts-sorted, so the
+            # candidates are one contiguous slice
+            lo, hi = events_within(event_ts, ep["start"], window)
+            for ev in events[lo:hi]:
+                dt = abs(ep["start"] - ev.ts)
+                if dt <= window:
+                    proximity = max(0.0, 1.0 - (dt.total_seconds() / window.total_seconds()))  # 0..1
+                    prior = event_prior.get(ev.event_type, scoring.default_event_prior)
+
+                    # episode contributes:
+                    contrib = proximity * prior * sev_weight * agree_weight
+
+                    max_possible = max(max_possible, contrib)  # for normalization hint (not strict)
+
+                    if ev.id not in cause:
+                        cause[ev.id] = {"score": 0.0, "evidence": [], "event": ev}
+
+                    cause[ev.id]["score"] += contrib
+
+                    pct = 0.0
+                    if ep["baseline_mean"] > 1e-9:
+                        pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
+
+                    cause[ev.id]["evidence"].append(
+                        f"{ep['metric']} abnormal {ep['start'].isoformat()}–{ep['end'].isoformat()}: "
+                        f"{ep['baseline_mean']:.2f} → {ep['max_value']:.2f} ({pct:+.1f}%), "
+                        f"z≈{ep['max_abs_z']:.2f}, event within {int(dt.total_seconds())}s"
+                    )
+        st.rows = len(events)
+        st.objects = len(cause)
+
+    # ---- 6) build response ----
+    # ranked causes (anomalies + episodes are built by IncidentAnalysis)
+    with profile.stage("response"):
+        causes: list[dict] = []
+        if cause:
+            max_score = max(v["score"] for v in cause.values()) or 1.0
+            for v in cause.values():
+                ev = v["event"]
+                conf = v["score"] / max_score
+                causes.append(
+                    {
+                        "event_type": ev.event_type,
+                        "ts": ev.ts,
+                        "meta": ev.meta,
+                        "confidence": round(conf, 3),
+                        "evidence": v["evidence"][:6],
+                    }
+                )
+            causes.sort(key=lambda c: c["confidence"], reverse=True)
+
+    return causes[:5]
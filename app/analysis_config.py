@@ -0,0 +1,110 @@
+"""
+Detection and scoring configuration, from the detector_configs and
+scoring_config tables.
+
+detector_configs holds per-metric rules: metrics whose name matches a rule's
+pattern are analyzed with its parameters (detector, z threshold, minimum
+points, baseline sizing, episode method and gap), the first matching rule
+by position winning; scoring_config holds the cause scoring parameters
+(cause window, agreement bonus, event priors). Anything not set keeps the
+defaults in app/analysis.py, so with both tables empty analyses are what
+they always were.
+
+Every API and worker process keeps the current AnalysisConfig in memory
+(current()) and re-reads both tables every ANALYSIS_CONFIG_RELOAD_SECONDS,
+swapping in a new config when their contents changed: analyses never look
+configuration up themselves. PUT /config/analysis replaces the tables and
+reloads the process that served it at once; the others follow within the
+reload interval. Cached and stored results are keyed by the config's
+version, so none computed under an earlier config are served after a change.
+"""
+import asyncio
+import os
+
+from app import crud, metrics
+from app.analysis import DEFAULT_ANALYSIS_CONFIG, DETECTORS, AnalysisConfig, MetricConfig, ScoringConfig
+from app.schemas import AnalysisConfigOut, DetectorParams, DetectorRule, ScoringParams
+
+ANALYSIS_CONFIG_RELOAD_SECONDS = float(os.getenv("ANALYSIS_CONFIG_RELOAD_SECONDS", "10"))
+
+# (config, rules, settings): the config and the table contents it was built from
+_loaded = (DEFAULT_ANALYSIS_CONFIG, [], {})
+
+
+def current() -> AnalysisConfig:
+    return _loaded[0]
+
+
+def build(rules: list, settings: dict) -> tuple[AnalysisConfig, list, dict]:
+    """
+    (config, rules, settings) from the tables' contents (see
+    crud.load_analysis_config), rules and settings with only their set
+    fields. Raises ValueError on unknown fields, detectors or episode
+    methods, and on baseline sizes that can't work.
+    """
+    metric_rules, given_rules = [], []
+    for pattern, params in rules:
+        given = DetectorParams.model_validate(params).model_dump(exclude_none=True)
+        config = MetricConfig(**given)
+        if config.detector not in DETECTORS:
+            raise ValueError(f"{pattern}: unknown detector {config.detector!r}; expected any of {list(DETECTORS)}")
+        if config.baseline_min_points > config.baseline_max_points:
+            raise ValueError(f"{pattern}: baseline_min_points is above baseline_max_points")
+        if config.min_points <= config.baseline_min_points:
+            raise ValueError(f"{pattern}: min_points must be above baseline_min_points")
+        metric_rules.append((pattern, config))
+        given_rules.append((pattern, given))
+
+    given_settings = ScoringParams.model_validate(settings).model_dump(exclude_none=True)
+    config = AnalysisConfig(metric_rules, ScoringConfig(**given_settings))
+    return config, given_rules, given_settings
+
+
+def install(loaded: tuple[AnalysisConfig, list, dict]) -> bool:
+    """Make a build() result the current config; True if that changed it."""
+    global _loaded
+    if loaded[0].version == current().version:
+        return False
+    _loaded = loaded
+    return True
+
+
+async def reload(conn) -> bool:
+    """Re-read the tables; True if that changed the current config."""
+    return install(build(*await crud.load_analysis_config(conn)))
+
+
+async def load(engine) -> None:
+    """Initial load at process start; a bad row leaves the defaults in place."""
+    try:
+        async with engine.connect() as conn:
+            await reload(conn)
+    except ValueError as e:
+        print(f"analysis config: {e}; using the defaults")
+
+
+async def reload_periodically(engine) -> None:
+    while True:
+        await asyncio.sleep(ANALYSIS_CONFIG_RELOAD_SECONDS)
+        try:
+            async with engine.connect() as conn:
+                changed = await reload(conn)
+        except Exception as e:
+            # database unreachable, or a bad row edited in by hand: keep the
+            # current config and try again next round
+            print(f"analysis config: {type(e).__name__}: {e}")
+            metrics.analysis_config_reloads.labels("failed").inc()
+        else:
+            if changed:
+                print(f"analysis config: now version {current().version}")
+                metrics.analysis_config_reloads.labels("changed").inc()
+
+
+def describe() -> AnalysisConfigOut:
+    config, rules, settings = _loaded
+    return AnalysisConfigOut(
+        version=config.version,
+        detectors=[DetectorRule(pattern=pattern, params=params) for pattern, params in rules],
+        scoring=ScoringParams(**settings),
+        available_detectors=list(DETECTORS),
+    )
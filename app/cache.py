@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+
+from app.db import env_bool
+
+
+# incidents kept in the in-process analysis cache (per worker)
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "128"))
+# also keep the latest result per incident in the analysis_results table,
+# shared by every worker/replica and surviving restarts
+ANALYSIS_CACHE_PERSIST = env_bool("ANALYSIS_CACHE_PERSIST", False)
+
+
+class AnalysisCache:
+    """
+    LRU of analysis results keyed by (incident id, config version, ...).
+
+    Each entry remembers the incident data_version it was computed for and
+    only answers lookups for that exact version, so an ingest that bumps the
+    version invalidates it without any explicit eviction.
+    """
+
+    def __init__(self, maxsize: int = ANALYSIS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (data_version, result)
+        self._lock = threading.Lock()
+
+    def get(self, key, data_version: int):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != data_version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def latest(self, key):
+        """(data_version, value) of whatever is cached under `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, data_version: int, result) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[0] > data_version:
+                return  # a newer result already landed
+            self._entries[key] = (data_version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+analysis_cache = AnalysisCache()
+
+
+class SingleFlight:
+    """
+    At most one run per key at a time in this process: callers arriving while
+    it runs await the same outcome instead of starting their own.
+
+    The run is a task of its own, so a caller going away (a client
+    disconnecting) doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._tasks = {}  # key -> task
+
+    def running(self, key) -> bool:
+        return key in self._tasks
+
+    async def do(self, key, fn):
+        """(outcome of `fn()`, whether this call is the one that ran it)."""
+        task = self._tasks.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._done(key, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task), leader
+
+    def _done(self, key, task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller went away
+
+
+# full analyses running in this process, keyed by
+# (incident_id, config version, data_version)
+analysis_flights = SingleFlight()
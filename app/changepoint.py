@@ -0,0 +1,133 @@
+"""
+Change-point segmentation of one metric's values, for episode boundaries.
+
+The anomaly-chaining episodes (analysis.collapse_episodes) split wherever
+two anomalies are more than EPISODE_GAP apart, so a slow degradation that
+hovers around the threshold comes out as many short episodes. These find
+where the level of the series itself shifts instead:
+
+- "cusum": two-sided tabular CUSUM against the baseline level; an excursion
+  whose cumulative sum crosses CUSUM_H is an episode, from where the sum
+  last left 0 to where it peaked. O(n).
+- "binseg": binary segmentation into constant-mean segments, splitting
+  while the best split reduces the squared error by more than
+  BINSEG_PENALTY x sigma^2 x log(n). Every split is scored for all
+  candidate positions at once from cumulative sums; O(n log n).
+
+Both work in units of the series' noise level (noise_std), estimated from
+point-to-point differences so the level shifts being looked for don't
+inflate it.
+"""
+import math
+
+import numpy as np
+
+# CUSUM slack and decision threshold, in noise std units: k is half the
+# smallest shift worth an episode (2 std); with h = 8 a 2000-point stretch
+# of plain noise practically never raises one
+CUSUM_K = 1.0
+CUSUM_H = 8.0
+# binseg: segments never get shorter than this
+MIN_SEGMENT_POINTS = 5
+BINSEG_PENALTY = 2.0
+
+# median |diff| of normal noise is 0.6745 x sqrt(2) x its std
+_DIFF_MAD_SCALE = 1.4826 / math.sqrt(2.0)
+_DIFF_MEAN_AD_SCALE = 1.2533 / math.sqrt(2.0)
+
+
+def noise_std(values: np.ndarray) -> float:
+    """
+    Std of the noise around the series' level, from the median absolute
+    first difference (mean absolute, if most differences are 0); a level
+    shift is one large difference and barely moves either.
+    """
+    if len(values) < 2:
+        return 0.0
+    diffs = np.abs(np.diff(values))
+    sigma = _DIFF_MAD_SCALE * float(np.median(diffs))
+    if sigma < 1e-9:
+        sigma = _DIFF_MEAN_AD_SCALE * float(diffs.mean())
+    return sigma
+
+
+def _excursions(s: np.ndarray, threshold: float) -> list[tuple[int, int]]:
+    """(first, peak) of every run of s > 0 whose maximum crosses `threshold`."""
+    positive = s > 0
+    edges = np.diff(positive.astype(np.int8), prepend=0, append=0)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if len(starts) == 0:
+        return []
+    crossed = np.maximum.reduceat(s, starts) > threshold
+    return [
+        (a, a + int(np.argmax(s[a:b])))
+        for a, b in zip(starts[crossed].tolist(), ends[crossed].tolist())
+    ]
+
+
+def _cusum_path(u: np.ndarray) -> np.ndarray:
+    """
+    S[i] = max(0, S[i-1] + u[i]) with S[-1] = 0, which is
+    S = C - min(0, running min of C) with C = cumsum(u): a few array passes.
+    """
+    c = np.cumsum(u)
+    return c - np.minimum(np.minimum.accumulate(c), 0.0)
+
+
+def cusum(values: np.ndarray, reference: float, sigma: float, start: int = 0) -> list[tuple[int, int]]:
+    """
+    [first, last] index pairs where the level departs from `reference`,
+    ordered by first. Points before `start` (the baseline) aren't scanned.
+    """
+    z = (values[start:] - reference) / sigma
+    segments = []
+    for u in (z - CUSUM_K, -z - CUSUM_K):
+        s = _cusum_path(u)
+        segments.extend((start + a, start + b) for a, b in _excursions(s, CUSUM_H))
+    return sorted(segments)
+
+
+def binseg(values: np.ndarray, sigma: float) -> list[int]:
+    """Start index of every constant-mean segment after the first, ascending."""
+    n = len(values)
+    penalty = BINSEG_PENALTY * sigma * sigma * math.log(max(n, 2))
+    # centred, so the cumulative sums don't lose digits on large levels
+    cs = np.concatenate(([0.0], np.cumsum(values - values.mean())))
+    splits, pending = [], [(0, n)]
+    while pending:
+        a, b = pending.pop()
+        if b - a < 2 * MIN_SEGMENT_POINTS:
+            continue
+        t = np.arange(a + MIN_SEGMENT_POINTS, b - MIN_SEGMENT_POINTS + 1)
+        left, right = cs[t] - cs[a], cs[b] - cs[t]
+        total = cs[b] - cs[a]
+        # squared error removed by splitting [a, b) at t
+        gain = left * left / (t - a) + right * right / (b - t) - total * total / (b - a)
+        best = int(np.argmax(gain))
+        if gain[best] <= penalty:
+            continue
+        split = int(t[best])
+        splits.append(split)
+        pending.extend(((a, split), (split, b)))
+    return sorted(splits)
+
+
+def binseg_shifts(values: np.ndarray, sigma: float, z_threshold: float) -> tuple[float, list[tuple[int, int]]]:
+    """
+    binseg() segments whose mean is at least `z_threshold` noise stds away
+    from the first segment's: (first segment's mean, [first, last] index
+    pairs), adjacent shifted segments merged.
+    """
+    starts = np.array([0] + binseg(values, sigma))
+    lengths = np.diff(np.append(starts, len(values)))
+    means = np.add.reduceat(values, starts) / lengths
+    reference = float(means[0])
+    shifted = np.abs(means - reference) >= z_threshold * sigma
+    segments = []
+    for i in np.flatnonzero(shifted).tolist():
+        first, last = int(starts[i]), int(starts[i] + lengths[i] - 1)
+        if segments and segments[-1][1] == first - 1:
+            segments[-1] = (segments[-1][0], last)
+        else:
+            segments.append((first, last))
+    return reference, segments
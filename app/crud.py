@@ -0,0 +1,568 @@
+import itertools
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, exc, func, literal_column, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.analysis import SeriesBuilder
+
+
+# rows pulled per round-trip from the server-side cursor
+ANALYSIS_FETCH_CHUNK = 10_000
+
+# rows per INSERT statement on the regular ingest path; 1000 rows x 4 columns
+# stays far below asyncpg's 32767 bind-parameter limit
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+# payloads with at least this many metric points go through COPY in "auto" mode
+INGEST_COPY_THRESHOLD = int(os.getenv("INGEST_COPY_THRESHOLD", "5000"))
+
+# first half of the (ns, hashtext(incident_id)) advisory lock key an analysis
+# holds while computing; any number, as long as every replica uses the same
+_ANALYSIS_LOCK_NS = 0x5167_616E
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    # columns are `timestamp without time zone` and asyncpg refuses aware
+    # datetimes for them, so store everything as naive UTC
+    if ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def get_or_create_incident(db: AsyncSession, header) -> models.Incident:
+    """Look up the incident named by an IncidentIn header, creating it if missing."""
+    incident = None
+    if header.incident_id:
+        incident = await db.get(models.Incident, header.incident_id)
+
+    if incident is None:
+        incident = models.Incident(
+            id=header.incident_id,  # if None, model default will generate uuid
+            name=header.name,
+            source=header.source,
+            meta=header.meta,
+        )
+        db.add(incident)
+        await db.flush()  # ensures incident.id is available
+
+    return incident
+
+
+async def lock_next_version(db: AsyncSession, incident_id: str) -> int:
+    """
+    Lock the incident row for the rest of the transaction and return the
+    data_version this ingest's rows will carry.
+
+    The lock serializes ingests into the same incident, so versions become
+    visible in order and "rows with ingest_version > v" is exactly what was
+    committed after version v.
+    """
+    stmt = (
+        select(models.Incident.data_version)
+        .where(models.Incident.id == incident_id)
+        .with_for_update()
+    )
+    return (await db.execute(stmt)).scalar_one() + 1
+
+
+def ts_range(*rows) -> tuple | None:
+    """(earliest, latest) naive-UTC ts over iterables of MetricIn/EventIn, or None if all are empty."""
+    timestamps = [_naive_utc(r.ts) for group in rows for r in group]
+    if not timestamps:
+        return None
+    return min(timestamps), max(timestamps)
+
+
+def incident_rows_range(incident: models.Incident) -> tuple | None:
+    """The incident's (first_ts, last_ts), for pruning partitions on read; None before its first ingest."""
+    if incident.first_ts is None:
+        return None
+    return incident.first_ts, incident.last_ts
+
+
+def widen_range(current: tuple | None, other: tuple | None) -> tuple | None:
+    if current is None or other is None:
+        return current or other
+    return min(current[0], other[0]), max(current[1], other[1])
+
+
+async def bump_data_version(db: AsyncSession, incident_id: str, rows_range: tuple | None = None) -> None:
+    """
+    Mark the incident's data as changed; cached analyses for older versions stop matching.
+
+    `rows_range` is the (earliest, latest) ts of the rows just ingested; the
+    incident's first_ts/last_ts are widened to cover it.
+    """
+    values = {"data_version": models.Incident.data_version + 1}
+    if rows_range is not None:
+        # LEAST/GREATEST skip NULLs, so the first ingest just sets them
+        values["first_ts"] = func.least(models.Incident.first_ts, rows_range[0])
+        values["last_ts"] = func.greatest(models.Incident.last_ts, rows_range[1])
+    await db.execute(
+        update(models.Incident)
+        .where(models.Incident.id == incident_id)
+        .values(**values)
+    )
+
+
+async def load_analysis_result(db: AsyncSession, incident_id: str, data_version: int, config_version: str):
+    """The persisted analysis JSON for this exact data and config version, or None."""
+    stmt = select(models.AnalysisResult.result).where(
+        models.AnalysisResult.incident_id == incident_id,
+        models.AnalysisResult.data_version == data_version,
+        models.AnalysisResult.config_version == config_version,
+    )
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+async def save_analysis_result(
+    db: AsyncSession, incident_id: str, data_version: int, config_version: str, result: dict
+) -> None:
+    """
+    Upsert the latest analysis for an incident, never replacing a newer data
+    version; the same data version computed with another config replaces it.
+    """
+    stmt = insert(models.AnalysisResult).values(
+        incident_id=incident_id,
+        data_version=data_version,
+        config_version=config_version,
+        result=result,
+        computed_at=datetime.utcnow(),
+    )
+    current = models.AnalysisResult
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["incident_id"],
+        set_={
+            "data_version": stmt.excluded.data_version,
+            "config_version": stmt.excluded.config_version,
+            "result": stmt.excluded.result,
+            "computed_at": stmt.excluded.computed_at,
+        },
+        where=or_(
+            current.data_version < stmt.excluded.data_version,
+            and_(
+                current.data_version == stmt.excluded.data_version,
+                current.config_version.is_distinct_from(stmt.excluded.config_version),
+            ),
+        ),
+    )
+    await db.execute(stmt)
+
+
+async def load_analysis_config(conn) -> tuple[list, dict]:
+    """
+    ([(pattern, params), ...] in position order, {scoring setting: value}):
+    the detector_configs and scoring_config tables.
+    """
+    rules = (
+        await conn.execute(
+            select(models.DetectorConfig.pattern, models.DetectorConfig.params).order_by(models.DetectorConfig.position)
+        )
+    ).all()
+    settings = (await conn.execute(select(models.ScoringSetting.name, models.ScoringSetting.value))).all()
+    return [tuple(rule) for rule in rules], dict(settings)
+
+
+async def replace_analysis_config(db: AsyncSession, rules: list, settings: dict) -> None:
+    """Replace both config tables' contents: `rules` as [(pattern, params), ...], in order."""
+    now = datetime.utcnow()
+    # concurrent replacements queue up here instead of interleaving; reads
+    # (other processes' reloads) aren't blocked
+    await db.execute(text("LOCK TABLE detector_configs, scoring_config IN EXCLUSIVE MODE"))
+    await db.execute(models.DetectorConfig.__table__.delete())
+    await db.execute(models.ScoringSetting.__table__.delete())
+    if rules:
+        await db.execute(
+            insert(models.DetectorConfig),
+            [
+                {"position": position, "pattern": pattern, "params": params, "updated_at": now}
+                for position, (pattern, params) in enumerate(rules)
+            ],
+        )
+    if settings:
+        await db.execute(
+            insert(models.ScoringSetting),
+            [{"name": name, "value": value, "updated_at": now} for name, value in settings.items()],
+        )
+
+
+async def lock_incident_analysis(db: AsyncSession, incident_id: str, timeout_seconds: float) -> str:
+    """
+    Take the incident's analysis advisory lock for `db`'s connection, until
+    unlock_incident_analysis(). It's a session-level lock, so `db` needs a
+    connection of its own that outlives its transactions (a session bound to
+    one); `db`'s transaction is ended either way, so what it reads next is
+    as of after the wait.
+
+    Returns "free" if nobody held it, "waited" if another replica did and
+    released it within `timeout_seconds`, or "timeout" if it didn't; the lock
+    isn't held then.
+    """
+    key = {"ns": _ANALYSIS_LOCK_NS, "incident_id": incident_id}
+    got = (
+        await db.execute(text("SELECT pg_try_advisory_lock(:ns, hashtext(:incident_id))"), key)
+    ).scalar_one()
+    if got:
+        await db.rollback()
+        return "free"
+    await db.execute(text("SELECT set_config('lock_timeout', :t, true)"), {"t": f"{int(timeout_seconds * 1000)}ms"})
+    try:
+        await db.execute(text("SELECT pg_advisory_lock(:ns, hashtext(:incident_id))"), key)
+    except exc.DBAPIError:
+        return "timeout"
+    finally:
+        await db.rollback()
+    return "waited"
+
+
+async def unlock_incident_analysis(db: AsyncSession, incident_id: str) -> None:
+    """Release lock_incident_analysis()'s lock (in a transaction of its own)."""
+    await db.rollback()  # in case an error left the transaction aborted
+    await db.execute(
+        text("SELECT pg_advisory_unlock(:ns, hashtext(:incident_id))"),
+        {"ns": _ANALYSIS_LOCK_NS, "incident_id": incident_id},
+    )
+    await db.rollback()
+
+
+async def enqueue_analysis_job(db: AsyncSession, incident_id: str) -> models.AnalysisJob:
+    """
+    A queued analysis job for the incident; one that hasn't started yet is reused.
+
+    The partial unique index uq_analysis_jobs_queued allows one queued job per
+    incident, so concurrent enqueues can't both insert: the loser's insert does
+    nothing and it returns the winner's job instead.
+    """
+    job = models.AnalysisJob
+    # a literal, not a bind parameter, so Postgres can match the partial index
+    queued = literal_column("'queued'")
+    insert_stmt = (
+        insert(job)
+        .values(id=models.uuid_str(), incident_id=incident_id, status="queued", created_at=datetime.utcnow())
+        .on_conflict_do_nothing(index_elements=[job.incident_id], index_where=job.status == queued)
+        .returning(job)
+    )
+    select_stmt = select(job).where(job.incident_id == incident_id, job.status == queued).limit(1)
+    while True:
+        created = (await db.scalars(insert_stmt)).first()
+        if created is not None:
+            return created
+        existing = (await db.scalars(select_stmt)).first()
+        if existing is not None:
+            return existing
+        # the queued job was claimed between the two statements; insert again
+        insert_stmt = insert_stmt.values(id=models.uuid_str())
+
+
+async def claim_analysis_job(db: AsyncSession, lease_seconds: float):
+    """
+    Mark the oldest runnable job as running and return its (id, incident_id,
+    attempts), or None if there is none.
+
+    Runnable means queued, or running with a heartbeat older than
+    `lease_seconds` (its worker died). FOR UPDATE SKIP LOCKED makes concurrent
+    workers pass over a row another one is claiming instead of waiting on it,
+    so any number of them can poll the same table.
+    """
+    job = models.AnalysisJob
+    now = datetime.utcnow()
+    # statuses as literals, not bind parameters, so even a generic plan of
+    # the prepared statement can use the partial ix_analysis_jobs_pending
+    queued, running = literal_column("'queued'"), literal_column("'running'")
+    candidate = (
+        select(job.id)
+        .where(or_(
+            job.status == queued,
+            and_(job.status == running, job.heartbeat_at < now - timedelta(seconds=lease_seconds)),
+        ))
+        .order_by(job.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(job)
+        .where(job.id == candidate)
+        .values(status="running", attempts=job.attempts + 1, started_at=now, heartbeat_at=now)
+        .returning(job.id, job.incident_id, job.attempts)
+    )
+    return (await db.execute(stmt)).first()
+
+
+async def heartbeat_analysis_job(db: AsyncSession, job_id: str) -> None:
+    await db.execute(
+        update(models.AnalysisJob)
+        .where(models.AnalysisJob.id == job_id, models.AnalysisJob.status == "running")
+        .values(heartbeat_at=datetime.utcnow())
+    )
+
+
+async def finish_analysis_job(
+    db: AsyncSession,
+    job_id: str,
+    status: str,
+    data_version: int | None = None,
+    result: dict | None = None,
+    error: str | None = None,
+) -> None:
+    """Record a job's outcome: status "done" with its result, or "failed" with an error."""
+    await db.execute(
+        update(models.AnalysisJob)
+        .where(models.AnalysisJob.id == job_id)
+        .values(
+            status=status,
+            finished_at=datetime.utcnow(),
+            data_version=data_version,
+            result=result,
+            error=error,
+        )
+    )
+
+
+async def delete_finished_analysis_jobs(db: AsyncSession, older_than: timedelta) -> int:
+    """Delete done/failed jobs (and their result JSON) finished more than `older_than` ago."""
+    job = models.AnalysisJob
+    result = await db.execute(
+        job.__table__.delete().where(
+            job.status.in_(["done", "failed"]),
+            job.finished_at < datetime.utcnow() - older_than,
+        )
+    )
+    return result.rowcount or 0
+
+
+async def load_metric_series(
+    db: AsyncSession,
+    incident_id: str,
+    since_version: int | None = None,
+    metric_names: list[str] | None = None,
+    chunk_size: int = ANALYSIS_FETCH_CHUNK,
+    rows_range: tuple | None = None,
+) -> dict:
+    """
+    Load an incident's points as {metric_name: (ts, values)} arrays.
+
+    Only the three columns analysis needs are selected (no ORM hydration), and
+    rows are streamed from a server-side cursor in `chunk_size` partitions that
+    are folded into arrays as they arrive. `since_version` limits it to rows
+    ingested after that data_version, `metric_names` to those metrics.
+    `rows_range` (the incident's first_ts/last_ts) lets Postgres skip the
+    partitions outside it.
+    """
+    stmt = (
+        select(
+            models.MetricSeries.name,
+            models.MetricPoint.ts,
+            models.MetricPoint.value,
+        )
+        .join(models.MetricPoint, models.MetricPoint.series_id == models.MetricSeries.id)
+        .where(models.MetricSeries.incident_id == incident_id)
+        .order_by(models.MetricSeries.name, models.MetricPoint.ts)
+    )
+    if since_version is not None:
+        stmt = stmt.where(models.MetricPoint.ingest_version > since_version)
+    if metric_names is not None:
+        stmt = stmt.where(models.MetricSeries.name.in_(metric_names))
+    if rows_range is not None:
+        stmt = stmt.where(models.MetricPoint.ts.between(*rows_range))
+    builder = SeriesBuilder()
+    result = await db.stream(stmt, execution_options={"yield_per": chunk_size})
+    async for partition in result.partitions():
+        builder.extend(partition)
+    return builder.build()
+
+
+async def load_events(db: AsyncSession, incident_id: str, rows_range: tuple | None = None) -> list:
+    """
+    An incident's events as (id, ts, event_type, meta) rows, ordered by ts.
+
+    `rows_range` prunes partitions, as for load_metric_series.
+    """
+    stmt = (
+        select(
+            models.Event.id,
+            models.Event.ts,
+            models.Event.event_type,
+            models.Event.meta,
+        )
+        .where(models.Event.incident_id == incident_id)
+        .order_by(models.Event.ts)
+    )
+    if rows_range is not None:
+        stmt = stmt.where(models.Event.ts.between(*rows_range))
+    return (await db.execute(stmt)).all()
+
+
+def _chunks(items, size: int):
+    it = iter(items)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+async def resolve_metric_series(db: AsyncSession, incident_id: str, names, chunk_size: int = INGEST_CHUNK_SIZE) -> dict:
+    """
+    {name: series id} for an incident's metric names, creating the missing
+    metric_series rows.
+
+    Names that already exist cost one SELECT per chunk; new ones one more
+    INSERT ... ON CONFLICT DO NOTHING RETURNING. Ingest holds the incident row
+    lock (lock_next_version), so concurrent ingests can't race on new names.
+    """
+    ids = {}
+    for chunk in _chunks(sorted(set(names)), chunk_size):
+        stmt = select(models.MetricSeries.name, models.MetricSeries.id).where(
+            models.MetricSeries.incident_id == incident_id,
+            models.MetricSeries.name.in_(chunk),
+        )
+        ids.update((await db.execute(stmt)).all())
+        missing = [name for name in chunk if name not in ids]
+        if missing:
+            stmt = (
+                insert(models.MetricSeries)
+                .values([{"incident_id": incident_id, "name": name} for name in missing])
+                .on_conflict_do_nothing(index_elements=["incident_id", "name"])
+                .returning(models.MetricSeries.name, models.MetricSeries.id)
+            )
+            ids.update((await db.execute(stmt)).all())
+    return ids
+
+
+async def insert_metric_points(
+    db: AsyncSession,
+    incident_id: str,
+    metrics,
+    ingest_version: int,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    series_ids: dict | None = None,
+) -> int:
+    """
+    Insert metric points as one multi-VALUES statement per chunk of `chunk_size` rows.
+
+    Duplicates on (series_id, ts) are skipped; returns the number of rows
+    actually inserted. Only one chunk's worth of row dicts exists at a time, so
+    memory stays flat regardless of payload size. `series_ids` is a
+    {name: series id} cache, filled in place, for callers inserting the same
+    incident's points over several calls.
+    """
+    if series_ids is None:
+        series_ids = {}
+    inserted = 0
+    for chunk in _chunks(metrics, chunk_size):
+        new_names = {m.metric_name for m in chunk} - series_ids.keys()
+        if new_names:
+            series_ids.update(await resolve_metric_series(db, incident_id, new_names))
+        stmt = insert(models.MetricPoint).values([
+            {
+                "series_id": series_ids[m.metric_name],
+                "ingest_version": ingest_version,
+                "ts": _naive_utc(m.ts),
+                "value": m.value,
+            }
+            for m in chunk
+        ]).on_conflict_do_nothing(
+            index_elements=["series_id", "ts"]
+        )
+        inserted += (await db.execute(stmt)).rowcount or 0
+    return inserted
+
+
+async def insert_events(db: AsyncSession, incident_id: str, events, chunk_size: int = INGEST_CHUNK_SIZE) -> int:
+    """Same as insert_metric_points, for events (deduped on (incident_id, ts, event_type))."""
+    inserted = 0
+    for chunk in _chunks(events, chunk_size):
+        stmt = insert(models.Event).values([
+            {
+                "incident_id": incident_id,
+                "ts": _naive_utc(e.ts),
+                "event_type": e.event_type,
+                "meta": e.meta,
+            }
+            for e in chunk
+        ]).on_conflict_do_nothing(
+            index_elements=["incident_id", "ts", "event_type"]
+        )
+        inserted += (await db.execute(stmt)).rowcount or 0
+    return inserted
+
+
+async def _copy_into_staging(db: AsyncSession, staging_ddl: str, table: str, columns: list[str], records) -> None:
+    # staging tables are per-transaction temp tables, dropped on commit/rollback
+    await db.execute(text(staging_ddl))
+    conn = await db.connection()
+    raw = await conn.get_raw_connection()
+    # asyncpg pulls `records` lazily and streams them in binary COPY format,
+    # inside the transaction SQLAlchemy already opened on this connection
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def copy_metric_points(db: AsyncSession, incident_id: str, metrics, ingest_version: int) -> int:
+    """
+    Bulk-load metric points with COPY FROM STDIN, then merge into metric_points.
+
+    Keeps the ON CONFLICT DO NOTHING semantics of the regular insert path and
+    returns the number of rows actually inserted.
+    """
+    if not metrics:
+        return 0
+    await _copy_into_staging(
+        db,
+        "CREATE TEMP TABLE metric_points_stage "
+        "(ts timestamp NOT NULL, metric_name text NOT NULL, value double precision NOT NULL) "
+        "ON COMMIT DROP",
+        "metric_points_stage",
+        ["ts", "metric_name", "value"],
+        ((_naive_utc(m.ts), m.metric_name, m.value) for m in metrics),
+    )
+    # dictionary-encode the names: register new ones, then swap names for ids
+    # in the merge
+    await db.execute(
+        text(
+            "INSERT INTO metric_series (incident_id, name) "
+            "SELECT DISTINCT :incident_id, metric_name FROM metric_points_stage "
+            "ON CONFLICT (incident_id, name) DO NOTHING"
+        ),
+        {"incident_id": incident_id},
+    )
+    result = await db.execute(
+        text(
+            "INSERT INTO metric_points (series_id, ingest_version, ts, value) "
+            "SELECT s.id, :ingest_version, st.ts, st.value "
+            "FROM metric_points_stage st "
+            "JOIN metric_series s ON s.incident_id = :incident_id AND s.name = st.metric_name "
+            "ON CONFLICT (series_id, ts) DO NOTHING"
+        ),
+        {"incident_id": incident_id, "ingest_version": ingest_version},
+    )
+    return result.rowcount or 0
+
+
+async def copy_events(db: AsyncSession, incident_id: str, events) -> int:
+    """Same as copy_metric_points, for events (merged on (incident_id, ts, event_type))."""
+    if not events:
+        return 0
+    await _copy_into_staging(
+        db,
+        "CREATE TEMP TABLE events_stage "
+        "(ts timestamp NOT NULL, event_type text NOT NULL, metadata json) "
+        "ON COMMIT DROP",
+        "events_stage",
+        ["ts", "event_type", "metadata"],
+        (
+            (_naive_utc(e.ts), e.event_type, None if e.meta is None else json.dumps(e.meta))
+            for e in events
+        ),
+    )
+    result = await db.execute(
+        text(
+            "INSERT INTO events (incident_id, ts, event_type, metadata) "
+            "SELECT :incident_id, ts, event_type, metadata "
+            "FROM events_stage "
+            "ON CONFLICT (incident_id, ts, event_type) DO NOTHING"
+        ),
+        {"incident_id": incident_id},
+    )
+    return result.rowcount or 0
@@ -0,0 +1,197 @@
+import os
+
+import numpy as np
+
+from app.analysis import (
+    DEFAULT_ANALYSIS_CONFIG,
+    DEFAULT_EPISODE_METHOD,
+    DEFAULT_METRIC_CONFIG,
+    DETECTORS,
+    AnalysisConfig,
+    MetricConfig,
+    analyze_metric,
+    analyze_metrics,
+    baseline_size,
+    collapse_episodes,
+    detect_moving_anomalies,
+)
+from app.cache import AnalysisCache
+from app.db import env_bool
+
+
+# reuse per-metric state between analyses and only score newly ingested points
+ANALYSIS_INCREMENTAL = env_bool("ANALYSIS_INCREMENTAL", True)
+# incidents whose incremental state is kept in memory (per worker)
+ANALYSIS_STATE_CACHE_SIZE = int(os.getenv("ANALYSIS_STATE_CACHE_SIZE", "128"))
+
+_NOT_ANALYZED = object()
+
+
+class MetricState:
+    """
+    Detection state for one metric, analyzed with `config`.
+
+    While the series is short its baseline window still grows with every new
+    point, so the raw arrays are kept and the metric is re-analyzed in full.
+    Once baseline_size() reaches baseline_max_points the baseline is the
+    first 30 points (by default) forever (as long as nothing is backfilled
+    before `last_ts`), so only the baseline mean/std, the anomalies and the
+    episodes are kept and new points are scored against them directly.
+
+    Moving detectors (ewma / rolling / rolling_median) only ever look at
+    earlier points, so they freeze as soon as the metric is long enough to be
+    scored: new points continue the scan from the detector's `carry`.
+    Change-point episodes depend on the whole series, so metrics configured
+    with those never freeze.
+    """
+
+    __slots__ = ("n", "last_ts", "ts", "values", "result", "config")
+
+    def __init__(self, n, last_ts, ts, values, result, config=DEFAULT_METRIC_CONFIG):
+        self.n = n
+        self.last_ts = last_ts
+        self.ts = ts            # full arrays, only while the baseline isn't frozen
+        self.values = values
+        self.result = result    # analyze_metric() output, or None if not scorable
+        self.config = config
+
+    @property
+    def frozen(self) -> bool:
+        return self.ts is None
+
+    @classmethod
+    def from_arrays(
+        cls,
+        metric_name: str,
+        ts: np.ndarray,
+        values: np.ndarray,
+        result=_NOT_ANALYZED,
+        config: MetricConfig = DEFAULT_METRIC_CONFIG,
+    ) -> "MetricState":
+        """State for a complete series; pass `result` if analyze_metric() already ran on it."""
+        n = len(values)
+        if result is _NOT_ANALYZED:
+            result = analyze_metric(metric_name, ts, values, config)
+        if config.episode_method != DEFAULT_EPISODE_METHOD:
+            frozen = False
+        elif DETECTORS[config.detector].moving:
+            frozen = result is not None
+        else:
+            frozen = n >= config.min_points and baseline_size(n, config) == config.baseline_max_points
+        if frozen:
+            return cls(n, ts[-1], None, None, result, config)
+        return cls(n, ts[-1], ts, values, result, config)
+
+    def extend(self, metric_name: str, ts: np.ndarray, values: np.ndarray) -> "MetricState":
+        """New state with points appended; unfrozen metrics only (any ts order)."""
+        all_ts = np.concatenate([self.ts, ts])
+        all_values = np.concatenate([self.values, values])
+        if ts[0] <= self.last_ts:
+            order = np.argsort(all_ts, kind="stable")
+            all_ts, all_values = all_ts[order], all_values[order]
+        return MetricState.from_arrays(metric_name, all_ts, all_values, config=self.config)
+
+    def append_frozen(self, metric_name: str, ts: np.ndarray, values: np.ndarray) -> "MetricState":
+        """New state with points strictly after last_ts scored against the frozen baseline."""
+        n = self.n + len(values)
+        r, config = self.result, self.config
+        if r is None:
+            # flat baseline: nothing after it can ever be scored
+            return MetricState(n, ts[-1], None, None, None, config)
+
+        carry = None
+        if DETECTORS[config.detector].moving:
+            hits, a_mean, a_std, a_z, carry = detect_moving_anomalies(values, config, r["carry"])
+        else:
+            mean, std = r["mean"], r["std"]
+            z = (values - mean) / std
+            hits = np.flatnonzero(np.abs(z) >= config.z_threshold)
+            a_mean, a_std, a_z = mean, std, z[hits]
+        if len(hits) == 0:
+            if carry is not None:
+                r = dict(r, carry=carry)
+            return MetricState(n, ts[-1], None, None, r, config)
+
+        a_ts, a_values = ts[hits], values[hits]
+        episodes = list(r["episodes"])
+        new_episodes = collapse_episodes(metric_name, a_ts, a_values, a_z, a_mean, a_std, config.episode_gap)
+        if episodes and new_episodes[0]["start"] - episodes[-1]["end"] <= config.episode_gap.item():
+            # first new anomaly continues the open episode
+            head = new_episodes.pop(0)
+            last = dict(episodes[-1])
+            last["end"] = head["end"]
+            last["max_abs_z"] = max(last["max_abs_z"], head["max_abs_z"])
+            last["max_value"] = max(last["max_value"], head["max_value"])
+            episodes[-1] = last
+        episodes.extend(new_episodes)
+
+        result = {
+            "ts": np.concatenate([r["ts"], a_ts]),
+            "values": np.concatenate([r["values"], a_values]),
+            "z": np.concatenate([r["z"], a_z]),
+            "mean": r["mean"],
+            "std": r["std"],
+            "episodes": episodes,
+        }
+        if carry is not None:
+            result["mean"] = np.concatenate([r["mean"], a_mean])
+            result["std"] = np.concatenate([r["std"], a_std])
+            result["carry"] = carry
+        return MetricState(n, ts[-1], None, None, result, config)
+
+
+class IncidentState:
+    """Per-metric detection state for an incident as of `data_version`."""
+
+    def __init__(self, data_version: int, metrics: dict):
+        self.data_version = data_version
+        self.metrics = metrics  # metric_name -> MetricState, in metric_name (DB) order
+
+    @classmethod
+    def from_series(cls, data_version: int, series: dict, config: AnalysisConfig | None = None) -> "IncidentState":
+        config = config or DEFAULT_ANALYSIS_CONFIG
+        results = analyze_metrics(series, config=config)
+        return cls(
+            data_version,
+            {
+                name: MetricState.from_arrays(name, ts, values, results[name], config.for_metric(name))
+                for name, (ts, values) in series.items()
+            },
+        )
+
+    def can_advance(self, delta: dict) -> bool:
+        # a brand-new metric has to be slotted into the DB's metric_name order
+        # (collation-dependent), so fall back to a full analysis for it
+        return all(name in self.metrics for name in delta)
+
+    def needs_refetch(self, delta: dict) -> list[str]:
+        """Frozen metrics that got points at or before their last_ts (backfill)."""
+        return [
+            name for name, (ts, _) in delta.items()
+            if self.metrics[name].frozen and ts[0] <= self.metrics[name].last_ts
+        ]
+
+    def advance(self, data_version: int, delta: dict, refetched: dict) -> "IncidentState":
+        """
+        New state with `delta` (points ingested since self.data_version) applied.
+
+        `refetched` holds the complete series of every metric returned by
+        needs_refetch(); those are rebuilt from scratch.
+        """
+        metrics = dict(self.metrics)
+        for name, (ts, values) in delta.items():
+            state = metrics[name]
+            if name in refetched:
+                metrics[name] = MetricState.from_arrays(name, *refetched[name], config=state.config)
+            elif state.frozen:
+                metrics[name] = state.append_frozen(name, ts, values)
+            else:
+                metrics[name] = state.extend(name, ts, values)
+        return IncidentState(data_version, metrics)
+
+    def results(self) -> dict:
+        """analyze_metric() results in metric_name order, as score_incident() expects."""
+        return {name: m.result for name, m in self.metrics.items() if m.result is not None}
+
+
+incremental_states = AnalysisCache(ANALYSIS_STATE_CACHE_SIZE)
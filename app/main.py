@@ -1,36 +1,94 @@
 
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy.dialects.postgresql import insert
-
-from app.db import SessionLocal, engine
-from app import models
-from app.schemas import IngestRequest, IngestResponse
-
-from collections import defaultdict
-from datetime import timedelta
-import math
-
-from app.schemas import AnalysisResponse, AnomalyOut, CauseOut, EpisodeOut
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import SessionLocal, engine, pool_stats
+from app import analysis_config, crud, models, partitions
+from app.analysis import DETECTORS, SECTIONS, IncidentAnalysis, Page, View
+from app.cache import analysis_cache, analysis_flights
+from app import metrics
+from app.pipeline import analyze_latest
+from app.profiling import Profile, stage_histograms
+from app.responses import ModelJSONResponse, render_json
+from app.schemas import EventIn, IncidentIn, IngestRequest, IngestResponse, MetricIn
+
+from typing import Literal
+from datetime import datetime
+import asyncio
+import json
+import time
+
+from app.schemas import AnalysisConfigIn, AnalysisConfigOut, AnalysisJobOut, AnalysisResponse
 
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # --- DB session per request ---
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def _collect_process_metrics() -> dict:
+    # pool and cache state lives on their own objects; read it at scrape time
+    stats = pool_stats()
+    gauge = lambda help, value: {"help": help, "type": "gauge", "labelnames": [], "samples": [[[], value]]}
+    counter = lambda help, value: {"help": help, "type": "counter", "labelnames": [], "samples": [[[], value]]}
+    return {
+        "sig_db_pool_size": gauge("Configured pool size", stats["size"]),
+        "sig_db_pool_checked_out": gauge("Connections in use", stats["checked_out"]),
+        "sig_db_pool_checked_in": gauge("Idle connections in the pool", stats["checked_in"]),
+        "sig_db_pool_overflow": gauge("Connections open beyond pool_size", stats["overflow"]),
+        "sig_db_pool_waits_total": counter("Checkouts that found the pool exhausted", stats["waits"]),
+        "sig_db_pool_wait_seconds_total": counter("Time spent waiting for a connection", stats["wait_seconds"]),
+        "sig_db_pool_timeouts_total": counter("Checkouts that gave up after pool_timeout", stats["timeouts"]),
+        "sig_analysis_cache_lookups_total": {
+            "help": "In-memory analysis cache lookups by result",
+            "type": "counter",
+            "labelnames": ["result"],
+            "samples": [[["hit"], analysis_cache.hits], [["miss"], analysis_cache.misses]],
+        },
+    }
+
+
+metrics.registry.add_collector(_collect_process_metrics)
 
 
 @app.on_event("startup")
-def startup():
+async def startup():
     # check that DB is reachable
-    with engine.connect() as conn:
+    async with engine.connect() as conn:
         print("✅ Database connection successful")
+        await partitions.load_known(conn)
+
+    # detection config, kept up to date from the database from here on
+    await analysis_config.load(engine)
+    app.state.config_reload = asyncio.create_task(analysis_config.reload_periodically(engine))
+
+    # this month's and next month's partitions exist before any ingest needs them
+    now = datetime.utcnow()
+    upcoming = [now, partitions.next_month(partitions.month_start(now))]
+    await partitions.ensure_committed(engine, {table: upcoming for table in partitions.PARTITIONED_TABLES})
+    if partitions.PARTITION_RETENTION_DAYS:
+        app.state.retention = asyncio.create_task(partitions.retention_periodically(engine))
+
+    if metrics.METRICS_MULTIPROC_DIR:
+        metrics.write_snapshot()
+        app.state.metrics_flush = asyncio.create_task(metrics.flush_periodically())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.config_reload.cancel()
+    if partitions.PARTITION_RETENTION_DAYS:
+        app.state.retention.cancel()
+    if metrics.METRICS_MULTIPROC_DIR:
+        app.state.metrics_flush.cancel()
+        metrics.write_snapshot()  # final totals, kept after this worker exits
 
 
 @app.get("/health")
@@ -38,83 +96,73 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics/pool")
+def metrics_pool():
+    # connection pool state for this process, for sizing pools per replica
+    return pool_stats()
+
+
+@app.get("/metrics/analysis")
+def metrics_analysis():
+    # per-stage wall time histograms for analyses computed by this process
+    return {"stage_seconds": stage_histograms()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    # all workers' metrics when METRICS_MULTIPROC_DIR is set, else this process'
+    return PlainTextResponse(
+        metrics.render(metrics.collect()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _record_ingest(route: str, metrics_total: int, metrics_inserted: int, events_total: int, events_inserted: int):
+    metrics.ingest_rows.labels("metric", "inserted").inc(metrics_inserted)
+    metrics.ingest_rows.labels("metric", "conflicted").inc(metrics_total - metrics_inserted)
+    metrics.ingest_rows.labels("event", "inserted").inc(events_inserted)
+    metrics.ingest_rows.labels("event", "conflicted").inc(events_total - events_inserted)
+    metrics.ingest_payload_rows.labels(route).observe(metrics_total + events_total)
+
+
 @app.post("/ingest", response_model=IngestResponse)
-def ingest(payload: IngestRequest, db: Session = Depends(get_db)):
+async def ingest(
+    payload: IngestRequest,
+    mode: Literal["auto", "insert", "copy"] = "auto",
+    db: AsyncSession = Depends(get_db),
+):
     try:
-        # 1) Find or create the incident
-        incident = None
-        if payload.incident_id:
-            incident = db.get(models.Incident, payload.incident_id)
-
-        if incident is None:
-            incident = models.Incident(
-                id=payload.incident_id,  # if None, model default will generate uuid
-                name=payload.name,
-                source=payload.source,
-                meta=payload.meta,
-            )
-            db.add(incident)
-            db.flush()  # ensures incident.id is available
-
-        # 2) Insert metric points
-        metric_rows = [
-            models.MetricPoint(
-                incident_id=incident.id,
-                ts=m.ts,
-                metric_name=m.metric_name,
-                value=m.value,
-            )
-            for m in payload.metrics
-        ]
-
-        # 3) Insert events
-        event_rows = [
-            models.Event(
-                incident_id=incident.id,
-                ts=e.ts,
-                event_type=e.event_type,
-                meta=e.meta,
-            )
-            for e in payload.events
-        ]
-
-        # --- bulk insert metrics with ON CONFLICT DO NOTHING ---
-        if metric_rows:
-            stmt = insert(models.MetricPoint).values([
-                {
-                    "incident_id": incident.id,
-                    "ts": m.ts,
-                    "metric_name": m.metric_name,
-                    "value": m.value,
-                }
-                for m in payload.metrics
-            ]).on_conflict_do_nothing(
-                index_elements=["incident_id", "ts", "metric_name"]
-            )
-            result_metrics = db.execute(stmt)
-            metrics_inserted = result_metrics.rowcount or 0
-        else:
-            metrics_inserted = 0
-
-        # --- bulk insert events with ON CONFLICT DO NOTHING ---
-        if event_rows:
-            stmt = insert(models.Event).values([
-                {
-                    "incident_id": incident.id,
-                    "ts": e.ts,
-                    "event_type": e.event_type,
-                    "meta": e.meta,
-                }
-                for e in payload.events
-            ]).on_conflict_do_nothing(
-                index_elements=["incident_id", "ts", "event_type"]
-            )
-            result_events = db.execute(stmt)
-            events_inserted = result_events.rowcount or 0
+        # 0) Partitions for the payload's months, in their own transaction:
+        # a new partition stays locked until commit
+        metrics_range = crud.ts_range(payload.metrics)
+        events_range = crud.ts_range(payload.events)
+        await partitions.ensure_committed(
+            engine, {"metric_points": metrics_range or (), "events": events_range or ()}
+        )
+
+        # 1) Find or create the incident (and lock it until commit)
+        incident = await crud.get_or_create_incident(db, payload)
+        ingest_version = await crud.lock_next_version(db, incident.id)
+
+        # 2) Insert metric points + events (ON CONFLICT DO NOTHING)
+        # big payloads stream through COPY into staging tables and merge from there;
+        # otherwise rows go out as chunked multi-VALUES inserts
+        use_copy = mode == "copy" or (
+            mode == "auto" and len(payload.metrics) >= crud.INGEST_COPY_THRESHOLD
+        )
+        if use_copy:
+            metrics_inserted = await crud.copy_metric_points(db, incident.id, payload.metrics, ingest_version)
+            events_inserted = await crud.copy_events(db, incident.id, payload.events)
         else:
-            events_inserted = 0
+            metrics_inserted = await crud.insert_metric_points(db, incident.id, payload.metrics, ingest_version)
+            events_inserted = await crud.insert_events(db, incident.id, payload.events)
+
+        # 3) Invalidate cached analyses (same transaction as the rows)
+        if metrics_inserted or events_inserted:
+            await crud.bump_data_version(db, incident.id, crud.widen_range(metrics_range, events_range))
 
-        db.commit()
+        await db.commit()
+        _record_ingest("/ingest", len(payload.metrics), metrics_inserted, len(payload.events), events_inserted)
 
         return IngestResponse(
             incident_id=incident.id,
@@ -123,219 +171,295 @@ def ingest(payload: IngestRequest, db: Session = Depends(get_db)):
         )
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/analysis/{incident_id}", response_model=AnalysisResponse)
-def analyze_incident(incident_id: str, db: Session = Depends(get_db)):
-    incident = db.get(models.Incident, incident_id)
-    if incident is None:
-        raise HTTPException(status_code=404, detail="Incident not found")
+# a single NDJSON record can't be larger than this (keeps /ingest/stream bounded)
+MAX_NDJSON_LINE_BYTES = 1024 * 1024
 
-    metric_points = (
-        db.query(models.MetricPoint)
-        .filter(models.MetricPoint.incident_id == incident_id)
-        .order_by(models.MetricPoint.metric_name, models.MetricPoint.ts)
-        .all()
-    )
-    events = (
-        db.query(models.Event)
-        .filter(models.Event.incident_id == incident_id)
-        .order_by(models.Event.ts)
-        .all()
-    )
-
-    # ---- 1) group points by metric ----
-    by_metric = defaultdict(list)
-    for mp in metric_points:
-        by_metric[mp.metric_name].append(mp)
-
-    # ---- 2) detect point anomalies (z-score vs baseline) ----
-    point_anoms: list[AnomalyOut] = []
-    z_threshold = 3.0
-
-    for metric_name, pts in by_metric.items():
-        if len(pts) < 12:
-            continue
-
-        baseline_n = min(30, max(10, len(pts) // 4))
-        baseline = pts[:baseline_n]
-
-        mean = sum(p.value for p in baseline) / len(baseline)
-        var = sum((p.value - mean) ** 2 for p in baseline) / len(baseline)
-        std = math.sqrt(var)
-        if std < 1e-9:
-            continue
-
-        for p in pts[baseline_n:]:
-            z = (p.value - mean) / std
-            if abs(z) >= z_threshold:
-                point_anoms.append(
-                    AnomalyOut(
-                        metric_name=metric_name,
-                        ts=p.ts,
-                        value=p.value,
-                        baseline_mean=mean,
-                        baseline_std=std,
-                        z_score=z,
-                    )
-                )
-
-    point_anoms.sort(key=lambda a: a.ts)
-
-    # ---- 3) collapse anomalies into "episodes" per metric ----
-    # If anomalies are within 2 minutes, treat as one episode.
-    episode_gap = timedelta(minutes=2)
-
-    episodes = []  # each: dict(metric, start, end, max_abs_z, mean, std, max_value)
-    by_metric_anoms = defaultdict(list)
-    for a in point_anoms:
-        by_metric_anoms[a.metric_name].append(a)
-
-    for metric_name, anoms in by_metric_anoms.items():
-        current = None
-        for a in anoms:
-            if current is None:
-                current = {
-                    "metric": metric_name,
-                    "start": a.ts,
-                    "end": a.ts,
-                    "max_abs_z": abs(a.z_score),
-                    "baseline_mean": a.baseline_mean,
-                    "baseline_std": a.baseline_std,
-                    "max_value": a.value,
-                }
-                continue
 
-            if a.ts - current["end"] <= episode_gap:
-                current["end"] = a.ts
-                current["max_abs_z"] = max(current["max_abs_z"], abs(a.z_score))
-                current["max_value"] = max(current["max_value"], a.value)
-            else:
-                episodes.append(current)
-                current = {
-                    "metric": metric_name,
-                    "start": a.ts,
-                    "end": a.ts,
-                    "max_abs_z": abs(a.z_score),
-                    "baseline_mean": a.baseline_mean,
-                    "baseline_std": a.baseline_std,
-                    "max_value": a.value,
-                }
-        if current is not None:
-            episodes.append(current)
-
-    episodes.sort(key=lambda e: e["start"])
-
-    episodes_out: list[EpisodeOut] = []
-
-    for ep in episodes:
-        pct = 0.0
-        if ep["baseline_mean"] and abs(ep["baseline_mean"]) > 1e-9:
-            pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
-
-        episodes_out.append(
-            EpisodeOut(
-                metric_name=ep["metric"],  # <-- FIXED comma issue
-                start_ts=ep["start"],
-                end_ts=ep["end"],
-                baseline_mean=ep["baseline_mean"],
-                baseline_std=ep["baseline_std"],
-                peak_value=ep["max_value"],
-                peak_z_score=ep["max_abs_z"],
-                percent_change=round(pct, 2),
-            )
-        )
+async def _ndjson_lines(request: Request):
+    buf = b""
+    async for chunk in request.stream():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        if len(buf) > MAX_NDJSON_LINE_BYTES:
+            raise HTTPException(status_code=413, detail="NDJSON line too long")
+        for line in lines:
+            yield line
+    if buf:
+        yield buf
 
-    # ---- 4) compute multi-metric agreement (episode overlap) ----
-    # if latency + error_rate overlap in time, boost.
-    def overlaps(a_start, a_end, b_start, b_end) -> bool:
-        return not (a_end < b_start or b_end < a_start)
 
-    agreement_bonus = defaultdict(float)  # episode_index -> bonus
-    for i, e1 in enumerate(episodes):
-        for j, e2 in enumerate(episodes):
-            if i >= j:
-                continue
-            if overlaps(e1["start"], e1["end"], e2["start"], e2["end"]):
-                # simple: boost both
-                agreement_bonus[i] += 0.35
-                agreement_bonus[j] += 0.35
-
-    # ---- 5) link episodes to events & score causes ----
-    # event priors (feel free to tweak later)
-    event_prior = {
-        "deploy": 1.00,
-        "config_change": 0.85,
-        "feature_flag": 0.75,
-        "db_migration": 0.80,
-        "incident_note": 0.50,
-    }
-
-    window = timedelta(minutes=10)
+def _parse_ndjson_line(line: bytes, lineno: int, header: bool = False):
+    try:
+        obj = json.loads(line)
+        if not isinstance(obj, dict):
+            raise HTTPException(status_code=422, detail=f"line {lineno}: expected a JSON object")
+        if header:
+            # IncidentIn ignores unknown keys, so a record would pass as a
+            # header and be dropped into a fresh incident
+            if "metric_name" in obj or "event_type" in obj:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"line {lineno}: expected the incident header first, got a metric or event record",
+                )
+            return IncidentIn.model_validate(obj)
+        if "metric_name" in obj:
+            return MetricIn.model_validate(obj)
+        if "event_type" in obj:
+            return EventIn.model_validate(obj)
+    except ValueError as e:  # json.JSONDecodeError and pydantic.ValidationError
+        raise HTTPException(status_code=422, detail=f"line {lineno}: {e}")
+
+    raise HTTPException(
+        status_code=422,
+        detail=f"line {lineno}: expected a metric (metric_name) or event (event_type) record",
+    )
 
-    # score per event id
-    cause = {}  # ev.id -> dict(score, evidence, event)
-    max_possible = 0.0
 
-    for idx, ep in enumerate(episodes):
-        # severity: cap z so it doesn't explode
-        severity = min(10.0, ep["max_abs_z"]) / 10.0  # 0..1
-        sev_weight = 0.55 + 0.45 * severity  # 0.55..1.0
+@app.post("/ingest/stream", response_model=IngestResponse)
+async def ingest_stream(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Ingest newline-delimited JSON without buffering the whole body.
+
+    The first line is the incident header (incident_id/name/source/meta), every
+    following line is a metric or event record, interleaved in any order.
+    Records are validated as they arrive and inserted every INGEST_CHUNK_SIZE
+    rows; everything commits together at the end.
+    """
+    incident_id = None
+    metrics: list[MetricIn] = []
+    events: list[EventIn] = []
+    metrics_inserted = 0
+    events_inserted = 0
+    metrics_total = 0
+    events_total = 0
+    series_ids = {}  # metric name -> series id, shared by every chunk
+    created = set()  # partitions created in this transaction (see ensure_during)
+    rows_range = None
+
+    async def flush_metrics(chunk) -> int:
+        nonlocal rows_range
+        chunk_range = crud.ts_range(chunk)
+        rows_range = crud.widen_range(rows_range, chunk_range)
+        # rows arrive as we go, so a new month's partition is created when
+        # the first chunk with rows in it does; see ensure_during
+        await partitions.ensure_during(engine, db, "metric_points", chunk_range or (), created)
+        return await crud.insert_metric_points(db, incident_id, chunk, ingest_version, series_ids=series_ids)
+
+    async def flush_events(chunk) -> int:
+        nonlocal rows_range
+        chunk_range = crud.ts_range(chunk)
+        rows_range = crud.widen_range(rows_range, chunk_range)
+        await partitions.ensure_during(engine, db, "events", chunk_range or (), created)
+        return await crud.insert_events(db, incident_id, chunk)
 
-        agree = min(0.6, agreement_bonus.get(idx, 0.0))  # 0..0.6
-        agree_weight = 1.0 + agree  # 1.0..1.6
+    try:
+        lineno = 0
+        async for line in _ndjson_lines(request):
+            lineno += 1
+            if not line.strip():
+                continue
 
-        # best matching event(s) in window
-        for ev in events:
-            dt = abs(ep["start"] - ev.ts)
-            if dt <= window:
-                proximity = max(0.0, 1.0 - (dt.total_seconds() / window.total_seconds()))  # 0..1
-                prior = event_prior.get(ev.event_type, 0.6)  # default mid
+            if incident_id is None:
+                header = _parse_ndjson_line(line, lineno, header=True)
+                incident = await crud.get_or_create_incident(db, header)
+                incident_id = incident.id
+                ingest_version = await crud.lock_next_version(db, incident_id)
+                continue
 
-                # episode contributes:
-                contrib = proximity * prior * sev_weight * agree_weight
+            record = _parse_ndjson_line(line, lineno)
+            if isinstance(record, MetricIn):
+                metrics.append(record)
+                metrics_total += 1
+                if len(metrics) >= crud.INGEST_CHUNK_SIZE:
+                    metrics_inserted += await flush_metrics(metrics)
+                    metrics = []
+            else:
+                events.append(record)
+                events_total += 1
+                if len(events) >= crud.INGEST_CHUNK_SIZE:
+                    events_inserted += await flush_events(events)
+                    events = []
+
+        if incident_id is None:
+            raise HTTPException(status_code=422, detail="empty body: expected an incident header line")
+
+        metrics_inserted += await flush_metrics(metrics)
+        events_inserted += await flush_events(events)
+        if metrics_inserted or events_inserted:
+            await crud.bump_data_version(db, incident_id, rows_range)
+        await db.commit()
+        partitions.remember(created)
+        _record_ingest("/ingest/stream", metrics_total, metrics_inserted, events_total, events_inserted)
+
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
 
-                max_possible = max(max_possible, contrib)  # for normalization hint (not strict)
+    return IngestResponse(
+        incident_id=incident_id,
+        metrics_ingested=metrics_inserted,
+        events_ingested=events_inserted,
+    )
 
-                if ev.id not in cause:
-                    cause[ev.id] = {"score": 0.0, "evidence": [], "event": ev}
 
-                cause[ev.id]["score"] += contrib
+def _parse_view(fields, anomalies_limit, anomalies_cursor, episodes_limit, episodes_cursor) -> View:
+    sections = SECTIONS
+    if fields is not None:
+        sections = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = sorted(set(sections) - set(SECTIONS))
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"unknown fields {unknown}; expected any of {list(SECTIONS)}",
+            )
+    try:
+        anomalies = Page(anomalies_limit, anomalies_cursor) if anomalies_limit or anomalies_cursor else None
+        episodes = Page(episodes_limit, episodes_cursor) if episodes_limit or episodes_cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"bad cursor: {e}")
+    return View(sections, anomalies, episodes)
 
-                pct = 0.0
-                if ep["baseline_mean"] > 1e-9:
-                    pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
 
-                cause[ev.id]["evidence"].append(
-                    f"{ep['metric']} abnormal {ep['start'].isoformat()}–{ep['end'].isoformat()}: "
-                    f"{ep['baseline_mean']:.2f} → {ep['max_value']:.2f} ({pct:+.1f}%), "
-                    f"z≈{ep['max_abs_z']:.2f}, event within {int(dt.total_seconds())}s"
-                )
+@app.get("/analysis/{incident_id}", response_model=AnalysisResponse)
+async def analyze_incident(
+    incident_id: str,
+    profile: bool = False,
+    fields: str | None = Query(None, description="comma-separated sections: anomalies,episodes,likely_causes"),
+    anomalies_limit: int | None = Query(None, ge=1),
+    anomalies_cursor: str | None = Query(None, description="next_anomalies_cursor of the previous page, or a ts"),
+    episodes_limit: int | None = Query(None, ge=1),
+    episodes_cursor: str | None = Query(None, description="next_episodes_cursor of the previous page, or a ts"),
+    detector: str | None = Query(None, description="score every metric with this detector instead of its configured one"),
+    episode_method: Literal["gap", "cusum", "binseg"] | None = Query(
+        None, description="form every metric's episodes this way instead of the configured way"
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    started = time.perf_counter()
+    prof = Profile()
+    view = _parse_view(fields, anomalies_limit, anomalies_cursor, episodes_limit, episodes_cursor)
+    if detector is not None and detector not in DETECTORS:
+        raise HTTPException(status_code=422, detail=f"unknown detector {detector!r}; expected any of {list(DETECTORS)}")
+    config = analysis_config.current().override(detector, episode_method)
+
+    def build(analysis: IncidentAnalysis, source: str) -> bytes:
+        # just the view's sections/pages are built; rendered directly rather
+        # than through response_model (same bytes, without the dump-to-dict +
+        # json.dumps round trip). Unset fields are left out, so `timings`
+        # only appears when it was asked for
+        result = analysis.response(view, prof)
+        prof.observe()  # whatever this request computed or built
+        if profile:
+            timings = prof.timings(source, time.perf_counter() - started)
+            result = result.model_copy(update={"timings": timings})
+        return render_json(result)
+
+    async def respond(analysis: IncidentAnalysis, source: str) -> ModelJSONResponse:
+        metrics.analysis_requests.labels(source).inc()
+        # in a worker thread since a big response takes a while
+        return ModelJSONResponse(await run_in_threadpool(build, analysis, source))
+
+    incident = await db.get(models.Incident, incident_id)
+    if incident is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    data_version = incident.data_version
+
+    # the cache holds analyzed incidents; a view's sections are built from
+    # them (and kept there) as requests ask for them
+    cached = analysis_cache.get((incident_id, config.version), data_version)
+    if cached is not None:
+        return await respond(cached, "cache")
+
+    # on a miss the incident is analyzed (or read from analysis_results) once
+    # however many callers want it at the same time, and cached, so clients
+    # polling with paging or ?fields= hit the cache from then on
+    key = (incident_id, config.version, data_version)
+    await db.rollback()  # the shared run reads in sessions of its own (see analyze_latest)
+    analyzed, leader = await analysis_flights.do(key, lambda: analyze_latest(incident_id, prof, config))
+    if analyzed is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    _, result, source = analyzed
+    if not leader:
+        source = "coalesced"
+    elif source == "computed":
+        _observe_input(prof)
+    return await respond(result, source)
+
+
+def _observe_input(prof: Profile) -> None:
+    fetched = prof.stages["fetch"]
+    metrics.analysis_input_rows.labels().observe(fetched.rows)
+    metrics.analysis_input_metrics.labels().observe(fetched.objects)
+
+
+def _job_out(job: models.AnalysisJob) -> AnalysisJobOut:
+    # every field passed explicitly: ModelJSONResponse leaves out unset ones
+    return AnalysisJobOut(
+        job_id=job.id,
+        incident_id=job.incident_id,
+        status=job.status,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        data_version=job.data_version,
+        error=job.error,
+        result=None if job.result is None else AnalysisResponse.model_validate(job.result),
+    )
 
-    # ---- 6) build response ----
-    # return point anomalies (fine for now) + ranked causes
-    causes: list[CauseOut] = []
-    if cause:
-        max_score = max(v["score"] for v in cause.values()) or 1.0
-        for v in cause.values():
-            ev = v["event"]
-            conf = v["score"] / max_score
-            causes.append(
-                CauseOut(
-                    event_type=ev.event_type,
-                    ts=ev.ts,
-                    meta=ev.meta,
-                    confidence=round(conf, 3),
-                    evidence=v["evidence"][:6],
-                )
-            )
-        causes.sort(key=lambda c: c.confidence, reverse=True)
 
-    return AnalysisResponse(
-        incident_id=incident_id,
-        anomalies=point_anoms,
-        episodes=episodes_out,  # 👈 this is why we built it
-        likely_causes=causes[:5],
-    )
+@app.post("/analysis/{incident_id}/jobs", response_model=AnalysisJobOut, status_code=202)
+async def enqueue_analysis(incident_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Queue a full analysis for `python -m app.worker` processes instead of
+    running it in this request; poll GET /analysis/jobs/{job_id} for it.
+    A job for this incident that hasn't started yet is returned instead of
+    queueing another.
+    """
+    incident = await db.get(models.Incident, incident_id)
+    if incident is None:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    job = await crud.enqueue_analysis_job(db, incident_id)
+    await db.commit()
+    return ModelJSONResponse(_job_out(job), status_code=202)
+
+
+@app.get("/analysis/jobs/{job_id}", response_model=AnalysisJobOut)
+async def get_analysis_job(job_id: str, db: AsyncSession = Depends(get_db)):
+    job = await db.get(models.AnalysisJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # a done job carries the full analysis: validate and render it off the loop
+    return ModelJSONResponse(await run_in_threadpool(lambda: render_json(_job_out(job))))
+
+
+@app.get("/config/analysis", response_model=AnalysisConfigOut)
+def get_analysis_config():
+    # what this process analyzes with right now
+    return ModelJSONResponse(analysis_config.describe())
+
+
+@app.put("/config/analysis", response_model=AnalysisConfigOut)
+async def put_analysis_config(payload: AnalysisConfigIn, db: AsyncSession = Depends(get_db)):
+    """
+    Replace the detection rules and scoring settings. This process uses them
+    from the next analysis on, every other one after its next reload (within
+    ANALYSIS_CONFIG_RELOAD_SECONDS).
+    """
+    rules = [(rule.pattern, rule.params.model_dump(exclude_none=True)) for rule in payload.detectors]
+    settings = payload.scoring.model_dump(exclude_none=True)
+    try:
+        loaded = analysis_config.build(rules, settings)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    await crud.replace_analysis_config(db, rules, settings)
+    await db.commit()
+    analysis_config.install(loaded)
+    return ModelJSONResponse(analysis_config.describe())
@@ -0,0 +1,379 @@
+"""
+Small in-process metrics registry with Prometheus text exposition.
+
+Instruments are plain Python objects behind a lock; recording one is a dict
+lookup plus an add, cheap enough for every request. Each uvicorn worker has
+its own registry. With METRICS_MULTIPROC_DIR set, every worker periodically
+writes a snapshot of it to `<dir>/<pid>-<start>.json` and a scrape (which lands on
+one arbitrary worker) sums the snapshots of all of them. Counters and
+histograms of workers that have exited are kept so totals never go backwards;
+gauges only count live workers.
+"""
+import asyncio
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+
+
+# seconds; roughly the prometheus client defaults, stretched for big incidents
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# request bodies, bytes
+SIZE_BUCKETS = tuple(10 ** e for e in range(2, 10))
+# rows / points / metrics per request
+COUNT_BUCKETS = tuple(10 ** e for e in range(0, 9))
+
+# shared directory for per-worker snapshots; unset = single process
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None
+# how often each worker rewrites its snapshot there
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+
+class Counter:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def snapshot(self) -> float:
+        return self._value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, cheap enough to observe on every request.
+
+    observe() may be called from the event loop and worker threads at once;
+    a lock keeps count/sum/buckets consistent with each other.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        """{"buckets": {le: cumulative count}, "sum": ..., "count": ...}."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, running = {}, 0
+        for le, c in zip([*map(str, self.buckets), "+Inf"], counts):
+            running += c
+            cumulative[le] = running
+        return {"buckets": cumulative, "sum": total, "count": running}
+
+
+class Family:
+    """A named metric with a fixed set of label names; one child per label combination."""
+
+    def __init__(self, name: str, help: str, kind: str, labelnames=(), factory=Counter):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._factory())
+        return child
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            children = list(self._children.items())
+        return {
+            "help": self.help,
+            "type": self.kind,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), child.snapshot()] for key, child in children],
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._collectors = []
+
+    def _add(self, family: Family) -> Family:
+        if family.name in self._families:
+            raise ValueError(f"metric {family.name} already registered")
+        self._families[family.name] = family
+        return family
+
+    def counter(self, name: str, help: str, labelnames=()) -> Family:
+        return self._add(Family(name, help, "counter", labelnames, Counter))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Family:
+        return self._add(Family(name, help, "histogram", labelnames, lambda: Histogram(buckets)))
+
+    def add_collector(self, collect) -> None:
+        """
+        Register a callable run at snapshot time for values that live elsewhere
+        (pool, caches). It returns {name: family snapshot}, same shape as
+        Family.snapshot().
+        """
+        self._collectors.append(collect)
+
+    def snapshot(self) -> dict:
+        families = {name: family.snapshot() for name, family in self._families.items()}
+        for collect in self._collectors:
+            families.update(collect())
+        return families
+
+
+def _process_start(pid: int):
+    """Kernel start time of `pid` (clock ticks since boot), or None if unknown."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # field 22; the command name (field 2) may contain spaces, so split after it
+    return stat.rsplit(")", 1)[1].split()[19]
+
+
+def _process_alive(pid: int, start) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # a live process under a reused pid is a different worker
+    return start is None or _process_start(pid) in (None, start)
+
+
+def _merge_value(kind: str, a, b):
+    if kind == "histogram":
+        return {
+            "buckets": {le: a["buckets"].get(le, 0) + n for le, n in b["buckets"].items()},
+            "sum": a["sum"] + b["sum"],
+            "count": a["count"] + b["count"],
+        }
+    return a + b
+
+
+def merge_snapshots(snapshots) -> dict:
+    """Sum (snapshot, live) pairs from several workers; gauges only from live ones."""
+    merged = {}
+    for snapshot, live in snapshots:
+        for name, family in snapshot.items():
+            if family["type"] == "gauge" and not live:
+                continue
+            target = merged.setdefault(name, {**family, "samples": {}})
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                if key in target["samples"]:
+                    value = _merge_value(family["type"], target["samples"][key], value)
+                target["samples"][key] = value
+    for family in merged.values():
+        family["samples"] = [[list(k), v] for k, v in family["samples"].items()]
+    return merged
+
+
+_token = None  # (pid, "<pid>-<start>") of this process, rebuilt after a fork
+
+
+def _process_token() -> str:
+    """
+    Identifies this process' snapshot file. The start time keeps a worker that
+    inherits a dead worker's pid from overwriting (and so rolling back) its totals.
+    """
+    global _token
+    pid = os.getpid()
+    if _token is None or _token[0] != pid:
+        start = _process_start(pid) or uuid.uuid4().hex
+        _token = (pid, f"{pid}-{start}")
+    return _token[1]
+
+
+def write_snapshot() -> None:
+    """Publish this worker's snapshot for the others (no-op without METRICS_MULTIPROC_DIR)."""
+    if METRICS_MULTIPROC_DIR is None:
+        return
+    path = os.path.join(METRICS_MULTIPROC_DIR, f"{_process_token()}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+async def flush_periodically() -> None:
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_SECONDS)
+        write_snapshot()
+
+
+def collect() -> dict:
+    """This worker's snapshot, merged with every other worker's if running multi-process."""
+    if METRICS_MULTIPROC_DIR is None:
+        return registry.snapshot()
+
+    own_token = _process_token()
+    snapshots = [(registry.snapshot(), True)]
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "*.json")):
+        try:
+            token = os.path.basename(path)[: -len(".json")]
+            if token == own_token:
+                continue
+            pid, _, start = token.partition("-")
+            with open(path) as f:
+                # uuid tokens (no /proc) can't be checked against the pid's start
+                alive = _process_alive(int(pid), start if start.isdigit() else None)
+                snapshots.append((json.load(f), alive))
+        except (OSError, ValueError):
+            continue  # being replaced or garbage; skip it this scrape
+    return merge_snapshots(snapshots)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render(families: dict) -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        names = family["labelnames"]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for values, value in family["samples"]:
+            if family["type"] == "histogram":
+                for le, count in value["buckets"].items():
+                    bucket = _labels(names, values, 'le="%s"' % le)
+                    lines.append(f"{name}_bucket{bucket} {count}")
+                lines.append(f"{name}_sum{_labels(names, values)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(names, values)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "sig_http_request_duration_seconds",
+    "Request latency by route and status",
+    ["method", "route", "status"],
+)
+http_request_bytes = registry.histogram(
+    "sig_http_request_body_bytes",
+    "Request body size by route",
+    ["method", "route"],
+    buckets=SIZE_BUCKETS,
+)
+ingest_rows = registry.counter(
+    "sig_ingest_rows_total",
+    "Ingested rows by kind (metric, event) and outcome (inserted, conflicted)",
+    ["kind", "outcome"],
+)
+ingest_payload_rows = registry.histogram(
+    "sig_ingest_payload_rows",
+    "Rows (metrics + events) per ingest request",
+    ["route"],
+    buckets=COUNT_BUCKETS,
+)
+analysis_requests = registry.counter(
+    "sig_analysis_requests_total",
+    "Analysis requests by where the result came from (cache, stored, coalesced, computed)",
+    ["source"],
+)
+analysis_locks = registry.counter(
+    "sig_analysis_lock_acquisitions_total",
+    "Per-incident analysis lock acquisitions across replicas (free, waited, timeout)",
+    ["outcome"],
+)
+analysis_jobs = registry.counter(
+    "sig_analysis_jobs_total",
+    "Analysis jobs finished by worker processes, by status (done, failed)",
+    ["status"],
+)
+analysis_config_reloads = registry.counter(
+    "sig_analysis_config_reloads_total",
+    "Detection config reloads that swapped in a new config or failed (changed, failed)",
+    ["outcome"],
+)
+analysis_input_rows = registry.histogram(
+    "sig_analysis_input_rows",
+    "Rows read from the database per computed analysis",
+    buckets=COUNT_BUCKETS,
+)
+analysis_input_metrics = registry.histogram(
+    "sig_analysis_input_metrics",
+    "Metric series read per computed analysis",
+    buckets=COUNT_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and request body size per route.
+
+    Labels use the route template (/analysis/{incident_id}), never the raw
+    path, so label cardinality stays bounded; unmatched paths aren't recorded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        body_bytes = 0
+
+        async def receive_counting():
+            nonlocal body_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                body_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counting, send_status)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                method = scope["method"]
+                http_request_seconds.labels(method, route.path, status).observe(time.perf_counter() - start)
+                if method in ("POST", "PUT", "PATCH"):
+                    http_request_bytes.labels(method, route.path).observe(body_bytes)
@@ -1,5 +1,8 @@
 
-from sqlalchemy import Column, String, DateTime, Float, ForeignKey, JSON, Index, UniqueConstraint
+from sqlalchemy import (
+    BigInteger, Column, String, DateTime, Float, ForeignKey, Integer, JSON, Index,
+    PrimaryKeyConstraint, Sequence, UniqueConstraint,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -22,33 +25,75 @@ class Incident(Base):
     source = Column(String, nullable=True)        # e.g., "ci", "prod"
     meta = Column("metadata", JSON, nullable=True)
 
-    metrics = relationship("MetricPoint", back_populates="incident", cascade="all, delete-orphan")
+    # bumped by every ingest that inserts rows; keys the analysis cache
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # data_version set by the last retention run that dropped some of the
+    # incident's rows; incremental state from before it still holds them
+    pruned_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # earliest/latest ts of the incident's points and events; bounds the
+    # analysis reads so they only touch the partitions that can hold its rows
+    first_ts = Column(DateTime, nullable=True)
+    last_ts = Column(DateTime, nullable=True)
+
+    series = relationship("MetricSeries", back_populates="incident", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="incident", cascade="all, delete-orphan")
 
 
+class MetricSeries(Base):
+    """
+    Dictionary of an incident's metric names. Points reference a series by its
+    small integer id instead of repeating the incident id and name on every row.
+    """
+    __tablename__ = "metric_series"
+    __table_args__ = (
+        # name -> id lookups (ingest, the analysis join) never touch the heap
+        UniqueConstraint("incident_id", "name", name="uq_metric_series", postgresql_include=["id"]),
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    incident_id = Column(String, ForeignKey("incidents.id", ondelete="CASCADE"), nullable=False)
+    name = Column(String, nullable=False)         # e.g., "p95_latency_ms"
+
+    incident = relationship("Incident", back_populates="series")
+    points = relationship("MetricPoint", back_populates="series", passive_deletes=True)
+
+
 class MetricPoint(Base):
     __tablename__ = "metric_points"
     __table_args__ = (
-        UniqueConstraint("incident_id", "ts", "metric_name", name="uq_metric_point"),
+        # carries value so the analysis read is an index-only scan
+        PrimaryKeyConstraint("series_id", "ts", postgresql_include=["value"]),
+        # monthly partitions, created on demand (app/partitions.py)
+        {"postgresql_partition_by": "RANGE (ts)"},
     )
 
-    id = Column(String, primary_key=True, default=uuid_str)
-    incident_id = Column(String, ForeignKey("incidents.id"), nullable=False)
+    # column order keeps the row free of alignment padding: 4 + 4 + 8 + 8 bytes
+    series_id = Column(BigInteger, ForeignKey("metric_series.id", ondelete="CASCADE"), nullable=False)
+
+    # incident data_version of the ingest that inserted this row (incremental analysis)
+    ingest_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     ts = Column(DateTime, nullable=False)         # timestamp
-    metric_name = Column(String, nullable=False)  # e.g., "p95_latency_ms"
     value = Column(Float, nullable=False)
 
-    incident = relationship("Incident", back_populates="metrics")
+    series = relationship("MetricSeries", back_populates="points")
+
+
+events_id_seq = Sequence("events_id_seq", metadata=Base.metadata)
 
 
 class Event(Base):
     __tablename__ = "events"
     __table_args__ = (
-        UniqueConstraint("incident_id", "ts", "event_type", name="uq_event"),
+        # the ingest dedupe key (ON CONFLICT target) doubles as the primary
+        # key and serves the (incident_id, ts) reads, so it's the only index
+        PrimaryKeyConstraint("incident_id", "ts", "event_type"),
+        {"postgresql_partition_by": "RANGE (ts)"},
     )
 
-    id = Column(String, primary_key=True, default=uuid_str)
+    # row identity for analysis (cause keys); nothing looks rows up by it
+    id = Column(BigInteger, events_id_seq, server_default=events_id_seq.next_value(), nullable=False)
     incident_id = Column(String, ForeignKey("incidents.id"), nullable=False)
 
     ts = Column(DateTime, nullable=False)
@@ -58,7 +103,76 @@ class Event(Base):
     incident = relationship("Incident", back_populates="events")
 
 
+class AnalysisResult(Base):
+    """
+    Last computed analysis per incident, valid while data_version matches the
+    incident's and config_version the detection config's.
+    """
+    __tablename__ = "analysis_results"
+
+    incident_id = Column(String, ForeignKey("incidents.id", ondelete="CASCADE"), primary_key=True)
+    data_version = Column(Integer, nullable=False)
+    config_version = Column(String, nullable=True)  # AnalysisConfig.version it was computed with
+    result = Column(JSON, nullable=False)  # AnalysisResponse as JSON
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class AnalysisJob(Base):
+    """A queued analysis, run by `python -m app.worker` processes (app/worker.py)."""
+    __tablename__ = "analysis_jobs"
+
+    id = Column(String, primary_key=True, default=uuid_str)
+    incident_id = Column(String, ForeignKey("incidents.id", ondelete="CASCADE"), nullable=False)
+
+    status = Column(String, nullable=False, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    # refreshed by the worker while it runs; a running job whose heartbeat
+    # goes stale (worker died) is picked up again
+    heartbeat_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    data_version = Column(Integer, nullable=True)  # incident version the result was computed from
+    result = Column(JSON, nullable=True)           # AnalysisResponse as JSON, once done
+    error = Column(String, nullable=True)
+
+
+class DetectorConfig(Base):
+    """
+    A per-metric detection rule (app/analysis_config.py): metrics whose name
+    matches `pattern` are analyzed with `params`. The first matching rule by
+    position applies.
+    """
+    __tablename__ = "detector_configs"
+
+    position = Column(Integer, primary_key=True)
+    pattern = Column(String, nullable=False)   # fnmatch-style, e.g. "*error_rate*"
+    params = Column(JSON, nullable=False)      # MetricConfig fields it sets, e.g. {"detector": "robust"}
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ScoringSetting(Base):
+    """One ScoringConfig field (cause window, event priors, ...) overriding its default."""
+    __tablename__ = "scoring_config"
+
+    name = Column(String, primary_key=True)    # e.g. "event_priors"
+    value = Column(JSON, nullable=False)       # e.g. {"deploy": 1.0, "feature_flag": 0.9}
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 # Helpful indexes for speed
-Index("ix_metric_incident_ts", MetricPoint.incident_id, MetricPoint.ts)
-Index("ix_event_incident_ts", Event.incident_id, Event.ts)
-Index("ix_metric_incident_name_ts", MetricPoint.incident_id, MetricPoint.metric_name, MetricPoint.ts)
+Index("ix_metric_series_ingest_version", MetricPoint.series_id, MetricPoint.ingest_version)
+# the claim query only ever looks at unfinished jobs, oldest first
+Index(
+    "ix_analysis_jobs_pending",
+    AnalysisJob.created_at,
+    postgresql_where=AnalysisJob.status.in_(["queued", "running"]),
+)
+# at most one queued job per incident; enqueueing relies on it to reuse that job
+Index(
+    "uq_analysis_jobs_queued",
+    AnalysisJob.incident_id,
+    unique=True,
+    postgresql_where=AnalysisJob.status == "queued",
+)
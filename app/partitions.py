@@ -0,0 +1,331 @@
+"""
+Monthly range partitions of metric_points and events on `ts`.
+
+Partitions are named `<table>_YYYY_MM` and created on demand by ingest,
+before rows for a month arrive. Retention detaches and drops whole
+partitions instead of deleting rows, so removing a month of history is a catalog operation no
+matter how many points it held.
+"""
+import asyncio
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import exc, text
+
+PARTITIONED_TABLES = ("metric_points", "events")
+
+# drop partitions whose whole month is older than this; unset = keep forever
+PARTITION_RETENTION_DAYS = int(os.getenv("PARTITION_RETENTION_DAYS", "0")) or None
+# how often each worker checks for expired partitions
+PARTITION_RETENTION_CHECK_SECONDS = float(os.getenv("PARTITION_RETENTION_CHECK_SECONDS", "3600"))
+# how long the stream ingest waits for the locks creating a partition takes,
+# in a transaction of its own, before creating it in its own transaction
+PARTITION_LOCK_TIMEOUT_SECONDS = float(os.getenv("PARTITION_LOCK_TIMEOUT_SECONDS", "2"))
+
+# any number, as long as every worker uses the same one
+_RETENTION_LOCK_KEY = 0x5167_7265
+
+_NAME = re.compile(r"^(?P<table>metric_points|events)_(?P<year>\d{4})_(?P<month>\d{2})$")
+
+# partitions known to exist (committed); skips the DDL round trip on ingest
+_known: set[str] = set()
+
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start: datetime) -> datetime:
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def months(timestamps) -> list[datetime]:
+    """First day of every month from the earliest to the latest of `timestamps` (naive UTC)."""
+    timestamps = list(timestamps)
+    if not timestamps:
+        return []
+    start, end = month_start(min(timestamps)), max(timestamps)
+    out = []
+    while start <= end:
+        out.append(start)
+        start = next_month(start)
+    return out
+
+
+def partition_name(table: str, start: datetime) -> str:
+    return f"{table}_{start:%Y_%m}"
+
+
+def _may_be_dropped(start: datetime) -> bool:
+    """
+    Whether retention may have dropped this month's partitions already. Only
+    the process that drops them forgets them (_known), so for such months
+    the catalog is asked instead: a backfill into one then recreates it
+    rather than failing to find a partition for its rows.
+    """
+    if not PARTITION_RETENTION_DAYS:
+        return False
+    # a day of slack for clocks that differ between hosts
+    cutoff = datetime.utcnow() - timedelta(days=PARTITION_RETENTION_DAYS - 1)
+    return next_month(start) <= cutoff
+
+
+def missing(table: str, timestamps, pending: set | None = None) -> list[datetime]:
+    """Months of `timestamps` whose `table` partition may not exist yet."""
+    out = []
+    for start in months(timestamps):
+        name = partition_name(table, start)
+        if pending is not None and name in pending:
+            continue
+        if name in _known and not _may_be_dropped(start):
+            continue
+        out.append(start)
+    return out
+
+
+# what creating/attaching a partition fails with when another transaction
+# created the same one at the same time: duplicate_table, unique_violation
+# (on the catalog), invalid_object_definition ("already a partition")
+_CREATE_RACE_CODES = {"42P07", "23505", "42P17"}
+
+
+async def _is_partition(conn, name: str) -> bool:
+    return bool(
+        (
+            await conn.execute(
+                text("SELECT relispartition FROM pg_class WHERE oid = to_regclass(:name)"), {"name": name}
+            )
+        ).scalar()
+    )
+
+
+async def _create(conn, table: str, start: datetime) -> None:
+    # a plain table, attached afterwards: ATTACH PARTITION takes only a SHARE
+    # UPDATE EXCLUSIVE lock on the parent, which ingest and analysis don't
+    # conflict with, where CREATE TABLE ... PARTITION OF takes ACCESS
+    # EXCLUSIVE and blocks every read and write of the parent until commit
+    name = partition_name(table, start)
+    try:
+        # a savepoint, so losing the race below leaves `conn`'s transaction usable
+        async with conn.begin_nested():
+            await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {table} INCLUDING DEFAULTS)"))
+            if not await _is_partition(conn, name):
+                await conn.execute(
+                    text(
+                        f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{next_month(start):%Y-%m-%d}')"
+                    )
+                )
+    except exc.DBAPIError as e:
+        # IF NOT EXISTS and the relispartition check don't cover two
+        # transactions creating the same partition at once; the loser fails
+        # once the winner commits, and then finds its partition in place
+        if getattr(e.orig, "pgcode", None) not in _CREATE_RACE_CODES or not await _is_partition(conn, name):
+            raise
+
+
+async def ensure(conn, table: str, timestamps, pending: set | None = None) -> None:
+    """
+    Create the partitions of `table` that rows at `timestamps` would land in.
+
+    `conn` is a connection or session. The new partition stays locked until
+    `conn`'s transaction ends, so ingest runs this in a short transaction of
+    its own (ensure_committed). Names created here are added to `pending`;
+    pass them to remember() once the transaction has committed.
+    """
+    for start in missing(table, timestamps, pending):
+        await _create(conn, table, start)
+        if pending is not None:
+            pending.add(partition_name(table, start))
+
+
+def remember(names) -> None:
+    _known.update(names)
+
+
+def _lock_timed_out(e: exc.DBAPIError) -> bool:
+    return getattr(e.orig, "pgcode", None) == "55P03"  # lock_not_available
+
+
+async def ensure_committed(engine, partitions: dict, lock_timeout: float | None = None) -> None:
+    """
+    ensure() for {table: timestamps} in a transaction of its own, committed
+    right away. With `lock_timeout` (seconds), gives up with a DBAPIError
+    when a lock it needs isn't granted in time.
+    """
+    todo = {table: missing(table, timestamps) for table, timestamps in partitions.items()}
+    if not any(todo.values()):
+        return
+    created = set()
+    async with engine.begin() as conn:
+        if lock_timeout is not None:
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{int(lock_timeout * 1000)}ms'"))
+        for table, starts in todo.items():
+            for start in starts:
+                await _create(conn, table, start)
+                created.add(partition_name(table, start))
+    remember(created)
+
+
+async def ensure_during(engine, db, table: str, timestamps, pending: set) -> None:
+    """
+    ensure() for an ingest whose own transaction `db` is already open and
+    inserting (the NDJSON stream), without holding the new partition's locks
+    for the rest of it.
+
+    Attaching clones the parent's foreign keys onto the partition, which
+    can need locks on metric_series/incidents that `db` itself holds; the
+    short transaction then times out instead of waiting on us, and the
+    partition is created in `db` after all. Even then the parent only gets
+    ATTACH's SHARE UPDATE EXCLUSIVE lock, so other ingests and analyses go
+    on. Names created in `db` are added to `pending`, as with ensure().
+    """
+    try:
+        await ensure_committed(engine, {table: timestamps}, lock_timeout=PARTITION_LOCK_TIMEOUT_SECONDS)
+    except exc.DBAPIError as e:
+        if not _lock_timed_out(e):
+            raise
+        await ensure(db, table, timestamps, pending)
+
+
+async def load_known(conn) -> None:
+    """Reset the cache of existing partitions from the catalog."""
+    rows = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent::regclass::text = ANY(:tables)"
+        ),
+        {"tables": list(PARTITIONED_TABLES)},
+    )
+    names = [name for (name,) in rows]
+    _known.clear()
+    remember(names)
+
+
+def expired(names, cutoff: datetime) -> list[str]:
+    """Partition names whose month ends at or before `cutoff`."""
+    out = []
+    for name in names:
+        m = _NAME.match(name)
+        if m is None:
+            continue
+        start = datetime(int(m["year"]), int(m["month"]), 1)
+        if next_month(start) <= cutoff:
+            out.append(name)
+    return sorted(out)
+
+
+async def _expired_tables(conn, cutoff: datetime) -> list[tuple[str, str, bool]]:
+    """
+    (parent, name, attached) of every partition table that expired by
+    `cutoff`, including ones an interrupted run detached but didn't drop.
+    """
+    rows = await conn.execute(
+        text(
+            "SELECT c.relname, c.relispartition FROM pg_class c "
+            "WHERE c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace "
+            "AND c.relname ~ '^(metric_points|events)_[0-9]{4}_[0-9]{2}$'"
+        )
+    )
+    tables = dict(rows.all())
+    return [(_NAME.match(name)["table"], name, tables[name]) for name in expired(tables, cutoff)]
+
+
+async def _detach(conn, parent: str, name: str) -> None:
+    """
+    DETACH ... CONCURRENTLY: it only takes SHARE UPDATE EXCLUSIVE on the
+    parent, where dropping an attached partition takes ACCESS EXCLUSIVE and
+    queues every ingest and analysis read behind it. Must run outside a
+    transaction. A detach an earlier run was interrupted in is finished.
+    """
+    try:
+        await conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name} CONCURRENTLY"))
+    except exc.DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) != "55000":  # object_not_in_prerequisite_state
+            raise
+        await conn.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {name} FINALIZE"))
+
+
+async def drop_expired(engine, cutoff: datetime) -> list[str]:
+    """
+    Drop every partition that only holds rows older than `cutoff`.
+
+    Each one is detached concurrently first and then dropped, so neither
+    step blocks the parent table. Incidents left without any points or
+    events are deleted (their series and stored analyses cascade); the
+    others get their data_version bumped so no cached analysis still counts
+    the dropped rows, and pruned_version set to the new version so no
+    incremental state from before it is advanced either (it would keep the
+    dropped rows' anomalies). Only one worker at a time does this; the
+    others return [] straight away.
+    """
+    async with engine.connect() as lock_conn:
+        # DETACH CONCURRENTLY can't run in a transaction block
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        got_lock = (
+            await lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _RETENTION_LOCK_KEY})
+        ).scalar_one()
+        if not got_lock:
+            return []
+        try:
+            tables = await _expired_tables(lock_conn, cutoff)
+            if not tables:
+                return []
+
+            touched = set()
+            for parent, name, attached in tables:
+                if parent == "metric_points":
+                    # one index probe per series, not a scan of the partition
+                    stmt = (
+                        "SELECT DISTINCT s.incident_id FROM metric_series s "
+                        f"WHERE EXISTS (SELECT 1 FROM {name} p WHERE p.series_id = s.id)"
+                    )
+                else:
+                    stmt = f"SELECT DISTINCT incident_id FROM {name}"
+                touched.update((await lock_conn.execute(text(stmt))).scalars())
+                if attached:
+                    await _detach(lock_conn, parent, name)
+
+            # the rows are out of the parents now; dropping the detached
+            # tables and re-versioning their incidents commit together
+            async with engine.begin() as conn:
+                for _, name, _ in tables:
+                    await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                if touched:
+                    await conn.execute(
+                        text(
+                            "DELETE FROM incidents i WHERE i.id = ANY(:ids) "
+                            "AND NOT EXISTS (SELECT 1 FROM events e WHERE e.incident_id = i.id) "
+                            "AND NOT EXISTS (SELECT 1 FROM metric_series s JOIN metric_points p "
+                            "ON p.series_id = s.id WHERE s.incident_id = i.id)"
+                        ),
+                        {"ids": sorted(touched)},
+                    )
+                    await conn.execute(
+                        text(
+                            "UPDATE incidents SET data_version = data_version + 1, "
+                            "pruned_version = data_version + 1 WHERE id = ANY(:ids)"
+                        ),
+                        {"ids": sorted(touched)},
+                    )
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _RETENTION_LOCK_KEY})
+
+    names = [name for _, name, _ in tables]
+    _known.difference_update(names)
+    return names
+
+
+async def retention_periodically(engine) -> None:
+    while True:
+        cutoff = datetime.utcnow() - timedelta(days=PARTITION_RETENTION_DAYS)
+        try:
+            dropped = await drop_expired(engine, cutoff)
+        except exc.DBAPIError as e:
+            print(f"retention: {e}")  # try again next round
+        else:
+            if dropped:
+                print(f"retention: dropped {', '.join(dropped)}")
+        await asyncio.sleep(PARTITION_RETENTION_CHECK_SECONDS)
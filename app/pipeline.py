@@ -0,0 +1,204 @@
+import os
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import analysis_config, crud, metrics, models
+from app.analysis import AnalysisConfig, IncidentAnalysis, analyze_series, count_anomalies
+from app.cache import ANALYSIS_CACHE_PERSIST, analysis_cache
+from app.db import SessionLocal, engine
+from app.incremental import ANALYSIS_INCREMENTAL, IncidentState, incremental_states
+from app.profiling import Profile
+from app.schemas import AnalysisResponse
+
+# how long a replica waits for another one already analyzing the same
+# incident before computing the analysis itself anyway
+ANALYSIS_LOCK_TIMEOUT_SECONDS = float(os.getenv("ANALYSIS_LOCK_TIMEOUT_SECONDS", "30"))
+
+
+def _count_points(series: dict) -> int:
+    return sum(len(values) for _, values in series.values())
+
+
+def _load_result(stored: dict) -> IncidentAnalysis:
+    """A result read back from analysis_results; CPU-bound for big incidents."""
+    return IncidentAnalysis.from_response(AnalysisResponse.model_validate(stored))
+
+
+def _dump_result(result: IncidentAnalysis, profile: Profile | None) -> dict:
+    """The full response as analysis_results / analysis_jobs store it; CPU-bound too."""
+    return result.response(profile=profile).model_dump(mode="json", exclude_unset=True)
+
+
+async def compute_analysis(
+    db: AsyncSession,
+    incident_id: str,
+    data_version: int,
+    profile: Profile | None = None,
+    rows_range: tuple | None = None,
+    config: AnalysisConfig | None = None,
+    pruned_version: int = 0,
+) -> IncidentAnalysis:
+    """
+    Analyze an incident as of `data_version`; responses (or parts of them)
+    are built from the result as they're asked for.
+
+    Must be called inside the (REPEATABLE READ) transaction `data_version` was
+    read in; that transaction is ended once all reads are done, before any of
+    the CPU-bound work, which runs in a worker thread. Stage times are
+    recorded in `profile`; the caller observes it once the response is built.
+    `rows_range` is the incident's (first_ts, last_ts), used to skip
+    partitions that can't hold its rows.
+    `config` defaults to the current one (analysis_config.current()).
+    `pruned_version` is the incident's: incremental state older than it
+    still holds rows retention has dropped since, so it isn't reused.
+    """
+    profile = profile or Profile()
+    config = config or analysis_config.current()
+
+    if not ANALYSIS_INCREMENTAL:
+        # ---- 1) group points by metric ----
+        with profile.stage("fetch") as st:
+            events = await crud.load_events(db, incident_id, rows_range)
+            series = await crud.load_metric_series(db, incident_id, rows_range=rows_range)
+            await db.rollback()  # done reading; release the snapshot
+            st.rows = _count_points(series) + len(events)
+            st.objects = len(series)
+
+        # ---- 2..3) detection; episodes, agreement and causes when asked for ----
+        return await run_in_threadpool(analyze_series, incident_id, series, events, profile, config)
+
+    # incremental: only read what was ingested since the state we already have
+    with profile.stage("fetch") as st:
+        events = await crud.load_events(db, incident_id, rows_range)
+        state, delta, refetched, series = None, None, None, None
+        latest = incremental_states.latest((incident_id, config.version))
+        if latest is not None and pruned_version <= latest[0] <= data_version:
+            state_version, state = latest
+            if state_version < data_version:
+                delta = await crud.load_metric_series(
+                    db, incident_id, since_version=state_version, rows_range=rows_range
+                )
+                if state.can_advance(delta):
+                    stale = state.needs_refetch(delta)
+                    refetched = {}
+                    if stale:
+                        refetched = await crud.load_metric_series(
+                            db, incident_id, metric_names=stale, rows_range=rows_range
+                        )
+                else:
+                    state = None
+        if state is None:
+            series = await crud.load_metric_series(db, incident_id, rows_range=rows_range)
+        await db.rollback()  # done reading; release the snapshot
+        fetched = [s for s in (series, delta, refetched) if s]
+        st.rows = sum(map(_count_points, fetched)) + len(events)
+        st.objects = sum(map(len, fetched))
+
+    def analyze() -> IncidentAnalysis:
+        with profile.stage("detect") as st:
+            current = state
+            if current is None:
+                current = IncidentState.from_series(data_version, series, config)
+                st.rows = _count_points(series)
+            elif delta is not None:
+                current = current.advance(data_version, delta, refetched)
+                st.rows = _count_points(delta) + _count_points(refetched)
+            else:
+                st.rows = 0
+            incremental_states.put((incident_id, config.version), data_version, current)
+            results = current.results()
+            st.objects = count_anomalies(results)
+        return IncidentAnalysis(incident_id, results, events, config.scoring)
+
+    return await run_in_threadpool(analyze)
+
+
+async def analyze_latest(
+    incident_id: str,
+    profile: Profile | None = None,
+    config: AnalysisConfig | None = None,
+):
+    """
+    Analysis of the incident's current data: (data_version, IncidentAnalysis,
+    source) with source "cache", "stored" or "computed", or None if there is
+    no such incident.
+
+    Uses a connection of its own (one, even while waiting for the lock), so
+    it can outlive the request that started it (see analysis_flights). With
+    ANALYSIS_CACHE_PERSIST, replicas coordinate too: computing holds a
+    per-incident advisory lock, and a replica that had to wait for it reads
+    the holder's result from analysis_results instead of computing the same
+    thing again. Only results of the configured analysis (`config` not
+    overridden per request) are persisted, which builds the full response.
+    """
+    config = config or analysis_config.current()
+    key = (incident_id, config.version)
+    # one pooled connection per analysis, whatever path it takes: the session
+    # is bound to it, so it stays checked out across the session's
+    # transactions and can carry the session-level advisory lock
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="REPEATABLE READ")
+        async with SessionLocal(bind=conn) as db:
+            return await _analyze_on(db, conn, incident_id, key, profile, config)
+
+
+async def _analyze_on(db: AsyncSession, conn, incident_id: str, key, profile: Profile | None, config: AnalysisConfig):
+    incident = await db.get(models.Incident, incident_id)
+    if incident is None:
+        return None
+    data_version = incident.data_version
+
+    # not get(): callers have already counted their own lookup; this only
+    # catches a result that landed since
+    cached = analysis_cache.latest(key)
+    if cached is not None and cached[0] == data_version:
+        return data_version, cached[1], "cache"
+
+    if not ANALYSIS_CACHE_PERSIST or config.overridden:
+        result = await compute_analysis(
+            db, incident_id, data_version, profile, rows_range=crud.incident_rows_range(incident),
+            config=config, pruned_version=incident.pruned_version,
+        )
+        analysis_cache.put(key, data_version, result)
+        return data_version, result, "computed"
+
+    stored = await crud.load_analysis_result(db, incident_id, data_version, config.version)
+    if stored is not None:
+        result = await run_in_threadpool(_load_result, stored)
+        analysis_cache.put(key, data_version, result)
+        return data_version, result, "stored"
+
+    # ends the snapshot above, so reads below see what a holder we waited
+    # for committed
+    outcome = await crud.lock_incident_analysis(db, incident_id, ANALYSIS_LOCK_TIMEOUT_SECONDS)
+    metrics.analysis_locks.labels(outcome).inc()
+    try:
+        incident = await db.get(models.Incident, incident_id, populate_existing=True)
+        if incident is None:
+            return None  # deleted (by retention) meanwhile
+        data_version = incident.data_version
+        if outcome == "waited":
+            # the holder has most likely just stored this very version
+            stored = await crud.load_analysis_result(db, incident_id, data_version, config.version)
+            if stored is not None:
+                result = await run_in_threadpool(_load_result, stored)
+                analysis_cache.put(key, data_version, result)
+                return data_version, result, "stored"
+
+        result = await compute_analysis(
+            db, incident_id, data_version, profile, rows_range=crud.incident_rows_range(incident),
+            config=config, pruned_version=incident.pruned_version,
+        )
+        analysis_cache.put(key, data_version, result)
+        dumped = await run_in_threadpool(_dump_result, result, profile)
+        # compute_analysis has ended its transaction; the upsert doesn't need a snapshot
+        await conn.execution_options(isolation_level="READ COMMITTED")
+        await crud.save_analysis_result(db, incident_id, data_version, config.version, dumped)
+        # committed before the lock is released, so whoever waited on it
+        # finds the result
+        await db.commit()
+        return data_version, result, "computed"
+    finally:
+        if outcome != "timeout":
+            await crud.unlock_incident_analysis(db, incident_id)
@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+
+from app.metrics import registry
+from app.schemas import StageTimingOut, TimingsOut
+
+
+# the numbered stages of an analysis, in pipeline order. Per-metric episode
+# collapse runs inside "detect" (same pass over each metric, possibly in a
+# worker process); "episodes" is ordering them across metrics + EpisodeOut
+STAGES = ("fetch", "detect", "episodes", "agreement", "causes", "response")
+
+# wall time per stage across every analysis this process computed
+stage_seconds = registry.histogram(
+    "sig_analysis_stage_duration_seconds",
+    "Wall time per analysis stage",
+    ["stage"],
+)
+
+
+class StageTiming:
+    __slots__ = ("seconds", "rows", "objects")
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.rows = None     # input rows the stage worked through
+        self.objects = None  # things it produced (anomalies, episodes, causes, ...)
+
+
+class Profile:
+    """
+    Per-stage wall time for one analysis.
+
+    Every analysis gets one: stage times always feed the process-wide
+    `stage_seconds` histograms, and with ?profile=1 the same numbers go back
+    in the response's `timings` block. A stage entered more than once (e.g.
+    response building, which happens in two places) accumulates.
+    """
+
+    def __init__(self):
+        self.stages: dict[str, StageTiming] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        timing = self.stages.setdefault(name, StageTiming())
+        start = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds += time.perf_counter() - start
+
+    def observe(self) -> None:
+        """Record this analysis' stage times in the histograms (once, when it's done)."""
+        for name, timing in self.stages.items():
+            stage_seconds.labels(name).observe(timing.seconds)
+
+    def timings(self, source: str, total_seconds: float) -> TimingsOut:
+        return TimingsOut(
+            source=source,
+            total_ms=round(total_seconds * 1000.0, 3),
+            stages=[
+                StageTimingOut(
+                    stage=name,
+                    wall_ms=round(self.stages[name].seconds * 1000.0, 3),
+                    rows=self.stages[name].rows,
+                    objects=self.stages[name].objects,
+                )
+                for name in STAGES
+                if name in self.stages
+            ],
+        )
+
+
+def stage_histograms() -> dict:
+    return {stage: stage_seconds.labels(stage).snapshot() for stage in STAGES}
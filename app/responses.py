@@ -0,0 +1,93 @@
+import json
+import re
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+
+# pydantic-core writes floats below 1e-4 or from 1e16 up as 0.00005 / 1e-7 /
+# 1e16, where json.dumps (FastAPI's JSONResponse) writes 5e-05 / 1e-07 / 1e+16.
+# Every other value (strings, ints, datetimes, floats in between) comes out
+# byte-for-byte the same. Both patterns start with a literal, so scanning a
+# large body for candidates is a fast C loop; most bodies have none.
+_EXPONENT = re.compile(rb"e[-0-9]")
+_SMALL = re.compile(rb"0\.0000")
+_NUMBER_CHARS = b"0123456789.-+e"
+# respelling is a Python-level loop; past this many candidates (a metric
+# that lives below 1e-4, say) json.dumps on the dumped dict is cheaper
+_MAX_RESPELL = 1000
+
+
+def _respell_floats(body: bytes) -> bytes | None:
+    """
+    `body` with every float token spelled the way json.dumps spells it, or
+    None if that isn't safe (escaped characters in strings) or cheap.
+    """
+    candidates = sorted(
+        [m.start() for m in _EXPONENT.finditer(body)] + [m.start() for m in _SMALL.finditer(body)]
+    )
+    if not candidates:
+        return body
+    if len(candidates) > _MAX_RESPELL or b"\\" in body:
+        # (an escaped quote would throw off the in-string check below)
+        return None
+
+    out, last = [], 0
+    quotes, counted = 0, 0
+    for pos in candidates:
+        if pos < last:
+            continue  # inside a token already rewritten
+        quotes += body.count(b'"', counted, pos)
+        counted = pos
+        if quotes % 2:
+            continue  # inside a string
+        start = pos
+        while start > 0 and body[start - 1] in _NUMBER_CHARS:
+            start -= 1
+        end = pos
+        while end < len(body) and body[end] in _NUMBER_CHARS:
+            end += 1
+        token = body[start:end]
+        try:
+            spelled = repr(float(token)).encode()
+        except ValueError:
+            return None
+        if spelled != token:
+            out.append(body[last:start])
+            out.append(spelled)
+            last = end
+    out.append(body[last:])
+    return b"".join(out)
+
+
+def render_json(model: BaseModel) -> bytes:
+    """
+    The exact bytes FastAPI would send for `model` as a response_model (with
+    exclude_unset), serialized in one pass by pydantic-core instead of
+    model -> dict -> json.dumps.
+    """
+    body = _respell_floats(model.__pydantic_serializer__.to_json(model, exclude_unset=True))
+    if body is not None:
+        return body
+    return json.dumps(
+        model.model_dump(mode="json", exclude_unset=True),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class ModelJSONResponse(Response):
+    """
+    JSONResponse for a pydantic model, rendered with render_json(). Bytes are
+    sent as they are, for bodies already rendered off the event loop (big
+    ones take a while: run render_json in a worker thread).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: BaseModel | bytes) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return render_json(content)
@@ -1,8 +1,8 @@
 
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class MetricIn(BaseModel):
@@ -17,13 +17,15 @@ class EventIn(BaseModel):
     meta: Optional[Dict[str, Any]] = Field(default=None, description="Arbitrary event metadata")
 
 
-class IngestRequest(BaseModel):
+class IncidentIn(BaseModel):
     incident_id: Optional[str] = Field(default=None,
                                        description="Optional client-provided incident ID")
     name: Optional[str] = Field(default=None, description="Human-readable name, e.g. incident_456")
     source: Optional[str] = Field(default=None, description="Where this came from, e.g. prod, ci")
     meta: Optional[Dict[str, Any]] = Field(default=None, description="Optional incident metadata")
 
+
+class IngestRequest(IncidentIn):
     metrics: List[MetricIn] = Field(default_factory=list)
     events: List[EventIn] = Field(default_factory=list)
 
@@ -60,10 +62,85 @@ class EpisodeOut(BaseModel):
     peak_value: float
     peak_z_score: float
     percent_change: float
+    level_shift: Optional[float] = Field(
+        default=None, description="change-point episodes only: segment mean minus baseline mean"
+    )
+
+
+class StageTimingOut(BaseModel):
+    stage: str
+    wall_ms: float
+    rows: Optional[int] = None
+    objects: Optional[int] = None
+
+
+class TimingsOut(BaseModel):
+    source: str = Field(..., description="computed, cache (in-memory), stored (analysis_results) or coalesced (shared a concurrent request's run)")
+    total_ms: float
+    stages: List[StageTimingOut] = Field(default_factory=list)
 
 
 class AnalysisResponse(BaseModel):
     incident_id: str
+    # sections left out with ?fields= are omitted from the response (built
+    # with model_construct, rendered with exclude_unset)
     anomalies: List[AnomalyOut]
     episodes: List[EpisodeOut]
     likely_causes: List[CauseOut]
+    next_anomalies_cursor: Optional[str] = Field(default=None,
+                                                 description="Only with anomalies_limit/anomalies_cursor; null on the last page")
+    next_episodes_cursor: Optional[str] = Field(default=None,
+                                                description="Only with episodes_limit/episodes_cursor; null on the last page")
+    timings: Optional[TimingsOut] = Field(default=None, description="Only with ?profile=1")
+
+
+class AnalysisJobOut(BaseModel):
+    job_id: str
+    incident_id: str
+    status: str = Field(..., description="queued, running, done or failed")
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    data_version: Optional[int] = Field(default=None, description="Incident data_version the result was computed from")
+    error: Optional[str] = None
+    result: Optional[AnalysisResponse] = Field(default=None, description="Full analysis, once status is done")
+
+
+class DetectorParams(BaseModel):
+    # unset fields keep their defaults (analysis.MetricConfig)
+    model_config = ConfigDict(extra="forbid")
+
+    detector: Optional[str] = Field(default=None, description="A registered detector, see available_detectors")
+    episode_method: Optional[Literal["gap", "cusum", "binseg"]] = None
+    z_threshold: Optional[float] = Field(default=None, gt=0)
+    min_points: Optional[int] = Field(default=None, ge=3, description="Shorter metrics aren't scored")
+    baseline_min_points: Optional[int] = Field(default=None, ge=2)
+    baseline_max_points: Optional[int] = Field(default=None, ge=2, description="Also the moving detectors' span")
+    episode_gap_seconds: Optional[float] = Field(default=None, ge=0)
+
+
+class DetectorRule(BaseModel):
+    pattern: str = Field(..., min_length=1, description="fnmatch-style metric name pattern, e.g. *error_rate*")
+    params: DetectorParams = Field(default_factory=DetectorParams)
+
+
+class ScoringParams(BaseModel):
+    # unset fields keep their defaults (analysis.ScoringConfig)
+    model_config = ConfigDict(extra="forbid")
+
+    cause_window_seconds: Optional[float] = Field(default=None, gt=0)
+    agreement_bonus: Optional[float] = Field(default=None, ge=0)
+    agreement_cap: Optional[float] = Field(default=None, ge=0)
+    event_priors: Optional[Dict[str, float]] = Field(default=None, description="Replaces the default priors")
+    default_event_prior: Optional[float] = Field(default=None, ge=0, description="Prior of unlisted event types")
+
+
+class AnalysisConfigIn(BaseModel):
+    detectors: List[DetectorRule] = Field(default_factory=list, description="First matching rule wins")
+    scoring: ScoringParams = Field(default_factory=ScoringParams)
+
+
+class AnalysisConfigOut(AnalysisConfigIn):
+    version: str = Field(..., description="Fingerprint of the config; results are cached per version")
+    available_detectors: List[str]
@@ -0,0 +1,172 @@
+"""
+Analysis job worker:
+
+    python -m app.worker
+
+Drains the analysis_jobs queue filled by POST /analysis/{incident_id}/jobs.
+Workers claim jobs with FOR UPDATE SKIP LOCKED, so any number of them, on
+any host, can share the queue; analysis throughput scales with the number of
+worker processes, independently of the API replicas. A running job's
+heartbeat is refreshed every third of ANALYSIS_JOB_LEASE_SECONDS; if it goes
+stale (the worker died) another worker picks the job up again, up to
+ANALYSIS_JOB_MAX_ATTEMPTS times.
+
+SIGTERM/SIGINT stop claiming new jobs and let the running ones finish.
+"""
+import asyncio
+import os
+import signal
+from datetime import timedelta
+
+from fastapi.concurrency import run_in_threadpool
+
+from app import analysis_config, crud, metrics
+from app.db import SessionLocal, engine
+from app.analysis import IncidentAnalysis
+from app.pipeline import analyze_latest
+from app.profiling import Profile
+
+# jobs one worker process runs at once; analysis is CPU-bound, so usually 1
+# and more processes instead
+ANALYSIS_WORKER_CONCURRENCY = int(os.getenv("ANALYSIS_WORKER_CONCURRENCY", "1"))
+# how long an idle worker waits before polling the queue again
+ANALYSIS_JOB_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_POLL_SECONDS", "1"))
+# a running job whose heartbeat is older than this is considered abandoned
+ANALYSIS_JOB_LEASE_SECONDS = float(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "60"))
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+# finished (done/failed) jobs, result included, are deleted this long after
+# they finish; 0 keeps them forever
+ANALYSIS_JOB_RETENTION_SECONDS = float(os.getenv("ANALYSIS_JOB_RETENTION_SECONDS", "86400"))
+
+
+async def _heartbeat(job_id: str) -> None:
+    while True:
+        await asyncio.sleep(ANALYSIS_JOB_LEASE_SECONDS / 3)
+        try:
+            async with SessionLocal() as db:
+                await crud.heartbeat_analysis_job(db, job_id)
+                await db.commit()
+        except Exception as e:
+            # a missed beat is retried at the next one; dying here would let
+            # the lease expire and another worker run the job again
+            print(f"analysis worker: heartbeat for job {job_id}: {type(e).__name__}: {e}")
+
+
+async def _finish(job_id: str, status: str, **values) -> None:
+    async with SessionLocal() as db:
+        await crud.finish_analysis_job(db, job_id, status, **values)
+        await db.commit()
+    metrics.analysis_jobs.labels(status).inc()
+
+
+async def _analyze(incident_id: str, profile: Profile) -> tuple[int, IncidentAnalysis]:
+    """(data_version, analysis) of the incident, from a cache when possible."""
+    analyzed = await analyze_latest(incident_id, profile)
+    if analyzed is None:
+        raise LookupError(f"incident {incident_id} not found")
+    data_version, result, _ = analyzed
+    return data_version, result
+
+
+def _dump(result: IncidentAnalysis, profile: Profile) -> dict:
+    dumped = result.response(profile=profile).model_dump(mode="json", exclude_unset=True)
+    profile.observe()
+    return dumped
+
+
+async def run_job(job_id: str, incident_id: str) -> None:
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        profile = Profile()
+        data_version, result = await _analyze(incident_id, profile)
+    except Exception as e:
+        status, values = "failed", {"error": f"{type(e).__name__}: {e}"}
+    else:
+        # in a thread, so the heartbeats of other slots' jobs keep going
+        dumped = await run_in_threadpool(_dump, result, profile)
+        status, values = "done", {"data_version": data_version, "result": dumped}
+    finally:
+        heartbeat.cancel()
+    await _finish(job_id, status, **values)
+
+
+async def _claim():
+    async with SessionLocal() as db:
+        claimed = await crud.claim_analysis_job(db, ANALYSIS_JOB_LEASE_SECONDS)
+        await db.commit()
+    return claimed
+
+
+async def work(stop: asyncio.Event) -> None:
+    """One job at a time until `stop` is set."""
+    while not stop.is_set():
+        try:
+            claimed = await _claim()
+            if claimed is not None:
+                job_id, incident_id, attempts = claimed
+                if attempts > ANALYSIS_JOB_MAX_ATTEMPTS:
+                    # its workers kept dying on it (OOM on a huge incident, say)
+                    await _finish(job_id, "failed", error=f"abandoned after {attempts - 1} attempts")
+                else:
+                    await run_job(job_id, incident_id)
+                continue
+        except Exception as e:
+            # database unreachable and the like; a job in flight is retried
+            # once its heartbeat goes stale
+            print(f"analysis worker: {type(e).__name__}: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), ANALYSIS_JOB_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def prune_jobs_periodically() -> None:
+    """Delete finished jobs older than ANALYSIS_JOB_RETENTION_SECONDS, every tenth of that."""
+    retention = timedelta(seconds=ANALYSIS_JOB_RETENTION_SECONDS)
+    while True:
+        try:
+            async with SessionLocal() as db:
+                deleted = await crud.delete_finished_analysis_jobs(db, retention)
+                await db.commit()
+            if deleted:
+                print(f"analysis worker: deleted {deleted} finished job(s)")
+        except Exception as e:
+            print(f"analysis worker: pruning jobs: {type(e).__name__}: {e}")
+        await asyncio.sleep(ANALYSIS_JOB_RETENTION_SECONDS / 10)
+
+
+async def main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # worker metrics (job outcomes, stage timings) reach /metrics through the
+    # shared snapshot directory, like the API workers'
+    flush = None
+    if metrics.METRICS_MULTIPROC_DIR:
+        flush = asyncio.create_task(metrics.flush_periodically())
+
+    # jobs analyze with the same detection config as the API
+    await analysis_config.load(engine)
+    config_reload = asyncio.create_task(analysis_config.reload_periodically(engine))
+    # every worker prunes; the deletes are idempotent
+    prune = None
+    if ANALYSIS_JOB_RETENTION_SECONDS > 0:
+        prune = asyncio.create_task(prune_jobs_periodically())
+
+    print(f"analysis worker {os.getpid()}: {ANALYSIS_WORKER_CONCURRENCY} slot(s)")
+    try:
+        await asyncio.gather(*(work(stop) for _ in range(ANALYSIS_WORKER_CONCURRENCY)))
+    finally:
+        config_reload.cancel()
+        if prune is not None:
+            prune.cancel()
+        if flush is not None:
+            flush.cancel()
+            metrics.write_snapshot()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
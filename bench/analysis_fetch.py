@@ -0,0 +1,134 @@
+"""
+Benchmark the analysis read path: ORM hydration vs. column-only streaming.
+
+Seeds a throwaway incident of N points straight in Postgres (generate_series,
+so the seeding itself doesn't need client memory), then reads it back in a
+fresh subprocess per mode so peak RSS is measured in isolation.
+
+    python -m bench.analysis_fetch --points 100000 1000000 5000000
+
+Needs DATABASE_URL (same as the app) pointing at a migrated database.
+"""
+import argparse
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import contains_eager
+
+from app import crud, models, partitions
+from app.analysis import group_series
+from app.db import SessionLocal, engine
+
+START = datetime(2026, 1, 1)
+
+
+async def seed(n_points: int, n_metrics: int) -> str:
+    end = START + timedelta(seconds=10 * (n_points // n_metrics))
+    await partitions.ensure_committed(engine, {"metric_points": (START, end)})
+    async with SessionLocal() as db:
+        incident = models.Incident(name=f"bench-fetch-{n_points}", source="bench")
+        db.add(incident)
+        await db.flush()
+        await db.execute(
+            text(
+                """
+                INSERT INTO metric_series (incident_id, name)
+                SELECT :incident_id, 'metric_' || lpad(m::text, 4, '0')
+                FROM generate_series(0, :n_metrics - 1) AS m
+                """
+            ),
+            {"incident_id": incident.id, "n_metrics": n_metrics},
+        )
+        await db.execute(
+            text(
+                """
+                INSERT INTO metric_points (series_id, ts, value)
+                SELECT s.id,
+                       CAST(:start AS timestamp) + (g / :n_metrics) * interval '10 seconds',
+                       random() * 100
+                FROM generate_series(0, :n_points - 1) AS g
+                JOIN metric_series s
+                  ON s.incident_id = :incident_id
+                 AND s.name = 'metric_' || lpad((g % :n_metrics)::text, 4, '0')
+                """
+            ),
+            {"incident_id": incident.id, "n_points": n_points, "n_metrics": n_metrics, "start": START},
+        )
+        await db.commit()
+        return incident.id
+
+
+async def drop(incident_id: str) -> None:
+    async with SessionLocal() as db:
+        # points go with their series (ON DELETE CASCADE)
+        await db.execute(delete(models.MetricSeries).where(models.MetricSeries.incident_id == incident_id))
+        await db.execute(delete(models.Incident).where(models.Incident.id == incident_id))
+        await db.commit()
+
+
+async def read(mode: str, incident_id: str) -> None:
+    async with SessionLocal() as db:
+        start = time.perf_counter()
+        if mode == "orm":
+            # what analyze_incident used to do
+            points = (
+                await db.scalars(
+                    select(models.MetricPoint)
+                    .join(models.MetricPoint.series)
+                    .options(contains_eager(models.MetricPoint.series))
+                    .where(models.MetricSeries.incident_id == incident_id)
+                    .order_by(models.MetricSeries.name, models.MetricPoint.ts)
+                )
+            ).all()
+            series = group_series((p.series.name, p.ts, p.value) for p in points)
+        else:
+            series = await crud.load_metric_series(db, incident_id)
+        elapsed = time.perf_counter() - start
+
+    rows = sum(len(values) for _, values in series.values())
+    # ru_maxrss is KiB on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{rows}\t{elapsed:.3f}\t{peak_mb:.1f}")
+
+
+async def run(points: list[int], n_metrics: int) -> None:
+    print(f"{'points':>10} {'mode':>8} {'rows/s':>12} {'peak MB':>10}")
+    for n_points in points:
+        incident_id = await seed(n_points, n_metrics)
+        try:
+            for mode in ("orm", "columns"):
+                # blocking on purpose: nothing else runs on this loop
+                out = subprocess.run(
+                    [sys.executable, "-m", "bench.analysis_fetch", "--read", mode, "--incident", incident_id],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout.strip().splitlines()[-1]
+                rows, elapsed, peak_mb = out.split("\t")
+                rate = int(rows) / max(float(elapsed), 1e-9)
+                print(f"{n_points:>10} {mode:>8} {rate:>12,.0f} {float(peak_mb):>10.1f}")
+        finally:
+            await drop(incident_id)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--read", choices=["orm", "columns"], help=argparse.SUPPRESS)
+    parser.add_argument("--incident", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.read:
+        asyncio.run(read(args.read, args.incident))
+    else:
+        asyncio.run(run(args.points, args.metrics))
+
+
+if __name__ == "__main__":
+    main()
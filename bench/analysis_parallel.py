@@ -0,0 +1,48 @@
+"""
+Benchmark per-metric detection fan-out: speedup vs. number of processes.
+
+Runs entirely in-process on synthetic series (no database needed):
+
+    python -m bench.analysis_parallel --metrics 2000 --points 5000
+
+Pools are warmed up before timing, so process start-up isn't counted.
+"""
+import argparse
+import os
+import time
+
+from app import analysis
+from bench.synthetic import generate
+
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", type=int, default=2000)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=[p for p in (1, 2, 4, 8, 16, 32) if p <= cpus])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    series = generate(n_metrics=args.metrics, points_per_metric=args.points, seed=args.seed).series
+    # force the pool path for every process count > 1
+    analysis.ANALYSIS_PARALLEL_MIN_POINTS = 0
+
+    print(f"{args.metrics} metrics x {args.points} points, {cpus} cpus")
+    print(f"{'processes':>10} {'best s':>10} {'speedup':>10}")
+    single = None
+    for processes in args.processes:
+        analysis.analyze_metrics(series, processes=processes)  # warm-up (spawns the pool)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            analysis.analyze_metrics(series, processes=processes)
+            best = min(best, time.perf_counter() - start)
+        single = single or best
+        print(f"{processes:>10} {best:>10.3f} {single / best:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+from bench.suite import TIERS
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--tiers", default="small,medium",
+        help=f"comma-separated size tiers to benchmark, of {','.join(TIERS)} (default: small,medium)",
+    )
+    parser.addoption("--seed", type=int, default=0, help="synthetic incident seed")
+
+
+def pytest_generate_tests(metafunc):
+    if "tier_name" in metafunc.fixturenames:
+        names = [name.strip() for name in metafunc.config.getoption("--tiers").split(",") if name.strip()]
+        unknown = sorted(set(names) - set(TIERS))
+        if unknown:
+            raise ValueError(f"unknown tiers {unknown}; expected any of {list(TIERS)}")
+        metafunc.parametrize("tier_name", names, scope="module")
@@ -0,0 +1,98 @@
+"""
+Benchmark the detectors against each other, and the order-statistics
+strategies behind the robust ones.
+
+Runs entirely in-process on synthetic series (no database needed):
+
+    python -m bench.detectors --metrics 200 --points 5000
+
+First table: detection + episode collapse over the whole incident per
+detector (what ?detector= selects), anomalies found and time relative to the
+mean/std baseline. Second table: the same order statistics computed three
+ways - selection (np.partition, what the detectors use), a full sort
+(np.median), and a sorted window kept up to date point by point with bisect
+(the classic streaming rolling median), on one metric of --window-points.
+Last: the fixed baseline's mean/std vs median/MAD on one metric.
+"""
+import argparse
+import time
+from bisect import bisect_left, insort
+
+import numpy as np
+
+from app import analysis
+from bench.synthetic import generate
+
+
+def best_of(repeat: int, fn) -> tuple[float, object]:
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def sorted_window_medians(values: np.ndarray, w: int) -> np.ndarray:
+    """Median of the w points before each point, from a bisect-maintained sorted window."""
+    out = np.full(len(values), np.nan)
+    window: list[float] = []
+    xs = values.tolist()
+    for i, x in enumerate(xs):
+        if len(window) == w:
+            out[i] = (window[(w - 1) // 2] + window[w // 2]) / 2
+            del window[bisect_left(window, xs[i - w])]
+        insort(window, x)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--window-points", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    series = generate(n_metrics=args.metrics, points_per_metric=args.points, seed=args.seed).series
+    print(f"{args.metrics} metrics x {args.points} points (in-process)")
+    print(f"  {'detector':<15} {'anomalies':>10} {'episodes':>9} {'best s':>8} {'vs baseline':>12}")
+    reference = None
+    for detector in analysis.DETECTORS:
+        config = analysis.DEFAULT_ANALYSIS_CONFIG.override(detector)
+        elapsed, results = best_of(args.repeat, lambda: analysis.analyze_metrics(series, processes=1, config=config))
+        results = [r for r in results.values() if r is not None]
+        reference = reference or elapsed
+        print(
+            f"  {detector:<15} {sum(len(r['ts']) for r in results):>10} "
+            f"{sum(len(r['episodes']) for r in results):>9} {elapsed:>8.3f} {elapsed / reference:>11.2f}x"
+        )
+
+    w = analysis.BASELINE_MAX_POINTS
+    values = np.random.default_rng(args.seed).normal(100.0, 5.0, args.window_points)
+    windows = np.lib.stride_tricks.sliding_window_view(values[:-1], w)
+    chunk = analysis._WINDOW_CHUNK
+    print(f"\nmedian of the {w} points before each of {args.window_points:,} points")
+    strategies = {
+        "partition": lambda: [analysis._median_rows(windows[lo:lo + chunk]) for lo in range(0, len(windows), chunk)],
+        "sort": lambda: [np.median(windows[lo:lo + chunk], axis=1) for lo in range(0, len(windows), chunk)],
+        "sorted window": lambda: sorted_window_medians(values, w),
+    }
+    outputs = {}
+    for name, fn in strategies.items():
+        elapsed, out = best_of(args.repeat, fn)
+        outputs[name] = out
+        print(f"  {name:<15} {elapsed:>8.3f} s")
+    assert np.array_equal(np.concatenate(outputs["partition"]), outputs["sorted window"][w:])
+
+    metric = values[: args.points]
+    print(f"\nfixed-baseline detection of one {args.points}-point metric")
+    for name, detector in (("mean/std", "baseline"), ("median/MAD", "robust")):
+        config = analysis.MetricConfig(detector=detector)
+        elapsed, _ = best_of(args.repeat * 100, lambda: analysis.detect_point_anomalies(metric, config))
+        print(f"  {name:<15} {elapsed * 1e6:>8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
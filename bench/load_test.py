@@ -0,0 +1,73 @@
+"""
+Closed-loop HTTP load test against a running server.
+
+`--concurrency` workers each send requests back-to-back for `--duration`
+seconds and the sustained RPS and latency percentiles are reported. Run it
+against two builds (e.g. before/after a change) with the same flags to compare.
+
+    uvicorn app.main:app --workers 1 &
+    python -m bench.load_test --incident <id> --concurrency 64 --duration 30
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, path: str, deadline: float, latencies: list, errors: list) -> None:
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            resp = await client.get(path)
+            if resp.status_code != 200:
+                errors.append(resp.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct))]
+
+
+async def run(base_url: str, path: str, concurrency: int, duration: float) -> None:
+    latencies: list[float] = []
+    errors: list = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        start = time.perf_counter()
+        deadline = start + duration
+        await asyncio.gather(*(worker(client, path, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{path}  concurrency={concurrency}  duration={elapsed:.1f}s")
+    print(f"  requests ok : {len(latencies)}   errors: {len(errors)}")
+    print(f"  sustained   : {len(latencies) / elapsed:,.1f} req/s")
+    print(
+        "  latency ms  : "
+        f"p50={percentile(latencies, 0.50) * 1000:.1f}  "
+        f"p95={percentile(latencies, 0.95) * 1000:.1f}  "
+        f"p99={percentile(latencies, 0.99) * 1000:.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--incident", help="incident to hit with GET /analysis/{id}; defaults to /health")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+
+    path = f"/analysis/{args.incident}" if args.incident else "/health"
+    asyncio.run(run(args.base_url, path, args.concurrency, args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark AnalysisResponse serialization: FastAPI's default response_model
+path vs. render_json(), checking the bytes are identical to what
+response_model_exclude_unset sends (tests/test_responses.py covers that
+spelling parity case by case).
+
+    python -m bench.serialization --metrics 200 --points 2000
+    python -m bench.serialization --value-scale 1e-6   # tiny values: exercises the json.dumps fallback
+
+Runs in-process on a synthetic incident (no database needed).
+"""
+import argparse
+import os
+import time
+
+# never connects; app.db just insists on a URL
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from fastapi.utils import create_model_field  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+from app.analysis import run_analysis  # noqa: E402
+from app.responses import render_json  # noqa: E402
+from app.schemas import AnalysisResponse  # noqa: E402
+from bench.synthetic import generate  # noqa: E402
+
+
+def best_of(repeat: int, fn):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--step-fraction", type=float, default=0.4)
+    parser.add_argument("--value-scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    incident = generate(
+        n_metrics=args.metrics,
+        points_per_metric=args.points,
+        step_fraction=args.step_fraction,
+        seed=args.seed,
+    )
+    series = {name: (ts, values * args.value_scale) for name, (ts, values) in incident.series.items()}
+
+    build, result = best_of(args.repeat, lambda: run_analysis("bench", series, incident.events))
+
+    # what FastAPI does with a response_model by default: validate, dump to a
+    # dict, json.dumps
+    field = create_model_field(name="response", type_=AnalysisResponse, mode="serialization")
+
+    def fastapi_path() -> bytes:
+        value, _ = field.validate(result, {}, loc=("response",))
+        return JSONResponse(field.serialize(value)).body
+
+    old, _ = best_of(args.repeat, fastapi_path)
+    new, new_body = best_of(args.repeat, lambda: render_json(result))
+    # render_json leaves unset fields out, like response_model_exclude_unset
+    expected = JSONResponse(field.serialize(result, exclude_unset=True)).body
+
+    print(f"{len(result.anomalies):,} anomalies, {len(result.episodes):,} episodes, {len(new_body) / 2**20:.1f} MB")
+    print(f"  analysis (incl. response build) {build:8.3f} s")
+    print(f"  response_model + JSONResponse   {old:8.3f} s")
+    print(f"  render_json                     {new:8.3f} s  ({old / new:.1f}x)")
+    print(f"  identical bytes (vs. response_model_exclude_unset): {expected == new_body}")
+
+
+if __name__ == "__main__":
+    main()
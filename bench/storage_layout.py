@@ -0,0 +1,177 @@
+"""
+Compare the metric_points storage layouts: the original one (uuid string id,
+incident_id and metric_name on every row, three indexes repeating them)
+against the dictionary-encoded one (metric_series + points keyed by
+(series_id, ts)).
+
+Both are built side by side in a scratch schema from the same generated
+points, so the numbers don't depend on what's already in the database:
+
+    python -m bench.storage_layout --points 1000000 --metrics 200
+
+Reports heap / index / total size per layout and the time of the analysis
+read query (every point of one incident, ordered by metric name and ts).
+Needs DATABASE_URL; everything runs in one transaction that is rolled back.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.db import engine
+
+SCHEMA = "bench_storage"
+
+LEGACY_DDL = [
+    f"""
+    CREATE TABLE {SCHEMA}.legacy_points (
+        id text PRIMARY KEY,
+        incident_id text NOT NULL,
+        ts timestamp NOT NULL,
+        metric_name text NOT NULL,
+        value double precision NOT NULL,
+        ingest_version integer NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    INSERT INTO {SCHEMA}.legacy_points (id, incident_id, ts, metric_name, value)
+    SELECT gen_random_uuid()::text,
+           i.id,
+           timestamp '2026-01-01' + (g / :n_metrics) * interval '10 seconds',
+           'metric_' || lpad((g % :n_metrics)::text, 4, '0'),
+           random() * 100
+    FROM {SCHEMA}.incidents i, generate_series(0, :n_points - 1) AS g
+    """,
+    f"CREATE INDEX ON {SCHEMA}.legacy_points (incident_id, ts)",
+    f"CREATE INDEX ON {SCHEMA}.legacy_points (incident_id, metric_name, ts)",
+    f"CREATE INDEX ON {SCHEMA}.legacy_points (incident_id, ingest_version)",
+]
+
+SERIES_DDL = [
+    f"""
+    CREATE TABLE {SCHEMA}.metric_series (
+        id serial PRIMARY KEY,
+        incident_id text NOT NULL,
+        name text NOT NULL,
+        UNIQUE (incident_id, name) INCLUDE (id)
+    )
+    """,
+    f"""
+    INSERT INTO {SCHEMA}.metric_series (incident_id, name)
+    SELECT DISTINCT incident_id, metric_name FROM {SCHEMA}.legacy_points ORDER BY 1, 2
+    """,
+    f"""
+    CREATE TABLE {SCHEMA}.points (
+        series_id integer NOT NULL,
+        ingest_version integer NOT NULL DEFAULT 0,
+        ts timestamp NOT NULL,
+        value double precision NOT NULL
+    )
+    """,
+    f"""
+    INSERT INTO {SCHEMA}.points (series_id, ingest_version, ts, value)
+    SELECT s.id, p.ingest_version, p.ts, p.value
+    FROM {SCHEMA}.legacy_points p
+    JOIN {SCHEMA}.metric_series s ON s.incident_id = p.incident_id AND s.name = p.metric_name
+    """,
+    f"ALTER TABLE {SCHEMA}.points ADD PRIMARY KEY (series_id, ts) INCLUDE (value)",
+    f"CREATE INDEX ON {SCHEMA}.points (series_id, ingest_version)",
+]
+
+READS = {
+    "legacy": f"""
+        SELECT metric_name, ts, value FROM {SCHEMA}.legacy_points
+        WHERE incident_id = :incident_id
+        ORDER BY metric_name, ts
+    """,
+    "series": f"""
+        SELECT s.name, p.ts, p.value
+        FROM {SCHEMA}.metric_series s JOIN {SCHEMA}.points p ON p.series_id = s.id
+        WHERE s.incident_id = :incident_id
+        ORDER BY s.name, p.ts
+    """,
+}
+
+SIZES = {
+    "legacy": ["legacy_points"],
+    "series": ["points", "metric_series"],
+}
+
+
+async def build(conn, n_incidents: int, n_points: int, n_metrics: int) -> None:
+    await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+    await conn.execute(text(f"CREATE TABLE {SCHEMA}.incidents (id text PRIMARY KEY)"))
+    await conn.execute(
+        text(f"INSERT INTO {SCHEMA}.incidents SELECT gen_random_uuid()::text FROM generate_series(1, :n)"),
+        {"n": n_incidents},
+    )
+    params = {"n_points": n_points, "n_metrics": n_metrics}
+    for stmt in LEGACY_DDL + SERIES_DDL:
+        await conn.execute(text(stmt), params)
+    # (VACUUM can't run in the transaction, so the visibility map stays empty
+    # and the series read still visits the heap; in production autovacuum's
+    # insert threshold sets it and that read becomes index-only)
+    await conn.execute(text(f"ANALYZE {SCHEMA}.legacy_points"))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.points"))
+    await conn.execute(text(f"ANALYZE {SCHEMA}.metric_series"))
+
+
+async def sizes(conn, tables: list[str]) -> tuple[int, int]:
+    heap = index = 0
+    for table in tables:
+        row = (
+            await conn.execute(
+                text("SELECT pg_table_size(:t), pg_indexes_size(:t)"),
+                {"t": f"{SCHEMA}.{table}"},
+            )
+        ).one()
+        heap += row[0]
+        index += row[1]
+    return heap, index
+
+
+async def time_read(conn, sql: str, incident_id: str, repeat: int) -> tuple[float, int]:
+    best, rows = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = len((await conn.execute(text(sql), {"incident_id": incident_id})).all())
+        best = min(best, time.perf_counter() - start)
+    return best, rows
+
+
+async def run(n_incidents: int, n_points: int, n_metrics: int, repeat: int) -> None:
+    async with engine.connect() as conn:
+        try:
+            await build(conn, n_incidents, n_points, n_metrics)
+            incident_id = (await conn.execute(text(f"SELECT min(id) FROM {SCHEMA}.incidents"))).scalar_one()
+            total_points = n_incidents * n_points
+
+            print(f"{n_incidents} incidents x {n_points:,} points ({n_metrics} metrics each)")
+            print(f"  {'layout':<8} {'heap MB':>9} {'index MB':>9} {'total MB':>9} {'B/point':>8} {'read s':>8}")
+            for layout in ("legacy", "series"):
+                heap, index = await sizes(conn, SIZES[layout])
+                elapsed, rows = await time_read(conn, READS[layout], incident_id, repeat)
+                assert rows == n_points, (layout, rows)
+                total = heap + index
+                print(
+                    f"  {layout:<8} {heap / 2**20:>9.1f} {index / 2**20:>9.1f} {total / 2**20:>9.1f}"
+                    f" {total / total_points:>8.1f} {elapsed:>8.3f}"
+                )
+        finally:
+            await conn.rollback()
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incidents", type=int, default=4)
+    parser.add_argument("--points", type=int, default=1_000_000, help="points per incident")
+    parser.add_argument("--metrics", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.incidents, args.points, args.metrics, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
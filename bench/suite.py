@@ -0,0 +1,220 @@
+"""
+Ingest + analysis benchmark suite over synthetic incidents.
+
+For each size tier it reports wall time and throughput per stage, plus peak
+traced memory with --memory (tracemalloc, so numpy buffers are included; it
+slows the pure-Python stages down several times, so don't compare timings
+across the two modes):
+
+    parse      IngestRequest validation of the JSON payload
+    ingest     build/execute the chunked INSERTs
+    fetch      stream the points back and group them into per-metric arrays
+    detect     per-metric detection + episode collapse (analyze_metrics)
+    score      agreement, cause scoring and response construction
+    serialize  AnalysisResponse -> JSON (render_json, as the endpoint does)
+
+By default everything runs in-process: the ingest stage compiles every
+INSERT for Postgres but doesn't execute it, and "fetch" folds the generated
+rows through SeriesBuilder. With --database the same stages hit the Postgres
+in DATABASE_URL (a throwaway incident per tier, removed afterwards).
+
+    python -m bench.suite --tiers small medium
+    python -m bench.suite --tiers medium --memory
+    python -m bench.suite --tiers large --database
+
+The in-process stages are also pytest-benchmark benchmarks
+(bench/test_bench.py), for repeated rounds, stats and comparing saved runs:
+
+    pytest bench/ --tiers=small,medium
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# the in-process stand-in never connects, but app.db insists on a URL
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/unused")
+
+from sqlalchemy import delete  # noqa: E402
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from app import crud, models, partitions  # noqa: E402
+from app.analysis import SeriesBuilder, analyze_metrics, score_incident  # noqa: E402
+from app.responses import render_json  # noqa: E402
+from app.schemas import IngestRequest  # noqa: E402
+from bench.synthetic import generate  # noqa: E402
+
+TIERS = {
+    # name: (metrics, points per metric)
+    "small": (50, 200),
+    "medium": (200, 1_000),
+    "large": (1_000, 2_000),
+    "xlarge": (2_000, 5_000),
+}
+
+
+class DryRunSession:
+    """Stands in for AsyncSession on the ingest path: compiles statements, runs nothing."""
+
+    _dialect = postgresql.dialect()
+
+    async def execute(self, stmt, params=None):
+        stmt.compile(dialect=self._dialect)
+        return SimpleNamespace(rowcount=0)
+
+
+class Stages:
+    def __init__(self):
+        self.rows = []
+
+    def _record(self, name: str, items: int, elapsed: float) -> None:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20 if tracemalloc.is_tracing() else None
+        self.rows.append((name, elapsed, items / elapsed if elapsed else 0.0, peak))
+
+    def run(self, name: str, items: int, fn):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = fn()
+        self._record(name, items, time.perf_counter() - start)
+        return result
+
+    async def run_async(self, name: str, items: int, coro_fn):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = await coro_fn()
+        self._record(name, items, time.perf_counter() - start)
+        return result
+
+    def print(self, title: str):
+        print(title)
+        print(f"  {'stage':<10} {'seconds':>9} {'items/s':>14} {'peak MB':>9}")
+        for name, elapsed, rate, peak_mb in self.rows:
+            peak = "-" if peak_mb is None else f"{peak_mb:.1f}"
+            print(f"  {name:<10} {elapsed:>9.3f} {rate:>14,.0f} {peak:>9}")
+
+
+def parse(payload: bytes) -> IngestRequest:
+    return IngestRequest.model_validate_json(payload)
+
+
+async def ingest_dry(request: IngestRequest, metric_names: list[str]) -> None:
+    dry = DryRunSession()
+    # series ids would come back from the database; make some up
+    series_ids = {name: i for i, name in enumerate(metric_names)}
+    await crud.insert_metric_points(dry, "bench", request.metrics, 1, series_ids=series_ids)
+    await crud.insert_events(dry, "bench", request.events)
+
+
+def fetch_in_process(request: IngestRequest) -> dict:
+    builder = SeriesBuilder()
+    builder.extend((m.metric_name, m.ts, m.value) for m in request.metrics)
+    return builder.build()
+
+
+def detect(series: dict) -> dict:
+    return {k: v for k, v in analyze_metrics(series).items() if v is not None}
+
+
+def score(results: dict, events: list):
+    return score_incident("bench", results, events)
+
+
+def serialize(response) -> bytes:
+    return render_json(response)
+
+
+def prepare(n_metrics: int, points: int, seed: int = 0) -> SimpleNamespace:
+    """The input of every in-process stage for a tier (the stages before it, run once)."""
+    incident = generate(n_metrics=n_metrics, points_per_metric=points, seed=seed)
+    payload = incident.ingest_request().model_dump_json().encode()
+    request = parse(payload)
+    series = fetch_in_process(request)
+    results = detect(series)
+    return SimpleNamespace(
+        n_points=incident.n_points,
+        payload=payload,
+        request=request,
+        metric_names=list(incident.series),
+        series=series,
+        results=results,
+        events=incident.events,
+        response=score(results, incident.events),
+    )
+
+
+async def run_tier(name: str, n_metrics: int, points: int, database: bool, seed: int) -> None:
+    incident = generate(n_metrics=n_metrics, points_per_metric=points, seed=seed)
+    n = incident.n_points
+    payload = incident.ingest_request().model_dump_json().encode()
+    events = incident.events
+    incident_names = list(incident.series)
+    del incident  # only the payload survives, like on the server
+    stages = Stages()
+
+    request = stages.run("parse", n, lambda: parse(payload))
+
+    if database:
+        from app.db import SessionLocal, engine
+
+        async with SessionLocal() as db:
+            async def ingest():
+                metrics_range = crud.ts_range(request.metrics)
+                events_range = crud.ts_range(request.events)
+                await partitions.ensure_committed(
+                    engine, {"metric_points": metrics_range or (), "events": events_range or ()}
+                )
+                inc = await crud.get_or_create_incident(db, request)
+                version = await crud.lock_next_version(db, inc.id)
+                await crud.insert_metric_points(db, inc.id, request.metrics, version)
+                await crud.insert_events(db, inc.id, request.events)
+                await crud.bump_data_version(db, inc.id, crud.widen_range(metrics_range, events_range))
+                await db.commit()
+                return inc.id
+
+            incident_id = await stages.run_async("ingest", n, ingest)
+            try:
+                async def fetch():
+                    events = await crud.load_events(db, incident_id)
+                    return await crud.load_metric_series(db, incident_id), events
+
+                series, events = await stages.run_async("fetch", n, fetch)
+                await db.rollback()
+            finally:
+                # points go with their series (ON DELETE CASCADE)
+                await db.execute(delete(models.MetricSeries).where(models.MetricSeries.incident_id == incident_id))
+                await db.execute(delete(models.Event).where(models.Event.incident_id == incident_id))
+                await db.execute(delete(models.Incident).where(models.Incident.id == incident_id))
+                await db.commit()
+    else:
+        await stages.run_async("ingest", n, lambda: ingest_dry(request, incident_names))
+        series = stages.run("fetch", n, lambda: fetch_in_process(request))
+
+    results = stages.run("detect", n, lambda: detect(series))
+    response = stages.run("score", n, lambda: score(results, events))
+    stages.run("serialize", n, lambda: serialize(response))
+
+    mode = "postgres" if database else "in-process"
+    stages.print(f"{name}: {n_metrics} metrics x {points} points = {n:,} points ({mode})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"])
+    parser.add_argument("--database", action="store_true", help="run ingest/fetch against DATABASE_URL")
+    parser.add_argument("--memory", action="store_true", help="trace peak memory per stage (slower)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.memory:
+        tracemalloc.start()
+    for name in args.tiers:
+        n_metrics, points = TIERS[name]
+        asyncio.run(run_tier(name, n_metrics, points, args.database, args.seed))
+
+
+if __name__ == "__main__":
+    main()
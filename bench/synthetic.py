@@ -0,0 +1,113 @@
+"""
+Deterministic synthetic incidents for benchmarks.
+
+The same arguments (including `seed`) always produce the same incident, so
+runs on different commits are comparable. Metrics are noisy around a per-metric
+level; a fraction of them get a step change or a burst of spikes injected
+after the baseline window, and events are sprinkled over the timeline with a
+bias towards just before the injected anomalies (like a bad deploy would be).
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.schemas import EventIn, IngestRequest, MetricIn
+
+EVENT_TYPES = ["deploy", "config_change", "feature_flag", "db_migration", "incident_note"]
+
+# same shape as the rows crud.load_events() returns
+SyntheticEvent = namedtuple("SyntheticEvent", ["id", "ts", "event_type", "meta"])
+
+
+class SyntheticIncident:
+    def __init__(self, series: dict, events: list):
+        self.series = series  # {metric_name: (ts datetime64[us], values float64)}, name-sorted
+        self.events = events  # [SyntheticEvent], ts-sorted
+
+    @property
+    def n_points(self) -> int:
+        return sum(len(values) for _, values in self.series.values())
+
+    def rows(self):
+        """(metric_name, ts, value) rows ordered like the analysis query returns them."""
+        for name, (ts, values) in self.series.items():
+            yield from zip([name] * len(ts), ts.tolist(), values.tolist())
+
+    def metrics_in(self):
+        for name, ts, value in self.rows():
+            yield MetricIn(ts=ts, metric_name=name, value=value)
+
+    def events_in(self):
+        for ev in self.events:
+            yield EventIn(ts=ev.ts, event_type=ev.event_type, meta=ev.meta)
+
+    def ingest_request(self, incident_id: str | None = None) -> IngestRequest:
+        return IngestRequest(
+            incident_id=incident_id,
+            name="synthetic",
+            source="bench",
+            metrics=list(self.metrics_in()),
+            events=list(self.events_in()),
+        )
+
+
+def generate(
+    n_metrics: int = 50,
+    points_per_metric: int = 360,
+    interval: timedelta = timedelta(seconds=10),
+    step_fraction: float = 0.1,
+    spike_fraction: float = 0.1,
+    events_per_hour: float = 6.0,
+    seed: int = 0,
+    start: datetime = datetime(2026, 1, 1),
+) -> SyntheticIncident:
+    """
+    Build a synthetic incident.
+
+    `step_fraction` of the metrics get a sustained level shift and
+    `spike_fraction` get a handful of isolated spikes, both placed after the
+    first quarter of the series so they land outside the baseline window.
+    """
+    rng = np.random.default_rng(seed)
+    step = np.timedelta64(interval)
+    ts = np.datetime64(start, "us") + np.arange(points_per_metric) * step
+    anomaly_starts = []
+
+    series = {}
+    for i in range(n_metrics):
+        level = rng.uniform(10.0, 1000.0)
+        values = rng.normal(level, level * 0.05, points_per_metric)
+
+        kind = rng.random()
+        if kind < step_fraction:
+            at = int(rng.integers(points_per_metric // 4, points_per_metric))
+            values[at:] += level * rng.uniform(0.5, 3.0)
+            anomaly_starts.append(at)
+        elif kind < step_fraction + spike_fraction:
+            at = rng.integers(points_per_metric // 4, points_per_metric, size=5)
+            values[at] += level * rng.uniform(0.5, 3.0, size=5)
+            anomaly_starts.append(int(at.min()))
+
+        series[f"metric_{i:05d}"] = (ts, values)
+
+    hours = points_per_metric * interval.total_seconds() / 3600.0
+    n_events = int(rng.poisson(events_per_hour * hours))
+    offsets = rng.integers(0, points_per_metric, size=n_events).tolist()
+    # make about a third of the events "precede" an injected anomaly
+    for k in range(min(len(anomaly_starts), n_events // 3)):
+        offsets[k] = max(0, anomaly_starts[k] - int(rng.integers(1, 30)))
+
+    events = sorted(
+        (
+            SyntheticEvent(
+                f"evt-{k:06d}",
+                (ts[off] + np.timedelta64(int(rng.integers(0, 1_000_000)), "us")).item(),
+                EVENT_TYPES[int(rng.integers(0, len(EVENT_TYPES)))],
+                {"seq": k},
+            )
+            for k, off in enumerate(offsets)
+        ),
+        key=lambda e: e[1],
+    )
+    return SyntheticIncident(series, events)
@@ -0,0 +1,64 @@
+"""
+Per-stage pytest-benchmark benchmarks of the ingest + analysis path over
+synthetic incidents: the in-process stages of bench/suite.py, each timed on
+the output of the stages before it (built once per tier). Not part of the
+test suite; run them explicitly:
+
+    pytest bench/ --tiers=small,medium
+    pytest bench/ --tiers=large --benchmark-autosave
+    pytest bench/ --tiers=large --benchmark-compare   # against the last saved run
+
+Results are grouped per tier; extra_info carries the tier's point count, so
+throughput is points / mean.
+"""
+import asyncio
+
+import pytest
+
+from bench import suite
+
+
+@pytest.fixture(scope="module")
+def tier(tier_name, request):
+    n_metrics, points = suite.TIERS[tier_name]
+    inputs = suite.prepare(n_metrics, points, request.config.getoption("--seed"))
+    inputs.group = f"{tier_name}: {n_metrics} metrics x {points} points"
+    return inputs
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def stage(benchmark, tier):
+    benchmark.group = tier.group
+    benchmark.extra_info["points"] = tier.n_points
+    return benchmark
+
+
+def test_parse(stage, tier):
+    stage(suite.parse, tier.payload)
+
+
+def test_ingest(stage, tier, loop):
+    stage(lambda: loop.run_until_complete(suite.ingest_dry(tier.request, tier.metric_names)))
+
+
+def test_fetch(stage, tier):
+    stage(suite.fetch_in_process, tier.request)
+
+
+def test_detect(stage, tier):
+    stage(suite.detect, tier.series)
+
+
+def test_score(stage, tier):
+    stage(suite.score, tier.results, tier.events)
+
+
+def test_serialize(stage, tier):
+    stage(suite.serialize, tier.response)
@@ -0,0 +1,41 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# app.db builds its engine at import time and needs a URL for it; nothing in
+# the suite connects to a database
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/sig_test")
+
+# random incidents for the test modules (`from conftest import ...`), all
+# starting at T0
+
+T0 = datetime(2026, 1, 1)
+
+# an events row as crud.load_events returns it
+EventRow = namedtuple("EventRow", "id ts event_type meta")
+
+
+def random_events(rnd, count: int, latest: int, earliest: int = 0, types=("deploy",), meta: bool = False) -> list:
+    """
+    `count` events of any of `types` between `earliest` and `latest` seconds
+    after T0, sorted by ts like crud.load_events; with `meta`, odd ones carry
+    some.
+    """
+    events = [
+        EventRow(k, T0 + timedelta(seconds=rnd.randint(earliest, latest)), rnd.choice(types), {"k": k} if meta and k % 2 else None)
+        for k in range(count)
+    ]
+    events.sort(key=lambda e: e.ts)
+    return events
+
+
+def spiky_series(seed: int, n: int) -> np.ndarray:
+    """Noise with spikes, a level shift and a flat stretch."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(100.0, 5.0, n)
+    values[rng.random(n) < 0.03] += rng.uniform(50, 300)
+    values[n // 2:] += 40.0
+    values[n // 3:n // 3 + 40] = 7.0
+    return values
@@ -0,0 +1,48 @@
+"""Per-metric rule matching (AnalysisConfig) and config validation (analysis_config.build)."""
+import pytest
+
+from app import analysis, analysis_config
+from app.analysis import DEFAULT_METRIC_CONFIG, AnalysisConfig, MetricConfig
+
+
+def test_first_matching_rule_wins():
+    config = AnalysisConfig(
+        [
+            ("*error_rate*", MetricConfig(detector="robust")),
+            ("*error*", MetricConfig(detector="ewma")),
+            ("p9?_latency_ms", MetricConfig(z_threshold=4.0)),
+        ]
+    )
+    assert config.for_metric("http_error_rate").detector == "robust"
+    assert config.for_metric("db_errors").detector == "ewma"
+    assert config.for_metric("p95_latency_ms").z_threshold == 4.0
+    assert config.for_metric("cpu") == DEFAULT_METRIC_CONFIG
+
+
+def test_override_applies_to_every_rule():
+    config = AnalysisConfig([("cpu*", MetricConfig(detector="robust", z_threshold=2.0))])
+    derived = config.override("rolling", "cusum")
+    assert derived.overridden and derived.version != config.version
+    assert derived.for_metric("cpu_user") == MetricConfig(detector="rolling", episode_method="cusum", z_threshold=2.0)
+    assert derived.for_metric("mem").detector == "rolling"
+    assert config.override("rolling", "cusum") is derived
+    assert config.override() is config
+
+
+def test_resolved_names_are_bounded(monkeypatch):
+    monkeypatch.setattr(analysis, "METRIC_CONFIG_CACHE_SIZE", 100)
+    config = AnalysisConfig([("m1*", MetricConfig(detector="robust"))])
+    for i in range(1000):
+        config.for_metric(f"m{i}")
+    assert config._resolved.cache_info().currsize == 100
+    assert config.for_metric("m1").detector == "robust"
+
+
+def test_build_rejects_bad_rules():
+    config, rules, settings = analysis_config.build([("*", {"detector": "robust"})], {"cause_window_seconds": 300})
+    assert config.for_metric("x").detector == "robust" and config.scoring.cause_window_seconds == 300
+    assert rules == [("*", {"detector": "robust"})] and settings == {"cause_window_seconds": 300}
+
+    for params in ({"detector": "nope"}, {"baseline_min_points": 40}, {"min_points": 5}, {"unknown": 1}):
+        with pytest.raises(ValueError):
+            analysis_config.build([("*", params)], {})
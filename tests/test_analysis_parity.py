@@ -0,0 +1,216 @@
+"""
+The vectorized pipeline (group_series + run_analysis) against the original
+per-point implementation of GET /analysis, kept below as the reference: the
+responses have to be identical, floats included.
+"""
+import math
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+import pytest
+
+from app.analysis import group_series, run_analysis
+from app.schemas import AnalysisResponse, AnomalyOut, CauseOut, EpisodeOut
+from conftest import T0, EventRow, random_events
+
+EVENT_TYPES = ["deploy", "config_change", "feature_flag", "db_migration", "incident_note", "other"]
+
+
+def reference_analysis(incident_id: str, rows, events) -> AnalysisResponse:
+    """The baseline analyze_incident, minus the database: rows are (metric_name, ts, value) ordered by both."""
+    by_metric = defaultdict(list)
+    for metric_name, ts, value in rows:
+        by_metric[metric_name].append((ts, value))
+
+    point_anoms = []
+    z_threshold = 3.0
+    for metric_name, pts in by_metric.items():
+        if len(pts) < 12:
+            continue
+
+        baseline_n = min(30, max(10, len(pts) // 4))
+        baseline = pts[:baseline_n]
+
+        mean = sum(v for _, v in baseline) / len(baseline)
+        var = sum((v - mean) ** 2 for _, v in baseline) / len(baseline)
+        std = math.sqrt(var)
+        if std < 1e-9:
+            continue
+
+        for ts, value in pts[baseline_n:]:
+            z = (value - mean) / std
+            if abs(z) >= z_threshold:
+                point_anoms.append(
+                    AnomalyOut(
+                        metric_name=metric_name, ts=ts, value=value,
+                        baseline_mean=mean, baseline_std=std, z_score=z,
+                    )
+                )
+    point_anoms.sort(key=lambda a: a.ts)
+
+    episode_gap = timedelta(minutes=2)
+    episodes = []
+    by_metric_anoms = defaultdict(list)
+    for a in point_anoms:
+        by_metric_anoms[a.metric_name].append(a)
+
+    def open_episode(metric_name, a):
+        return {
+            "metric": metric_name,
+            "start": a.ts,
+            "end": a.ts,
+            "max_abs_z": abs(a.z_score),
+            "baseline_mean": a.baseline_mean,
+            "baseline_std": a.baseline_std,
+            "max_value": a.value,
+        }
+
+    for metric_name, anoms in by_metric_anoms.items():
+        current = None
+        for a in anoms:
+            if current is None:
+                current = open_episode(metric_name, a)
+            elif a.ts - current["end"] <= episode_gap:
+                current["end"] = a.ts
+                current["max_abs_z"] = max(current["max_abs_z"], abs(a.z_score))
+                current["max_value"] = max(current["max_value"], a.value)
+            else:
+                episodes.append(current)
+                current = open_episode(metric_name, a)
+        if current is not None:
+            episodes.append(current)
+    episodes.sort(key=lambda e: e["start"])
+
+    episodes_out = []
+    for ep in episodes:
+        pct = 0.0
+        if ep["baseline_mean"] and abs(ep["baseline_mean"]) > 1e-9:
+            pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
+        episodes_out.append(
+            EpisodeOut(
+                metric_name=ep["metric"],
+                start_ts=ep["start"],
+                end_ts=ep["end"],
+                baseline_mean=ep["baseline_mean"],
+                baseline_std=ep["baseline_std"],
+                peak_value=ep["max_value"],
+                peak_z_score=ep["max_abs_z"],
+                percent_change=round(pct, 2),
+            )
+        )
+
+    agreement_bonus = defaultdict(float)
+    for i, e1 in enumerate(episodes):
+        for j, e2 in enumerate(episodes):
+            if i < j and not (e1["end"] < e2["start"] or e2["end"] < e1["start"]):
+                agreement_bonus[i] += 0.35
+                agreement_bonus[j] += 0.35
+
+    event_prior = {
+        "deploy": 1.00,
+        "config_change": 0.85,
+        "feature_flag": 0.75,
+        "db_migration": 0.80,
+        "incident_note": 0.50,
+    }
+    window = timedelta(minutes=10)
+
+    cause = {}
+    for idx, ep in enumerate(episodes):
+        severity = min(10.0, ep["max_abs_z"]) / 10.0
+        sev_weight = 0.55 + 0.45 * severity
+        agree_weight = 1.0 + min(0.6, agreement_bonus.get(idx, 0.0))
+
+        for ev in events:
+            dt = abs(ep["start"] - ev.ts)
+            if dt <= window:
+                proximity = max(0.0, 1.0 - (dt.total_seconds() / window.total_seconds()))
+                prior = event_prior.get(ev.event_type, 0.6)
+                contrib = proximity * prior * sev_weight * agree_weight
+                if ev.id not in cause:
+                    cause[ev.id] = {"score": 0.0, "evidence": [], "event": ev}
+                cause[ev.id]["score"] += contrib
+
+                pct = 0.0
+                if ep["baseline_mean"] > 1e-9:
+                    pct = (ep["max_value"] - ep["baseline_mean"]) / ep["baseline_mean"] * 100.0
+                cause[ev.id]["evidence"].append(
+                    f"{ep['metric']} abnormal {ep['start'].isoformat()}–{ep['end'].isoformat()}: "
+                    f"{ep['baseline_mean']:.2f} → {ep['max_value']:.2f} ({pct:+.1f}%), "
+                    f"z≈{ep['max_abs_z']:.2f}, event within {int(dt.total_seconds())}s"
+                )
+
+    causes = []
+    if cause:
+        max_score = max(v["score"] for v in cause.values()) or 1.0
+        for v in cause.values():
+            ev = v["event"]
+            causes.append(
+                CauseOut(
+                    event_type=ev.event_type,
+                    ts=ev.ts,
+                    meta=ev.meta,
+                    confidence=round(v["score"] / max_score, 3),
+                    evidence=v["evidence"][:6],
+                )
+            )
+        causes.sort(key=lambda c: c.confidence, reverse=True)
+
+    return AnalysisResponse(
+        incident_id=incident_id,
+        anomalies=point_anoms,
+        episodes=episodes_out,
+        likely_causes=causes[:5],
+    )
+
+
+def random_incident(seed: int):
+    """
+    (rows, events) of a random incident: metrics of any length (short ones
+    under 12 points included), flat ones, ones sampled on the same timestamps
+    (ties across metrics), ones with repeated timestamps, and events both
+    inside and well outside the cause window of any episode.
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for m in range(rnd.randint(1, 25)):
+        name = f"m{m:02d}"
+        n = rnd.choice([rnd.randint(1, 11), rnd.randint(12, 60), rnd.randint(60, 400)])
+        step = rnd.choice([15, 15, 30, 60, 240])
+        kind = rnd.random()
+        level = rnd.choice([0.0, 1.0, 100.0, -50.0])
+        ts = T0
+        for i in range(n):
+            if kind < 0.1:
+                value = level  # flat: never scored
+            else:
+                value = rnd.gauss(level, rnd.choice([0.5, 5.0]))
+                if rnd.random() < 0.05:
+                    value += rnd.uniform(-100, 300)
+                if n // 2 < i < n // 2 + 15 and m % 3 == 0:
+                    value += rnd.uniform(50, 300)
+            rows.append((name, ts, value))
+            if not (kind > 0.9 and rnd.random() < 0.3):  # repeated ts
+                ts += timedelta(seconds=step)
+    rows.sort(key=lambda r: (r[0], r[1]))
+
+    return rows, random_events(rnd, rnd.randint(0, 40), 4 * 3600, -3600, EVENT_TYPES, meta=True)
+
+
+@pytest.mark.parametrize("seed", range(400))
+def test_matches_reference(seed):
+    rows, events = random_incident(seed)
+    expected = reference_analysis("inc", rows, events)
+    got = run_analysis("inc", group_series(rows), events)
+    assert got.model_dump_json(exclude_unset=True) == expected.model_dump_json(exclude_unset=True)
+
+
+def test_short_and_flat_metrics_are_skipped():
+    rows = [("flat", T0 + timedelta(seconds=15 * i), 5.0) for i in range(100)]
+    rows += [("short", T0 + timedelta(seconds=15 * i), float(i % 2) * 1e6) for i in range(11)]
+    events = [EventRow(1, T0 + timedelta(minutes=5), "deploy", None)]
+    expected = reference_analysis("inc", rows, events)
+    got = run_analysis("inc", group_series(rows), events)
+    assert got.anomalies == [] and got.episodes == [] and got.likely_causes == []
+    assert got.model_dump_json(exclude_unset=True) == expected.model_dump_json(exclude_unset=True)
@@ -0,0 +1,89 @@
+"""Change-point segmentation (app/changepoint.py) against naive per-point versions."""
+import numpy as np
+import pytest
+
+from app.changepoint import BINSEG_PENALTY, CUSUM_H, CUSUM_K, MIN_SEGMENT_POINTS, _cusum_path, binseg, cusum
+
+
+def series(seed: int, n: int) -> np.ndarray:
+    """Noise around a few level shifts, up and down, of random length."""
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0.0, 1.0, n)
+    for _ in range(rng.integers(0, 5)):
+        a = int(rng.integers(0, max(1, n)))
+        values[a:a + int(rng.integers(5, 200))] += rng.choice([-1, 1]) * rng.uniform(1.5, 6.0)
+    return values
+
+
+def naive_cusum_path(u: np.ndarray) -> np.ndarray:
+    out, s = np.empty(len(u)), 0.0
+    for i, x in enumerate(u.tolist()):
+        s = max(0.0, s + x)
+        out[i] = s
+    return out
+
+
+def naive_cusum(values: np.ndarray, reference: float, sigma: float, start: int) -> list[tuple[int, int]]:
+    """Both one-sided CUSUMs point by point; an excursion counts once its peak crosses CUSUM_H."""
+    segments = []
+    for sign in (1.0, -1.0):
+        s, first, peak, peak_s = 0.0, None, None, 0.0
+        for i in range(start, len(values)):
+            s = max(0.0, s + sign * (values[i] - reference) / sigma - CUSUM_K)
+            if s > 0:
+                if first is None:
+                    first, peak, peak_s = i, i, s
+                elif s > peak_s:
+                    peak, peak_s = i, s
+            elif first is not None:
+                if peak_s > CUSUM_H:
+                    segments.append((first, peak))
+                first = None
+        if first is not None and peak_s > CUSUM_H:
+            segments.append((first, peak))
+    return sorted(segments)
+
+
+def naive_binseg(values: np.ndarray, sigma: float) -> list[int]:
+    """Binary segmentation with each candidate split's squared error summed directly."""
+    n = len(values)
+    penalty = BINSEG_PENALTY * sigma * sigma * np.log(max(n, 2))
+
+    def sse(a, b):
+        segment = values[a:b]
+        return float(((segment - segment.mean()) ** 2).sum())
+
+    splits, pending = [], [(0, n)]
+    while pending:
+        a, b = pending.pop()
+        if b - a < 2 * MIN_SEGMENT_POINTS:
+            continue
+        whole = sse(a, b)
+        gains = [(whole - sse(a, t) - sse(t, b), t) for t in range(a + MIN_SEGMENT_POINTS, b - MIN_SEGMENT_POINTS + 1)]
+        gain, split = max(gains, key=lambda g: g[0])
+        if gain <= penalty:
+            continue
+        splits.append(split)
+        pending.extend(((a, split), (split, b)))
+    return sorted(splits)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_cusum_closed_form_matches_recursion(seed):
+    u = np.random.default_rng(seed).normal(-0.3, 2.0, 3000)
+    np.testing.assert_allclose(_cusum_path(u), naive_cusum_path(u), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("start", [0, 30])
+@pytest.mark.parametrize("n", [0, 1, 50, 400, 3000])
+@pytest.mark.parametrize("seed", range(5))
+def test_cusum_matches_naive(seed, n, start):
+    values = series(seed, n)
+    assert cusum(values, 0.0, 1.0, start) == naive_cusum(values, 0.0, 1.0, start)
+
+
+@pytest.mark.parametrize("n", [1, 9, 10, 60, 500])
+@pytest.mark.parametrize("seed", range(5))
+def test_binseg_matches_naive(seed, n):
+    values = series(seed, n)
+    assert binseg(values, 1.0) == naive_binseg(values, 1.0)
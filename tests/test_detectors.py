@@ -0,0 +1,130 @@
+"""
+The vectorized detector scans against naive per-point loops, and scans of a
+series in pieces (with `carry`) against one scan of the whole series.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from app.analysis import (
+    MAD_SCALE,
+    MEAN_AD_SCALE,
+    MetricConfig,
+    _ewma_scan,
+    _rolling_median_scan,
+    _rolling_scan,
+    robust_stats,
+)
+from conftest import spiky_series
+
+CONFIGS = [
+    MetricConfig(),
+    MetricConfig(baseline_min_points=3, baseline_max_points=5),
+    MetricConfig(baseline_min_points=20, baseline_max_points=200),
+]
+
+
+def naive_ewma(values: np.ndarray, config: MetricConfig):
+    alpha = 2.0 / (config.baseline_max_points + 1)
+    keep = 1.0 - alpha
+    n, seed_n = len(values), config.baseline_min_points
+    expected, spread = np.full(n, np.nan), np.full(n, np.nan)
+    if n < seed_n:
+        return expected, spread
+    mean, var = float(values[:seed_n].mean()), float(values[:seed_n].var())
+    for i in range(seed_n, n):
+        expected[i], spread[i] = mean, math.sqrt(var)
+        d = values[i] - mean
+        mean = keep * mean + alpha * values[i]
+        var = keep * var + keep * alpha * d * d
+    return expected, spread
+
+
+def naive_window(values: np.ndarray, config: MetricConfig, stats):
+    n = len(values)
+    expected, spread = np.full(n, np.nan), np.full(n, np.nan)
+    for i in range(n):
+        window = values[max(0, i - config.baseline_max_points):i]
+        if len(window) >= config.baseline_min_points:
+            expected[i], spread[i] = stats(window)
+    return expected, spread
+
+
+def mean_std(window: np.ndarray):
+    return window.mean(), window.std()
+
+
+def median_robust_std(window: np.ndarray):
+    median = np.median(window)
+    deviation = np.abs(window - median)
+    scale = MAD_SCALE * np.median(deviation)
+    if scale < 1e-9:
+        scale = MEAN_AD_SCALE * deviation.mean()
+    return median, scale
+
+
+def in_pieces(scan, values: np.ndarray, config: MetricConfig, cuts):
+    """scan() over values[a:b] for consecutive pieces, carrying state from each to the next."""
+    expected, spread, carry = [], [], None
+    for a, b in zip([0] + cuts, cuts + [len(values)]):
+        e, s, carry = scan(values[a:b], carry, config)
+        expected.append(e)
+        spread.append(s)
+    return np.concatenate(expected), np.concatenate(spread)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("n", [0, 1, 4, 25, 300, 2000])
+def test_ewma_matches_naive_loop(n, config):
+    values = spiky_series(n, n)
+    expected, spread, _ = _ewma_scan(values, None, config)
+    naive_expected, naive_spread = naive_ewma(values, config)
+    np.testing.assert_allclose(expected, naive_expected, rtol=1e-9)
+    np.testing.assert_allclose(spread, naive_spread, rtol=1e-7, atol=1e-9)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("n", [0, 1, 4, 25, 300, 1000])
+def test_rolling_matches_naive_loop(n, config):
+    values = spiky_series(n, n)
+    expected, spread, _ = _rolling_scan(values, None, config)
+    naive_expected, naive_spread = naive_window(values, config, mean_std)
+    np.testing.assert_allclose(expected, naive_expected, rtol=1e-12)
+    np.testing.assert_allclose(spread, naive_spread, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("n", [0, 1, 4, 25, 300, 1000])
+def test_rolling_median_matches_naive_loop(n, config):
+    values = spiky_series(n, n)
+    expected, spread, _ = _rolling_median_scan(values, None, config)
+    naive_expected, naive_spread = naive_window(values, config, median_robust_std)
+    np.testing.assert_array_equal(expected, naive_expected)
+    np.testing.assert_allclose(spread, naive_spread, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("width", [1, 2, 9, 10, 30, 31])
+@pytest.mark.parametrize("seed", range(5))
+def test_robust_stats_matches_per_row_median(seed, width):
+    rng = np.random.default_rng(seed)
+    rows = rng.normal(100.0, 5.0, (50, width))
+    rows[::4, : width // 2 + 1] = 3.0  # mostly-equal rows: MAD is 0
+    rows[1::7] = 8.0                   # constant rows: flat either way
+    median, scale = robust_stats(rows)
+    naive = np.array([median_robust_std(row) for row in rows])
+    np.testing.assert_array_equal(median, naive[:, 0])
+    np.testing.assert_allclose(scale, naive[:, 1], rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("scan", [_ewma_scan, _rolling_scan, _rolling_median_scan])
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("seed", range(5))
+def test_scan_in_pieces_is_bit_identical(seed, config, scan):
+    rng = np.random.default_rng(seed)
+    values = spiky_series(seed, 1500)
+    cuts = sorted(rng.choice(np.arange(1, len(values)), size=int(rng.integers(1, 30)), replace=False).tolist())
+    whole_expected, whole_spread, _ = scan(values, None, config)
+    expected, spread = in_pieces(scan, values, config, cuts)
+    np.testing.assert_array_equal(expected, whole_expected)
+    np.testing.assert_array_equal(spread, whole_spread)
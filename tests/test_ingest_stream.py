@@ -0,0 +1,30 @@
+"""POST /ingest/stream rejects bodies without an incident header before touching the database."""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+# no `with`: startup (which connects to the database) doesn't run
+client = TestClient(app)
+
+METRIC = {"ts": "2026-02-05T14:30:00Z", "metric_name": "p95_latency_ms", "value": 1250.5}
+EVENT = {"ts": "2026-02-05T14:28:00Z", "event_type": "deploy", "meta": {"version": "v2.3.1"}}
+
+
+def ndjson(*records) -> bytes:
+    return b"".join(json.dumps(r).encode() + b"\n" for r in records)
+
+
+@pytest.mark.parametrize("first", [METRIC, EVENT])
+def test_missing_header_is_rejected(first):
+    response = client.post("/ingest/stream", content=ndjson(first, METRIC))
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("line 1: expected the incident header")
+
+
+def test_empty_body_is_rejected():
+    response = client.post("/ingest/stream", content=b"\n\n")
+    assert response.status_code == 422
+    assert "incident header" in response.json()["detail"]
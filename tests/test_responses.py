@@ -0,0 +1,54 @@
+"""render_json against the bytes FastAPI's JSONResponse (json.dumps) sends for the same model."""
+import pytest
+from starlette.responses import JSONResponse
+
+from app.responses import render_json
+from app.schemas import AnalysisResponse, AnomalyOut, CauseOut, EpisodeOut, StageTimingOut, TimingsOut
+from conftest import T0
+
+
+def json_dumps_body(model) -> bytes:
+    return JSONResponse(model.model_dump(mode="json", exclude_unset=True)).body
+
+
+def anomaly(value: float) -> AnomalyOut:
+    return AnomalyOut(metric_name="m", ts=T0, value=value, baseline_mean=value / 3, baseline_std=abs(value) / 7, z_score=-value)
+
+
+@pytest.mark.parametrize("value", [
+    0, 1, -7, 2**53, 10**17,                                     # ints
+    1.5, -0.0, 0.0, 123.456, 0.1 + 0.2,
+    1e16, 1.2345e16, -3e21, 1e300, 9999999999999998.0,          # large exponents
+    1e-4, 5e-5, -5e-5, 1.5e-7, 1e-300, 5e-324, 0.00012,          # small exponents
+])
+def test_floats_spelled_like_json_dumps(value):
+    model = AnalysisResponse(incident_id="inc", anomalies=[anomaly(float(value))], episodes=[], likely_causes=[])
+    assert render_json(model) == json_dumps_body(model)
+
+
+def test_nested_models_and_unset_fields():
+    model = AnalysisResponse(
+        incident_id="inc",
+        anomalies=[anomaly(v) for v in (1.0, 2e-6, 3e17)],
+        episodes=[EpisodeOut(
+            metric_name="m", start_ts=T0, end_ts=T0, baseline_mean=1e-5, baseline_std=0.0,
+            peak_value=4e20, peak_z_score=-0.0, percent_change=-12.5, level_shift=7e-8,
+        )],
+        likely_causes=[CauseOut(
+            event_type="deploy", ts=T0, confidence=0.5,
+            meta={"ints": [1, 2, 3], "floats": {"tiny": 1e-9, "huge": 1e18}, "label": "1e-5 in a string"},
+            evidence=["z≈4.20, 0.00001 in text"],
+        )],
+        timings=TimingsOut(source="computed", total_ms=0.00003, stages=[StageTimingOut(stage="detect", wall_ms=1e-5)]),
+    )
+    assert render_json(model) == json_dumps_body(model)
+
+
+def test_escaped_strings_fall_back_to_json_dumps():
+    model = AnalysisResponse(
+        incident_id='quote " and \\ backslash',
+        anomalies=[],
+        episodes=[],
+        likely_causes=[CauseOut(event_type="deploy", ts=T0, confidence=1.0, meta={"x": 1e-7, "s": 'a"b'})],
+    )
+    assert render_json(model) == json_dumps_body(model)